@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from sharpe.core.context import Context
+from sharpe.const import DEFAULT_ACCOUNT_TYPE
+from sharpe.mod.sys_account.api.api import target_weights_to_order_quantities
+from sharpe.mod.sys_simulation.matcher import fit_batch_to_cash
+from sharpe.mod.sys_transaction_cost.deciders import CNStockTransactionCostDecider
+
+
+class VectorizedBacktest(object):
+    """
+    the non-rl TradingEnv run of a target weights strategy without the event loop: the holdings, the cash and the
+    net value of all the available order_book_ids are arrays updated once per trading_dt, a rebalance is the same
+    round lot orders as order_target_weights_array filled at the close with the CNStockTransactionCostDecider costs
+    """
+
+    def __init__(self, data_source, weights_df,
+                 starting_cash={"STOCK":1000000},
+                 commission_multiplier=1,
+                 min_commission=5,
+                 tax_multiplier=1,
+                 start_dt=None,
+                 end_dt=None) -> None:
+        """
+        :param weights_df: the target weights, indexed by trading_dt with a column per order_book_id, the missing
+                           order_book_ids or NaN weights are closed, the positions are held on the trading_dts
+                           without a row
+        :param start_dt: the first trading_dt(the latest available one not after start_dt), the first available
+                         trading_dt if None
+        :param end_dt: the last trading_dt, the last available trading_dt if None
+        """
+        self.starting_cash = starting_cash
+        # an internal context without portfolio, it must not become the current one of the order api
+        self._context = Context(look_backward_window=1, activate=False)
+        self._context.set_data_source(data_source)
+        self._transaction_cost_decider = CNStockTransactionCostDecider(commission_multiplier=commission_multiplier, min_commission=min_commission,
+                                                                       tax_multiplier=tax_multiplier, context=self._context)
+        self._context.set_transaction_cost_decider("CS", self._transaction_cost_decider)
+
+        self.order_book_ids = data_source.get_available_order_book_ids()
+        self.trading_dts = data_source.get_available_trading_dts()
+        self._start_bar_ordinal = 0 if start_dt is None else data_source.get_trading_dt_ordinal(pd.Timestamp(start_dt))
+        self._end_bar_ordinal = len(self.trading_dts) - 1 if end_dt is None else data_source.get_trading_dt_ordinal(pd.Timestamp(end_dt))
+        if not 0 <= self._start_bar_ordinal <= self._end_bar_ordinal:
+            raise ValueError("no trading_dt between start_dt {} and end_dt {}".format(start_dt, end_dt))
+
+        weights_df = weights_df.reindex(columns=self.order_book_ids).fillna(0.)
+        self._rebalance_ordinals = [data_source.get_trading_dt_ordinal(pd.Timestamp(dt)) for dt in weights_df.index]
+        self._weights = weights_df.to_numpy(dtype=np.float64)
+
+        self.positions = None
+
+    def run(self) -> pd.DataFrame:
+        """
+        the portfolio of every trading_dt: cash, market_value, total_value, unit_net_value, returns(the bar returns
+        of the tracker), commission and tax, the quantities held are kept in positions
+        """
+        data_source = self._context.data_source
+        n_bars = self._end_bar_ordinal - self._start_bar_ordinal + 1
+        rebalances = {ordinal: weights for ordinal, weights in zip(self._rebalance_ordinals, self._weights)
+                      if self._start_bar_ordinal <= ordinal <= self._end_bar_ordinal}
+
+        quantities = np.zeros(len(self.order_book_ids), dtype=np.int64)
+        last_prices = np.full(len(self.order_book_ids), np.nan)
+        cash = float(self.starting_cash[DEFAULT_ACCOUNT_TYPE.STOCK.name])
+        units = cash
+        static_unit_net_value = 1.
+
+        positions = np.zeros((n_bars, len(self.order_book_ids)), dtype=np.int64)
+        columns = {name: np.zeros(n_bars) for name in ("cash", "market_value", "total_value", "unit_net_value", "returns", "commission", "tax")}
+        for i, bar_ordinal in enumerate(range(self._start_bar_ordinal, self._end_bar_ordinal + 1)):
+            prices = data_source.get_last_prices_at(bar_ordinal)
+            held_ordinals = np.flatnonzero(quantities)
+            if bar_ordinal in rebalances:
+                account_value = cash + np.dot(prices[held_ordinals], quantities[held_ordinals])
+                ordinals, order_quantities = target_weights_to_order_quantities(rebalances[bar_ordinal], account_value, prices,
+                                                                                quantities, held_ordinals)
+                fill_prices = prices[ordinals]
+                # NaN compares False, the orders without a valid price are dropped
+                is_valid = fill_prices > 0
+                ordinals, order_quantities, fill_prices = ordinals[is_valid], order_quantities[is_valid], fill_prices[is_valid]
+                if len(ordinals) > 0:
+                    order_book_ids = self.order_book_ids[ordinals]
+                    commissions, taxes = self._context.get_batch_transaction_cost(order_book_ids, fill_prices, order_quantities)
+                    # the buys the cash can not pay are scaled down like in DefaultMatcher.match_batch
+                    if (cash - np.cumsum(fill_prices * order_quantities + commissions + taxes) < 0).any():
+                        order_quantities, commissions, taxes = fit_batch_to_cash(self._context, cash, order_book_ids, fill_prices,
+                                                                                 order_quantities, commissions, taxes)
+                    np.add.at(quantities, ordinals, order_quantities)
+                    cash -= np.dot(fill_prices, order_quantities) + commissions.sum() + taxes.sum()
+                    columns["commission"][i] = commissions.sum()
+                    columns["tax"][i] = taxes.sum()
+
+            # the positions are valued at the latest valid price
+            is_valid = prices == prices
+            last_prices[is_valid] = prices[is_valid]
+            held_ordinals = np.flatnonzero(quantities)
+            market_value = np.dot(last_prices[held_ordinals], quantities[held_ordinals])
+            unit_net_value = (cash + market_value) / units
+
+            positions[i] = quantities
+            columns["cash"][i] = cash
+            columns["market_value"][i] = market_value
+            columns["total_value"][i] = cash + market_value
+            columns["unit_net_value"][i] = unit_net_value
+            columns["returns"][i] = unit_net_value / static_unit_net_value - 1
+            if not np.isnan(unit_net_value):
+                static_unit_net_value = unit_net_value
+
+        index = self.trading_dts[self._start_bar_ordinal: self._end_bar_ordinal + 1]
+        self.positions = pd.DataFrame(positions, index=index, columns=self.order_book_ids)
+        return pd.DataFrame(columns, index=index)
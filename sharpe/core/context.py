@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from contextvars import ContextVar
+from typing import List
+import numpy as np
 from sharpe.core.events import EventBus
 
+# the context used by the order api when it is not passed explicitly,
+# one per thread/asyncio task rather than one per process
+_current_context = ContextVar("sharpe_current_context", default=None)
+
 class Context(object):
-    """serve as a global variable, prodiving context to different module"""
+    """
+    prodiving context to different module, every TradingEnv owns one and threads it through its components,
+    so that several environments can live in one process
+    """
     
-    _instance = None
     #def __new__(cls, *args, **kwars):
     #    """make the Context class be a Singleton Pattern, that it says can be instanced only once"""
     #    if cls._instance is None:
@@ -14,8 +23,11 @@ class Context(object):
     #    return cls._instance
     
         
-    def __init__(self, look_backward_window=2):
-        Context._instance = self
+    def __init__(self, look_backward_window=2, activate=True):
+        """
+        :param activate: make the new context the current one, False for a context only used through explicit references
+        """
+        self._token = None
         self.data_source = None
         self.broker = None
         self.event_bus = EventBus()
@@ -26,17 +38,38 @@ class Context(object):
         self.look_backward_window = look_backward_window
         self.calendar_dt = None  
         self.trading_dt = None  
+        # the position of trading_dt in data_source.get_available_trading_dts(), the executors move it by one per bar
+        self.bar_ordinal = None
+        # the bar_ordinals of the first and the last trading_dt of the current episode
+        self.start_bar_ordinal = None
+        self.end_bar_ordinal = None
         self.frequency = None
         self.mode = None
+        # the latest created context is the current one until another is activated
+        if activate:
+            self.activate()
 
     @classmethod
     def get_instance(cls):
         """
-        return the created instance of Context
+        return the current(latest activated) instance of Context
         """
-        if Context._instance is None:
+        context = _current_context.get()
+        if context is None:
             raise RuntimeError(("Context has not been created. Please Use `Context.get_instance()` after sharpe init"))
-        return Context._instance
+        return context
+    
+    def activate(self):
+        """make this context the current one of `Context.get_instance()`"""
+        _current_context.set(self)
+    
+    def __enter__(self):
+        self._token = _current_context.set(self)
+        return self
+    
+    def __exit__(self, *exc_info):
+        _current_context.reset(self._token)
+        self._token = None
     
     def set_mode(self, mode):
         self.mode = mode
@@ -57,28 +90,51 @@ class Context(object):
         self.tracker = tracker
     
     def get_last_price(self, order_book_id:str) -> float:
-        return self.data_source.get_last_price(order_book_id = order_book_id, dt = self.trading_dt)
+        return self.data_source.get_last_price_at(order_book_id, self.bar_ordinal)
+    
+    def get_last_prices(self, order_book_ids:List[str]=None) -> np.ndarray:
+        return self.data_source.get_last_prices_at(self.bar_ordinal, order_book_ids)
+    
+    def get_previous_close(self, order_book_id:str) -> float:
+        return self.data_source.get_previous_close_at(order_book_id, self.bar_ordinal)
     
     
     def history_bars(self):
         return self.data_source.history_bars(dt=self.trading_dt, bar_count=self.look_backward_window)
     
-    def update_time(self, calendar_dt:datetime, trading_dt:datetime) -> None:
+    def history_bars_window(self) -> np.ndarray:
+        return self.data_source.history_bars_window_at(self.bar_ordinal, self.look_backward_window)
+    
+    def update_time(self, calendar_dt:datetime, trading_dt:datetime, bar_ordinal:int=None) -> None:
+        """
+        :param bar_ordinal: the position of trading_dt in data_source.get_available_trading_dts(), looked up if None
+        """
         self.calendar_dt = calendar_dt
         self.trading_dt = trading_dt
+        if bar_ordinal is None:
+            bar_ordinal = self.data_source.get_trading_dt_ordinal(trading_dt)
+        self.bar_ordinal = bar_ordinal
         
     def get_available_trading_dts(self):
         raw_available_trading_dts = self.data_source.get_available_trading_dts()
         self.available_trading_dts =  raw_available_trading_dts[self.look_backward_window-1:]
         return self.available_trading_dts
     
+    @property
+    def first_bar_ordinal(self) -> int:
+        """the bar_ordinal of available_trading_dts[0], the first trading_dt with a whole look_backward_window"""
+        return self.look_backward_window - 1
+    
+    @property
+    def last_bar_ordinal(self) -> int:
+        return len(self.data_source.get_available_trading_dts()) - 1
+    
     @property
     def available_order_book_ids(self):
         return self.data_source.get_available_order_book_ids()
     
     def get_next_trading_dt(self):
-        current_idx = self.available_trading_dts.searchsorted(self.trading_dt, side="left")
-        return self.available_trading_dts[current_idx+1]
+        return self.data_source.get_available_trading_dts()[self.bar_ordinal+1]
     
     def get_account(self, order_book_id):
         return self.portfolio.get_account(order_book_id)
@@ -86,6 +142,9 @@ class Context(object):
     def set_transaction_cost_decider(self, instrument_type, decider):
         self._transaction_cost_decider_dict[instrument_type] = decider
 
+    def get_transaction_cost_deciders(self):
+        return list(self._transaction_cost_decider_dict.values())
+
     def _get_transaction_cost_decider(self, order_book_id):
         instrument_type = self.data_source.instrument_type(order_book_id)
         try:
@@ -102,6 +161,24 @@ class Context(object):
     
     def get_order_transaction_cost(self, order):
         return self._get_transaction_cost_decider(order.order_book_id).get_order_transaction_cost(order)
+    
+    def get_batch_transaction_cost(self, order_book_ids, prices, quantities):
+        """the (commissions, taxes) of a batch of fills, each priced by the decider of the instrument type of its order_book_id"""
+        instrument_types = [self.data_source.instrument_type(order_book_id) for order_book_id in order_book_ids]
+        first_type = instrument_types[0]
+        if all(instrument_type == first_type for instrument_type in instrument_types):
+            decider = self._get_transaction_cost_decider(order_book_ids[0])
+            return decider.get_batch_commissions(prices, quantities), decider.get_batch_taxes(prices, quantities)
+        
+        instrument_types = np.array(instrument_types, dtype=object)
+        commissions, taxes = np.empty(len(prices)), np.empty(len(prices))
+        for instrument_type in set(instrument_types.tolist()):
+            is_type = instrument_types == instrument_type
+            decider = self._get_transaction_cost_decider(order_book_ids[int(np.flatnonzero(is_type)[0])])
+            commissions[is_type] = decider.get_batch_commissions(prices[is_type], quantities[is_type])
+            taxes[is_type] = decider.get_batch_taxes(prices[is_type], quantities[is_type])
+        return commissions, taxes
+
 if __name__ == "__main__":
     from sharpe.utils.mock_data import create_toy_feature
     from sharpe.data.data_source import DataSource
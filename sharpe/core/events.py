@@ -13,25 +13,68 @@ class Event(object):
         return ' '.join('{}:{}'.format(k, v) for k, v in self.__dict__.items())
 
 
+class BarEvent(object):
+    """slotted event of the per bar phases, preallocated once and rewritten for every bar by the event source"""
+    __slots__ = ("event_type", "calendar_dt", "trading_dt", "action")
+
+    def __init__(self, event_type, calendar_dt=None, trading_dt=None):
+        self.event_type = event_type
+        self.calendar_dt = calendar_dt
+        self.trading_dt = trading_dt
+        self.action = None
+
+    def __repr__(self):
+        return ' '.join('{}:{}'.format(k, getattr(self, k)) for k in self.__slots__)
+
+
 class EventBus(object):
     def __init__(self):
         self._listeners = defaultdict(list)
         self._user_listeners = defaultdict(list)
+        # listeners compiled into a dense list indexed by EVENT.ordinal, None until compile
+        self._dispatch = None
+        # bumped by every new listener, lets the executors detect a change of the listeners
+        self.version = 0
 
     def add_listener(self, event_type, listener, user=False):
         (self._user_listeners if user else self._listeners)[event_type].append(listener)
+        self._dispatch = None
+        self.version += 1
 
     def prepend_listener(self, event_type, listener, user=False):
         (self._user_listeners if user else self._listeners)[event_type].insert(0, listener)
+        self._dispatch = None
+        self.version += 1
+
+    def compile(self):
+        """
+        freeze the listeners of every event type into a (listeners, user_listeners) pair of tuples, None for the
+        event types without listener, adding a listener afterwards invalidates it and the next publish recompiles
+        """
+        dispatch = [None] * len(EVENT)
+        for event_type in EVENT:
+            listeners = tuple(self._listeners.get(event_type, ()))
+            user_listeners = tuple(self._user_listeners.get(event_type, ()))
+            if listeners or user_listeners:
+                dispatch[event_type.ordinal] = (listeners, user_listeners)
+        self._dispatch = dispatch
+        return dispatch
 
     def publish_event(self, event):
-       
-        for listener in self._listeners[event.event_type]:
+        dispatch = self._dispatch
+        if dispatch is None:
+            dispatch = self.compile()
+        compiled = dispatch[event.event_type.ordinal]
+        if compiled is None:
+            return
+        listeners, user_listeners = compiled
+        
+        for listener in listeners:
             # if return True, then break, would not continue this event
             if listener(event):
                 break
 
-        for listener in self._user_listeners[event.event_type]:
+        for listener in user_listeners:
             listener(event)
 
 
@@ -80,6 +123,14 @@ class EVENT(Enum):
 
     # trade(accout, trade, order)
     TRADE = 'trade'
+    # fill_batch(account, fill_batch)
+    FILL_BATCH = 'fill_batch'
+
+
+# the dense position of every event type, the index of the compiled dispatch of EventBus
+for ordinal, event_type in enumerate(EVENT):
+    event_type.ordinal = ordinal
+del ordinal, event_type
 
 
 def parse_event(event_str):
@@ -1,9 +1,60 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from copy import copy
+import numpy as np
 from sharpe.core.events import Event, EVENT
 import pdb
 
+# flat info record, filled in place every step instead of building a dict
+INFO_DTYPE = np.dtype([
+    ("returns_mean", np.float64),
+    ("unit_sharpe_ratio", np.float64),
+    ("draw_down", np.float64),
+    ("max_draw_down", np.float64),
+    ("profit_and_loss", np.float64),
+])
+
+
+def build_fused_plan(event_bus, events, owners, hooks=None, excluded=()):
+    """
+    flatten the listeners of the events of one bar into the (listener, event, n_skip) calls the bus would make, in
+    the same order, None if a listener is not a bound method of one of the owners(the standard modules), n_skip is
+    the number of the following calls skipped when the listener returns True, the remaining system listeners of
+    the event like EventBus.publish_event
+    :param hooks: {event_type: callable} called with the event before its listeners
+    :param excluded: owners among owners whose listeners are left out of the plan
+    """
+    dispatch = event_bus.compile()
+    owner_ids = {id(owner) for owner in owners}
+    excluded_ids = {id(owner) for owner in excluded}
+    plan = []
+    for event in events:
+        if hooks and event.event_type in hooks:
+            plan.append((hooks[event.event_type], event, 0))
+        compiled = dispatch[event.event_type.ordinal]
+        if compiled is None:
+            continue
+        listeners, user_listeners = compiled
+        for listener in listeners + user_listeners:
+            if id(getattr(listener, "__self__", None)) not in owner_ids:
+                return None
+        listeners = tuple(listener for listener in listeners if id(listener.__self__) not in excluded_ids)
+        user_listeners = tuple(listener for listener in user_listeners if id(listener.__self__) not in excluded_ids)
+        plan.extend((listener, event, len(listeners) - i - 1) for i, listener in enumerate(listeners))
+        plan.extend((listener, event, 0) for listener in user_listeners)
+    return tuple(plan)
+
+
+def run_fused_plan(plan):
+    """make the calls of a plan of build_fused_plan"""
+    i, n_calls = 0, len(plan)
+    while i < n_calls:
+        listener, event, n_skip = plan[i]
+        i += 1
+        # if return True, the remaining system listeners of the event are skipped
+        if listener(event) and n_skip:
+            i += n_skip
+
 class Executor(object):
     
     EVENT_SPLIT_MAP = {
@@ -13,46 +64,127 @@ class Executor(object):
         EVENT.SETTLEMENT: (EVENT.PRE_SETTLEMENT, EVENT.SETTLEMENT, EVENT.POST_SETTLEMENT),
     }
     
-    def __init__(self, context):
+    def __init__(self, context, info_record=None, fused=True):
+        """
+        :param fused: call the listeners of the standard modules directly once sealed, see seal
+        """
         self._context = context
+        self._info_record = info_record
+        self._fused = fused
+        self._fused_plan = None
+        self._hold_plan = None
+        self._sealed_version = None
         self._last_before_trading = None
         self.available_trading_dts = self._context.get_available_trading_dts()
-        
-        self._events_container = self._context.event_source.events(trading_dts = self.available_trading_dts) 
+        # context.bar_ordinal counts in the trading_dts of the data source, available_trading_dts start later
+        self._first_bar_ordinal = self._context.first_bar_ordinal
+        self._trading_dts = self._context.data_source.get_available_trading_dts()
+        self._event_source = self._context.event_source
+    
+    def seal(self, owners, hold_excluded=()):
+        """
+        once every module has subscribed, flatten the per bar listeners into a direct call plan if they all belong
+        to owners, send falls back to the bus as soon as another listener is added
+        :param hold_excluded: the owners with nothing to do on a bar without action nor open order(the broker and
+                              the strategy), left out of the hold plan of the bars held by send_many
+        """
+        if not self._fused:
+            return
+        # the event source reuses the same event objects for every bar
+        events = self._event_source.bar_events(self.available_trading_dts, 0)
+        self._bar_event = next(event for event in events if event.event_type == EVENT.BAR)
+        self._fused_plan = build_fused_plan(self._context.event_bus, events, owners)
+        self._hold_plan = build_fused_plan(self._context.event_bus, events, owners, excluded=hold_excluded)
+        self._sealed_version = self._context.event_bus.version
+    
+    @staticmethod
+    def get_end_bar_ordinal(start_bar_ordinal, n_steps):
+        """the end_bar_ordinal of an episode of n_steps from start_bar_ordinal, every step closes one bar"""
+        return start_bar_ordinal + n_steps - 1
     
     def send(self, action):
-        
-        for event in self._events_container[self._context.trading_dt]:
-            
-            if event.event_type == EVENT.BAR:
-                event.action = action
-            self._context.event_bus.publish_event(event)
-            #self._split_and_publish(event)       
-        #self._split_and_publish(Event(EVENT.SETTLEMENT))
- 
         tracker = self._context.tracker
+        is_done = self._run_bar(action)
+        
         reward = tracker._portfolio_current_bar_returns[-1]
-
-        info = {}
+        info = self._fill_info(tracker._portfolio_current_bar_pnl[-1])
+        return reward, is_done, info
+    
+    def send_many(self, action, n_bars):
+        """
+        send action at the current bar then None at the following n_bars - 1 bars(or until the last one),
+        the reward is the compounded returns of the bars and the profit_and_loss their sum
+        """
+        tracker = self._context.tracker
+        start = len(tracker._portfolio_current_bar_returns)
+        is_done = self._run_bar(action)
+        for _ in range(n_bars - 1):
+            if is_done:
+                break
+            is_done = self._run_hold_bar()
+        
+        reward = np.prod(np.add(tracker._portfolio_current_bar_returns[start:], 1)) - 1
+        info = self._fill_info(np.sum(tracker._portfolio_current_bar_pnl[start:]))
+        return reward, is_done, info
+    
+    def _fill_info(self, profit_and_loss):
+        tracker = self._context.tracker
+        info = {} if self._info_record is None else self._info_record
         info["returns_mean"] = tracker._returns_mean[-1]
         info["unit_sharpe_ratio"] = tracker._unit_sharpe_ratio[-1]
         info["draw_down"] = tracker._draw_down[-1]
         info["max_draw_down"] = tracker._max_draw_down[-1]
         
-        info["profit_and_loss"] = tracker._portfolio_current_bar_pnl[-1]
+        info["profit_and_loss"] = profit_and_loss
+        return info
+    
+    def _check_plans(self):
+        # a listener added after seal invalidates the plans
+        if self._fused_plan is not None and self._context.event_bus.version != self._sealed_version:
+            self._fused_plan = self._hold_plan = None
+    
+    def _run_hold_bar(self):
+        """
+        a bar without action: with no open order, only mark to market, settle and record the tracker entries(the
+        hold plan) and move to the next bar, return whether it was the last bar
+        """
+        self._check_plans()
+        if self._hold_plan is None or self._context.broker.has_open_orders():
+            return self._run_bar(None)
+        ordinal = self._context.bar_ordinal - self._first_bar_ordinal
+        self._event_source.bar_events(self.available_trading_dts, ordinal)
+        run_fused_plan(self._hold_plan)
+        return self._next_bar()
+    
+    def _run_bar(self, action):
+        """publish the events of the current bar and move to the next one, return whether it was the last bar"""
+        ordinal = self._context.bar_ordinal - self._first_bar_ordinal
+        events = self._event_source.bar_events(self.available_trading_dts, ordinal)
+        self._check_plans()
         
-        if self._context.trading_dt == self.available_trading_dts[-1]:
-            is_done = True
+        if self._fused_plan is not None:
+            self._bar_event.action = action
+            run_fused_plan(self._fused_plan)
         else:
-            is_done = False
+            for event in events:
+                
+                if event.event_type == EVENT.BAR:
+                    event.action = action
+                self._context.event_bus.publish_event(event)
+                #self._split_and_publish(event)       
+            #self._split_and_publish(Event(EVENT.SETTLEMENT))
+        return self._next_bar()
+    
+    def _next_bar(self):
+        bar_ordinal = self._context.bar_ordinal
+        is_done = bar_ordinal == self._context.end_bar_ordinal
         
         if is_done:
             pass
         else:             
-            next_trading_dt = self._context.get_next_trading_dt()
-            self._context.update_time(calendar_dt=next_trading_dt, trading_dt=next_trading_dt)
-        
-        return reward, is_done, info
+            next_trading_dt = self._trading_dts[bar_ordinal + 1]
+            self._context.update_time(calendar_dt=next_trading_dt, trading_dt=next_trading_dt, bar_ordinal=bar_ordinal + 1)
+        return is_done
         
     
     def _split_and_publish(self, event):
@@ -64,44 +196,120 @@ class Executor(object):
 
 class RLExecutor(object):
 
-    def __init__(self, context):
+    def __init__(self, context, info_record=None, fused=True):
+        """
+        :param fused: call the listeners of the standard modules directly once sealed, see seal
+        """
         self._context = context
+        self._info_record = info_record
+        self._fused = fused
+        self._fused_plan = None
+        self._hold_plan = None
+        self._sealed_version = None
         self._last_before_trading = None
         self.available_trading_dts = self._context.get_available_trading_dts()
-        
-        self._events_container = self._context.event_source._rl_events(trading_dts = self.available_trading_dts) 
+        # context.bar_ordinal counts in the trading_dts of the data source, available_trading_dts start later
+        self._first_bar_ordinal = self._context.first_bar_ordinal
+        self._trading_dts = self._context.data_source.get_available_trading_dts()
+        self._event_source = self._context.event_source
+    
+    def seal(self, owners, hold_excluded=()):
+        """
+        once every module has subscribed, flatten the per bar listeners into a direct call plan if they all belong
+        to owners, send falls back to the bus as soon as another listener is added
+        :param hold_excluded: see Executor.seal
+        """
+        if not self._fused or len(self.available_trading_dts) < 2:
+            return
+        # the event source reuses the same event objects for every bar
+        events = self._event_source.rl_bar_events(self.available_trading_dts, 0)
+        self._bar_event = next(event for event in events if event.event_type == EVENT.BAR)
+        hooks = {EVENT.PRE_BEFORE_TRADING: self._update_time}
+        self._fused_plan = build_fused_plan(self._context.event_bus, events, owners, hooks=hooks)
+        self._hold_plan = build_fused_plan(self._context.event_bus, events, owners, hooks=hooks, excluded=hold_excluded)
+        self._sealed_version = self._context.event_bus.version
     
+    def _update_time(self, event):
+        # the PRE_BEFORE_TRADING of the next bar
+        self._context.update_time(calendar_dt=event.calendar_dt, trading_dt=event.trading_dt,
+                                  bar_ordinal=self._context.bar_ordinal + 1)
 
+    @staticmethod
+    def get_end_bar_ordinal(start_bar_ordinal, n_steps):
+        """the end_bar_ordinal of an episode of n_steps from start_bar_ordinal, every step moves to the next bar"""
+        return start_bar_ordinal + n_steps
+    
     def send(self, action):
-        
-        for event in self._events_container[self._context.trading_dt]:
-            
-            if event.event_type == EVENT.BAR:
-                event.action = action
-            
-            if event.event_type == EVENT.PRE_BEFORE_TRADING:
-                self._context.update_time(calendar_dt=event.calendar_dt, trading_dt=event.trading_dt)
-            self._context.event_bus.publish_event(event)
-        
         tracker = self._context.tracker
+        is_done = self._run_bar(action)
+        
         reward = tracker._portfolio_forward_bar_returns[-1]
+        info = self._fill_info(tracker._portfolio_forward_bar_pnl[-1])
+        return reward, is_done, info
+    
+    def send_many(self, action, n_bars):
+        """
+        send action at the current bar then None at the following n_bars - 1 bars(or until the last one),
+        the reward is the compounded forward returns of the bars and the profit_and_loss their sum
+        """
+        tracker = self._context.tracker
+        start = len(tracker._portfolio_forward_bar_returns)
+        is_done = self._run_bar(action)
+        for _ in range(n_bars - 1):
+            if is_done:
+                break
+            is_done = self._run_hold_bar()
         
-        info = {}
+        reward = np.prod(np.add(tracker._portfolio_forward_bar_returns[start:], 1)) - 1
+        info = self._fill_info(np.sum(tracker._portfolio_forward_bar_pnl[start:]))
+        return reward, is_done, info
+    
+    def _fill_info(self, profit_and_loss):
+        tracker = self._context.tracker
+        info = {} if self._info_record is None else self._info_record
         info["returns_mean"] = tracker._forward_bar_returns_mean[-1]
         info["unit_sharpe_ratio"] = tracker._forward_bar_unit_sharpe_ratio[-1]
         info["draw_down"]  = tracker._forward_bar_draw_down[-1]     
         info["max_draw_down"] = tracker._forward_bar_max_draw_down[-1]
         
-        info["profit_and_loss"] = tracker._portfolio_forward_bar_pnl[-1]
-        
-        
+        info["profit_and_loss"] = profit_and_loss
+        return info
+    
+    def _check_plans(self):
+        # a listener added after seal invalidates the plans
+        if self._fused_plan is not None and self._context.event_bus.version != self._sealed_version:
+            self._fused_plan = self._hold_plan = None
+    
+    def _run_hold_bar(self):
+        """see Executor._run_hold_bar"""
+        self._check_plans()
+        if self._hold_plan is None or self._context.broker.has_open_orders():
+            return self._run_bar(None)
+        ordinal = self._context.bar_ordinal - self._first_bar_ordinal
+        self._event_source.rl_bar_events(self.available_trading_dts, ordinal)
+        run_fused_plan(self._hold_plan)
+        return self._context.bar_ordinal == self._context.end_bar_ordinal
+    
+    def _run_bar(self, action):
+        """publish the events from the current bar to the PRE_BAR of the next one, return whether it is the last bar"""
+        ordinal = self._context.bar_ordinal - self._first_bar_ordinal
+        events = self._event_source.rl_bar_events(self.available_trading_dts, ordinal)
+        self._check_plans()
         
-        if self._context.trading_dt == self.available_trading_dts[-1]:
-            is_done = True
+        if self._fused_plan is not None:
+            self._bar_event.action = action
+            run_fused_plan(self._fused_plan)
         else:
-            is_done = False
+            for event in events:
+                
+                if event.event_type == EVENT.BAR:
+                    event.action = action
+                
+                if event.event_type == EVENT.PRE_BEFORE_TRADING:
+                    self._update_time(event)
+                self._context.event_bus.publish_event(event)
         
-        return reward, is_done, info
+        return self._context.bar_ordinal == self._context.end_bar_ordinal
 
 
 
@@ -119,7 +327,7 @@ if __name__ == "__main__":
     context.set_data_source(data_source)
     
     #
-    from sharpe.mod.event_source import SimulationEventSource
+    from sharpe.mod.sys_simulation.event_source import SimulationEventSource
     default_event_source = SimulationEventSource() 
     context.set_event_source(default_event_source)
     
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import numpy as np
 from sharpe.core.events import EVENT
+from sharpe.mod.sys_account.api import order_target_weights_array
 
 class Strategy(object):
     
@@ -15,6 +17,10 @@ class Strategy(object):
         action = event.action
         if action is None:
             pass
+        elif isinstance(action, np.ndarray):
+            # the target weights of the available order_book_ids
+            ordinals, quantities = order_target_weights_array(action, context=self._context)
+            self._context.broker.submit_order_batch(ordinals, quantities)
         else:
             for order in action:
                 self._context.broker.submit_order(order)
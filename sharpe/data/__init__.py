@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from .data_source import DataSource
+from .mmap_data_source import MmapDataSource, compile_data_source
+from .parquet_data_source import ParquetDataSource
     
 
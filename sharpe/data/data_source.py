@@ -1,69 +1,332 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
+import hashlib
 from typing import List, Union
+import numpy as np
 import pandas as pd
 import datetime
+from sharpe.interface import AbstractDataSource
 
 def count_nan(df):
     output = df.isnull().sum(axis = 0)
     return output 
 #nan_groupby_status = index_daily.groupby(level=0).apply(count_nan)
 
-class DataSource(object):
+VALIDATION_LEVELS = ("off", "summary", "full")
+
+
+def fill_padded(window:np.ndarray, window_membership:np.ndarray, out:np.ndarray, mask:np.ndarray) -> None:
+    """
+    copy the (order_book_id, bar, feature) window into the tail of the fixed shape out buffer in place,
+    the missing bars at the head and the NaN values are filled with 0, mask is True where the bar exists
+    """
+    pad = out.shape[1] - window.shape[1]
+    out[:, :pad] = 0
+    mask[:, :pad] = False
+    out[:, pad:] = window
+    mask[:, pad:] = window_membership.T
+    np.nan_to_num(out, copy=False)
+
+
+def fingerprint(feature_df:pd.DataFrame, price_s:pd.Series, *options) -> str:
+    """content fingerprint of the inputs(and build options) of DataSource, hashing every row(index included) in a vectorized way"""
+    sha = hashlib.sha1()
+    for data in (feature_df, price_s):
+        sha.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    sha.update(repr(feature_df.columns.to_list()).encode("utf-8"))
+    sha.update(repr(feature_df.dtypes.astype(str).to_list()).encode("utf-8"))
+    sha.update(repr(list(feature_df.index.names)).encode("utf-8"))
+    sha.update(repr(options).encode("utf-8"))
+    return sha.hexdigest()
+
+class DataSource(AbstractDataSource):
     
-    def __init__(self, feature_df:pd.DataFrame, price_s:pd.Series) -> None:
+    def __init__(self, feature_df:pd.DataFrame, price_s:pd.Series, dense:bool=False, validation:str="summary", cache_dir:str=None,
+                 feature_dtype=None, price_dtype=np.float64, encode_order_book_ids:bool=False) -> None:
+        """
+        :param dense: build the dense (order_book_id x trading_dt x feature) panel in __init__
+        :param validation: one of "off", "summary"(balance and NaN count of every feature) and "full"(per order_book_id statistic)
+        :param cache_dir: persist the sorted and indexed build under cache_dir, keyed by the fingerprint of the inputs
+        :param feature_dtype: the features are cast once to feature_dtype at build time, e.g. np.float32 to halve the
+                              memory of the panel, None(default) to keep the input dtype
+        :param price_dtype: the dtype of the price matrix
+        :param encode_order_book_ids: replace the order_book_id level of the feature frame by its int32 ordinal
+                                      in order_book_ids_index, decode with get_order_book_ids
+        """
+        if not isinstance(feature_df.index, pd.MultiIndex):
+            raise ValueError("the input of dataframe should be with pandas.MultiIndex")
+        if validation not in VALIDATION_LEVELS:
+            raise ValueError("validation should be one of {}, got {}".format(VALIDATION_LEVELS, validation))
+        
+        self._feature_dtype = None if feature_dtype is None else np.dtype(feature_dtype)
+        self._price_dtype = np.dtype(price_dtype)
+        self._encode_order_book_ids = encode_order_book_ids
+        
+        cache_file = None
+        if cache_dir is not None:
+            options = (str(self._feature_dtype), str(self._price_dtype), encode_order_book_ids)
+            cache_file = os.path.join(cache_dir, "{}.pkl".format(fingerprint(feature_df, price_s, *options)))
+        
+        if cache_file is not None and os.path.exists(cache_file):
+            self._set_build(pd.read_pickle(cache_file))
+        else:
+            self._build(feature_df, price_s)
+            if validation != "off":
+                self._validate(validation)
+            if cache_file is not None:
+                self._dump_build(cache_file)
+        
+        self.feature_list = self._feature_df.columns.to_list()
+        
+        # integer cursor: map every trading_dt to its ordinal in trading_dts_index
+        self._trading_dt_map = {dt: i for i, dt in enumerate(self.trading_dts_index)}
+        self._order_book_id_map = {order_book_id: i for i, order_book_id in enumerate(self.order_book_ids_index)}
+        
+        # dense (order_book_id x trading_dt x feature) panel, NaN padded
+        self._panel = None
+        self._sliding_windows = {}
+        if dense:
+            self._build_panel()
+    
+    def _build(self, feature_df:pd.DataFrame, price_s:pd.Series) -> None:
         self._feature_df = feature_df.sort_index(level=[0,1], ascending=True)
-        self._price_s = price_s        
+        if self._feature_dtype is not None:
+            self._feature_df = self._feature_df.astype(self._feature_dtype)
+        self._price_s = price_s
         
         self.multi_index = self._feature_df.index
-        if not isinstance(self.multi_index, pd.MultiIndex):
-            raise ValueError("the input of dataframe should be with pandas.MultiIndex")
+        self.order_book_ids_index = self.multi_index.get_level_values(0).unique()
+        self.trading_dts_index = self.multi_index.get_level_values(1).unique().sort_values()
+        id_position = self.order_book_ids_index.get_indexer(self.multi_index.get_level_values(0))
+        dt_position = self.trading_dts_index.get_indexer(self.multi_index.get_level_values(1))
         
+        if self._encode_order_book_ids:
+            # the order of the ordinals is the order of the sorted order_book_ids, so the frame stays sorted
+            self._feature_df.index = pd.MultiIndex.from_arrays(
+                [id_position.astype(np.int32), self.multi_index.get_level_values(1)], names=self.multi_index.names
+            )
+            self.multi_index = self._feature_df.index
+        
+        # (trading_dt x order_book_id) bitmap, whether the order_book_id has a row at the trading_dt
+        membership = np.zeros((len(self.trading_dts_index), len(self.order_book_ids_index)), dtype=bool)
+        membership[dt_position, id_position] = True
+        self._membership = membership
+        
+        # contiguous (trading_dt x order_book_id) price matrix and the one shifted by one bar as previous close
+        self._build_price_matrix()
+    
+    def _get_build(self) -> dict:
+        return {
+            "feature_df": self._feature_df,
+            "price_s": self._price_s,
+            "order_book_ids_index": self.order_book_ids_index,
+            "trading_dts_index": self.trading_dts_index,
+            "membership": self._membership,
+            "price_matrix": self._price_matrix,
+        }
+    
+    def _set_build(self, build:dict) -> None:
+        self._feature_df = build["feature_df"]
+        self._price_s = build["price_s"]
+        self.multi_index = self._feature_df.index
+        self.order_book_ids_index = build["order_book_ids_index"]
+        self.trading_dts_index = build["trading_dts_index"]
+        self._membership = build["membership"]
+        self._set_price_matrix(build["price_matrix"])
+    
+    def _dump_build(self, cache_file:str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        # write to a temporary file first, so a concurrent run never reads a partial cache
+        temp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        pd.to_pickle(self._get_build(), temp_file)
+        os.replace(temp_file, cache_file)
+    
+    def _validate(self, validation:str) -> None:
+        if not isinstance(self.trading_dts_index, pd.DatetimeIndex):
+            print("the level 1 index should be pandas.DatetimeIndex")
+        
+        # the frame is sorted by order_book_id, so every order_book_id is one contiguous block of rows
+        id_codes, _ = self._get_row_positions()
+        block_starts = np.flatnonzero(np.r_[True, id_codes[1:] != id_codes[:-1]])
+        bar_counts = np.diff(np.r_[block_starts, len(id_codes)])
+        nan_counts = np.add.reduceat(self._feature_df.isnull().values, block_starts, axis=0)
         
         #check whether balance data or not
-        order_book_ids_stats = self.multi_index.get_level_values(0).value_counts()
-        if len(order_book_ids_stats.unique()) == 1:
+        if len(np.unique(bar_counts)) <= 1:
             print("the input dataframe is balance data")
         else:
             print("attention: the input dataframe is not a balance data")
-            print(order_book_ids_stats)
-        
+            if validation == "full":
+                print(pd.Series(bar_counts, index=self.order_book_ids_index, name="count"))
         
         #check NaN
-        nan_groupby_status =  self._feature_df.groupby(level=0).apply(count_nan)
         print("the NaN value statistic")
-        print(nan_groupby_status)
+        if validation == "full":
+            print(pd.DataFrame(nan_counts, index=self.order_book_ids_index, columns=self._feature_df.columns))
+        else:
+            print(pd.Series(nan_counts.sum(axis=0), index=self._feature_df.columns))
+    
+    def _get_row_positions(self):
+        """the (order_book_id, trading_dt) ordinals of every row of the feature frame"""
+        if self._encode_order_book_ids:
+            id_position = self.multi_index.get_level_values(0).values
+        else:
+            id_position = self.order_book_ids_index.get_indexer(self.multi_index.get_level_values(0))
+        dt_position = self.trading_dts_index.get_indexer(self.multi_index.get_level_values(1))
+        return id_position, dt_position
+    
+    def _build_panel(self) -> None:
+        id_position, dt_position = self._get_row_positions()
         
-        self.order_book_ids_index = self.multi_index.get_level_values(0).unique()
-        self.trading_dts_index = self.multi_index.get_level_values(1).unique().sort_values()
-        if not isinstance(self.trading_dts_index, pd.DatetimeIndex):
-            print("the level 1 index should be pandas.DatetimeIndex")
-        self.feature_list = feature_df.columns.to_list()
+        values = self._feature_df.values
+        dtype = values.dtype if values.dtype.kind == "f" else np.float64
+        panel = np.full((len(self.order_book_ids_index), len(self.trading_dts_index), len(self.feature_list)), np.nan, dtype=dtype)
+        panel[id_position, dt_position] = values
+        # the views handed out share the panel, nobody should write through them
+        panel.flags.writeable = False
+        self._panel = panel
+    
+    def _build_price_matrix(self) -> None:
+        price_index = self._price_s.index
+        id_position = self.order_book_ids_index.get_indexer(price_index.get_level_values(0))
+        dt_position = self.trading_dts_index.get_indexer(price_index.get_level_values(1))
+        is_valid = (id_position >= 0) & (dt_position >= 0)
+        
+        price_matrix = np.full((len(self.trading_dts_index), len(self.order_book_ids_index)), np.nan, dtype=self._price_dtype)
+        price_matrix[dt_position[is_valid], id_position[is_valid]] = self._price_s.values[is_valid]
+        self._set_price_matrix(price_matrix)
+    
+    def _set_price_matrix(self, price_matrix:np.ndarray) -> None:
+        self._price_matrix = price_matrix
+        
+        prev_close_matrix = np.full_like(price_matrix, np.nan)
+        prev_close_matrix[1:] = price_matrix[:-1]
+        self._prev_close_matrix = prev_close_matrix
+    
+    @property
+    def panel(self) -> np.ndarray:
+        """the read only dense feature panel with shape (order_book_id, trading_dt, feature), built on first use"""
+        if self._panel is None:
+            self._build_panel()
+        return self._panel
+    
+    def get_trading_dt_ordinal(self, dt:datetime.datetime) -> int:
+        """the position of the latest trading_dt not after dt"""
+        try:
+            return self._trading_dt_map[dt]
+        except KeyError:
+            return self.trading_dts_index.searchsorted(dt, side="right") - 1
+    
+    @property
+    def membership(self) -> np.ndarray:
+        """the (trading_dt x order_book_id) bool bitmap of the order_book_ids alive at every trading_dt"""
+        return self._membership
+    
+    def get_universe(self, dt:datetime.datetime) -> np.ndarray:
+        """the ordinals(in order_book_ids_index) of the order_book_ids alive at dt"""
+        return np.flatnonzero(self._membership[self.get_trading_dt_ordinal(dt)])
+    
+    def get_universe_order_book_ids(self, dt:datetime.datetime) -> pd.Index:
+        return self.order_book_ids_index[self.get_universe(dt)]
     
+    def is_alive(self, order_book_id:str, dt:datetime.datetime) -> bool:
+        return bool(self._membership[self.get_trading_dt_ordinal(dt), self._order_book_id_map[order_book_id]])
+    
+    def history_bars_array(self, dt:datetime.datetime, bar_count:int) -> np.ndarray:
+        """
+        get the current state(feature) with look_backward_window as a read only view of the dense panel,
+        shape (order_book_id, bar_count, feature), the instruments not alive are NaN
+        """
+        end_position = self.get_trading_dt_ordinal(dt) + 1
+        start_position = end_position - bar_count if end_position >= bar_count else 0
+        return self.panel[:, start_position: end_position, :]
+    
+    def sliding_window_view(self, bar_count:int) -> np.ndarray:
+        """
+        all the look_backward_windows of the dense panel as one zero copy, read only (trading_dt, order_book_id, bar_count, feature)
+        tensor, the i-th window ends at the (i + bar_count - 1)-th trading_dt
+        """
+        try:
+            return self._sliding_windows[bar_count]
+        except KeyError:
+            windows = np.lib.stride_tricks.sliding_window_view(self.panel, bar_count, axis=1, writeable=False)
+            # (order_book_id, window, feature, bar) -> (window, order_book_id, bar, feature)
+            return self._sliding_windows.setdefault(bar_count, windows.transpose(1, 0, 3, 2))
+    
+    def history_bars_window(self, dt:datetime.datetime, bar_count:int) -> np.ndarray:
+        """
+        get the current state(feature) with look_backward_window from the sliding window tensor,
+        shape (order_book_id, bar_count, feature), dt should have bar_count - 1 trading_dts before it
+        """
+        return self.history_bars_window_at(self.get_trading_dt_ordinal(dt), bar_count)
+    
+    def history_bars_window_at(self, bar_ordinal:int, bar_count:int) -> np.ndarray:
+        start_position = bar_ordinal - bar_count + 1
+        if start_position < 0:
+            raise ValueError("there are less than {} trading_dts until {}".format(bar_count, self.trading_dts_index[bar_ordinal]))
+        return self.sliding_window_view(bar_count)[start_position]
+    
+    def history_bars_padded(self, dt:datetime.datetime, bar_count:int, out:np.ndarray=None, mask:np.ndarray=None):
+        """
+        get the current state(feature) with look_backward_window as a fixed shape (order_book_id, bar_count, feature)
+        float32 array and the (order_book_id, bar_count) validity mask, refill out and mask in place if given
+        """
+        if out is None:
+            out = np.empty((len(self.order_book_ids_index), bar_count, len(self.feature_list)), dtype=np.float32)
+        if mask is None:
+            mask = np.empty((len(self.order_book_ids_index), bar_count), dtype=bool)
+        end_position = self.get_trading_dt_ordinal(dt) + 1
+        start_position = end_position - bar_count if end_position >= bar_count else 0
+        fill_padded(self.panel[:, start_position: end_position, :], self._membership[start_position: end_position], out, mask)
+        return out, mask
     
     def history_bars(self, dt:datetime.datetime, bar_count:int) -> pd.DataFrame:
         """get the current state(feature) with look_backward_window"""
         """remove order_book_ids parameter to allow unbalance data """
         
-        end_position = self.trading_dts_index.searchsorted(dt, side="right")
+        end_position = self.get_trading_dt_ordinal(dt) + 1
         start_position = end_position - bar_count if end_position >= bar_count else 0
         trading_dates_slice = self.trading_dts_index[start_position: end_position]
         
         # order_book_ids
-        idx = self.multi_index.get_loc_level(dt, level=1)
-        position_bool = list(idx[0])
-        order_book_ids = list(self.multi_index.get_level_values(0)[position_bool])
+        if self._encode_order_book_ids:
+            order_book_ids = self.get_universe(dt).astype(np.int32)
+        else:
+            order_book_ids = self.get_universe_order_book_ids(dt)
             
         state = self._feature_df.loc[(order_book_ids, trading_dates_slice),:]
         return state
     
+    def get_order_book_id_ordinals(self, order_book_ids:List[str]) -> np.ndarray:
+        """the positions of order_book_ids in order_book_ids_index"""
+        return np.fromiter((self._order_book_id_map[order_book_id] for order_book_id in order_book_ids), dtype=np.intp, count=len(order_book_ids))
+    
+    def get_order_book_ids(self, ordinals:np.ndarray) -> pd.Index:
+        """decode the ordinals(the order_book_id level of an encoded feature frame) to order_book_ids"""
+        return self.order_book_ids_index[ordinals]
+    
     def get_last_price(self, order_book_id, dt):
-        return self._price_s.loc[(order_book_id, dt)]
+        return self._price_matrix[self._trading_dt_map[dt], self._order_book_id_map[order_book_id]]
+    
+    def get_last_price_at(self, order_book_id, bar_ordinal:int):
+        return self._price_matrix[bar_ordinal, self._order_book_id_map[order_book_id]]
+    
+    def get_last_prices(self, dt, order_book_ids:List[str]=None) -> np.ndarray:
+        """the prices of order_book_ids at dt, the whole row(a view) ordered by order_book_ids_index if order_book_ids is None"""
+        return self.get_last_prices_at(self._trading_dt_map[dt], order_book_ids)
+    
+    def get_last_prices_at(self, bar_ordinal:int, order_book_ids:List[str]=None) -> np.ndarray:
+        row = self._price_matrix[bar_ordinal]
+        if order_book_ids is None:
+            return row
+        return row[self.get_order_book_id_ordinals(order_book_ids)]
     
     def get_previous_close(self, order_book_id, dt):
-        idx = self.trading_dts_index.searchsorted(dt)
-        prev_dt = self.trading_dts_index[idx-1]
-        return self._price_s.loc[(order_book_id, prev_dt)]
+        return self._prev_close_matrix[self._trading_dt_map[dt], self._order_book_id_map[order_book_id]]
+    
+    def get_previous_close_at(self, order_book_id, bar_ordinal:int):
+        return self._prev_close_matrix[bar_ordinal, self._order_book_id_map[order_book_id]]
     
     def get_available_trading_dts(self):
         return self.trading_dts_index
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import json
+import datetime
+from typing import List
+import numpy as np
+import pandas as pd
+from sharpe.interface import AbstractDataSource
+from sharpe.data.data_source import fill_padded
+
+# ====================================================================== #
+# compiled on-disk format, one directory:                                #
+#   meta.json                  feature_list and index names              #
+#   order_book_ids.npy         instrument dictionary                     #
+#   trading_dts.npy            date dictionary(datetime64)               #
+#   membership.npy             bool (trading_dt x order_book_id)         #
+#   price.npy                  price_dtype (trading_dt x order_book_id)  #
+#   feature_{i}.npy            one column per feature, same layout       #
+# every file is row-major by trading_dt, so a look_backward_window is a  #
+# contiguous block and the OS only pages in the bars the executor reads  #
+# ====================================================================== #
+
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+# the bytes of the block of rows compile_data_source fills in memory before writing it
+CHUNK_BYTES = 1 << 26
+
+
+def _feature_file(i):
+    return "feature_{}.npy".format(i)
+
+
+def _write_matrix(file:str, shape:tuple, dtype, fill_value, dt_position:np.ndarray, id_position:np.ndarray,
+                  values, chunk_rows:int) -> None:
+    """
+    write the (trading_dt x order_book_id) matrix of values at (dt_position, id_position), fill_value elsewhere,
+    chunk_rows rows at a time through open_memmap, dt_position must be sorted
+    """
+    matrix = np.lib.format.open_memmap(file, mode="w+", dtype=dtype, shape=shape)
+    bounds = np.searchsorted(dt_position, np.arange(0, shape[0] + chunk_rows, chunk_rows))
+    for start, lo, hi in zip(range(0, shape[0], chunk_rows), bounds[:-1], bounds[1:]):
+        chunk = np.full((min(chunk_rows, shape[0] - start), shape[1]), fill_value, dtype=dtype)
+        chunk[dt_position[lo:hi] - start, id_position[lo:hi]] = values if np.ndim(values) == 0 else values[lo:hi]
+        matrix[start:start + len(chunk)] = chunk
+    matrix.flush()
+    del matrix
+
+
+def compile_data_source(feature_df:pd.DataFrame, price_s:pd.Series, path:str,
+                        feature_dtype=None, price_dtype=np.float64, chunk_rows:int=None) -> "MmapDataSource":
+    """
+    convert the (feature_df, price_s) input of DataSource to the on-disk format under path,
+    the features and prices are stored as feature_dtype and price_dtype
+    :param feature_dtype: None to keep the float dtype of feature_df(float64 for the other dtypes), like DataSource
+    :param chunk_rows: the number of trading_dts written at once, by default the rows of about CHUNK_BYTES, so no
+                       whole matrix is held in memory
+    """
+    if not isinstance(feature_df.index, pd.MultiIndex):
+        raise ValueError("the input of dataframe should be with pandas.MultiIndex")
+    os.makedirs(path, exist_ok=True)
+    if feature_dtype is None:
+        feature_dtype = np.result_type(*feature_df.dtypes)
+        if feature_dtype.kind != "f":
+            feature_dtype = np.dtype(np.float64)
+
+    multi_index = feature_df.index
+    order_book_ids_index = multi_index.get_level_values(0).unique().sort_values()
+    trading_dts_index = multi_index.get_level_values(1).unique().sort_values()
+    shape = (len(trading_dts_index), len(order_book_ids_index))
+
+    if chunk_rows is None:
+        chunk_rows = CHUNK_BYTES // max(shape[1] * max(np.dtype(feature_dtype).itemsize, np.dtype(price_dtype).itemsize), 1)
+    chunk_rows = max(chunk_rows, 1)
+
+    id_position = order_book_ids_index.get_indexer(multi_index.get_level_values(0))
+    dt_position = trading_dts_index.get_indexer(multi_index.get_level_values(1))
+    # the rows sorted by trading_dt, a chunk is then a slice of them
+    order = np.argsort(dt_position, kind="stable")
+    id_position, dt_position = id_position[order], dt_position[order]
+
+    _write_matrix(os.path.join(path, "membership.npy"), shape, bool, False, dt_position, id_position, True, chunk_rows)
+    for i, feature in enumerate(feature_df.columns):
+        _write_matrix(os.path.join(path, _feature_file(i)), shape, feature_dtype, np.nan, dt_position, id_position,
+                      feature_df[feature].to_numpy(dtype=feature_dtype)[order], chunk_rows)
+
+    price_id_position = order_book_ids_index.get_indexer(price_s.index.get_level_values(0))
+    price_dt_position = trading_dts_index.get_indexer(price_s.index.get_level_values(1))
+    is_valid = np.flatnonzero((price_id_position >= 0) & (price_dt_position >= 0))
+    order = is_valid[np.argsort(price_dt_position[is_valid], kind="stable")]
+    _write_matrix(os.path.join(path, "price.npy"), shape, price_dtype, np.nan, price_dt_position[order], price_id_position[order],
+                  price_s.to_numpy(dtype=price_dtype)[order], chunk_rows)
+
+    # the order_book_ids keep their dtype(e.g. int codes), only the strings of an object index are converted
+    order_book_ids = order_book_ids_index.to_numpy()
+    if order_book_ids.dtype == object:
+        if not all(isinstance(order_book_id, str) for order_book_id in order_book_ids):
+            raise ValueError("the order_book_ids should be strings or of a numpy dtype")
+        order_book_ids = order_book_ids.astype(str)
+    np.save(os.path.join(path, "order_book_ids.npy"), order_book_ids, allow_pickle=False)
+    np.save(os.path.join(path, "trading_dts.npy"), pd.DatetimeIndex(trading_dts_index).to_numpy())
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "feature_list": [str(feature) for feature in feature_df.columns],
+            "index_names": list(multi_index.names),
+        }, f)
+    return MmapDataSource(path)
+
+
+class MmapDataSource(AbstractDataSource):
+    """
+    DataSource backed by the compiled on-disk format, every array is opened with np.memmap
+    """
+
+    def __init__(self, path:str) -> None:
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError("unsupported format version {} of {}".format(meta["version"], path))
+
+        self.feature_list = meta["feature_list"]
+        self._index_names = meta["index_names"]
+
+        self.order_book_ids_index = pd.Index(np.load(os.path.join(path, "order_book_ids.npy"), allow_pickle=False), name=self._index_names[0])
+        self.trading_dts_index = pd.DatetimeIndex(np.load(os.path.join(path, "trading_dts.npy")), name=self._index_names[1])
+
+        self._trading_dt_map = {dt: i for i, dt in enumerate(self.trading_dts_index)}
+        self._order_book_id_map = {order_book_id: i for i, order_book_id in enumerate(self.order_book_ids_index)}
+
+        self._membership = np.load(os.path.join(path, "membership.npy"), mmap_mode="r")
+        self._price_matrix = np.load(os.path.join(path, "price.npy"), mmap_mode="r")
+        self._feature_columns = [
+            np.load(os.path.join(path, _feature_file(i)), mmap_mode="r") for i in range(len(self.feature_list))
+        ]
+
+    def get_trading_dt_ordinal(self, dt:datetime.datetime) -> int:
+        """the position of the latest trading_dt not after dt"""
+        try:
+            return self._trading_dt_map[dt]
+        except KeyError:
+            return self.trading_dts_index.searchsorted(dt, side="right") - 1
+
+    def get_order_book_id_ordinals(self, order_book_ids:List[str]) -> np.ndarray:
+        """the positions of order_book_ids in order_book_ids_index"""
+        return np.fromiter((self._order_book_id_map[order_book_id] for order_book_id in order_book_ids), dtype=np.intp, count=len(order_book_ids))
+
+    def _window(self, dt, bar_count):
+        end_position = self.get_trading_dt_ordinal(dt) + 1
+        start_position = end_position - bar_count if end_position >= bar_count else 0
+        return start_position, end_position
+
+    @property
+    def membership(self) -> np.ndarray:
+        """the (trading_dt x order_book_id) bool bitmap of the order_book_ids alive at every trading_dt"""
+        return self._membership
+
+    def get_universe(self, dt:datetime.datetime) -> np.ndarray:
+        """the ordinals(in order_book_ids_index) of the order_book_ids alive at dt"""
+        return np.flatnonzero(self._membership[self.get_trading_dt_ordinal(dt)])
+
+    def get_universe_order_book_ids(self, dt:datetime.datetime) -> pd.Index:
+        return self.order_book_ids_index[self.get_universe(dt)]
+
+    def is_alive(self, order_book_id:str, dt:datetime.datetime) -> bool:
+        return bool(self._membership[self.get_trading_dt_ordinal(dt), self._order_book_id_map[order_book_id]])
+
+    def history_bars_array(self, dt:datetime.datetime, bar_count:int) -> np.ndarray:
+        """
+        get the current state(feature) with look_backward_window, shape (order_book_id, bar_count, feature),
+        the instruments not alive are NaN
+        """
+        start_position, end_position = self._window(dt, bar_count)
+        return np.stack([column[start_position: end_position].T for column in self._feature_columns], axis=-1)
+
+    def history_bars_window(self, dt:datetime.datetime, bar_count:int) -> np.ndarray:
+        """
+        get the current state(feature) with look_backward_window, shape (order_book_id, bar_count, feature),
+        dt should have bar_count - 1 trading_dts before it
+        """
+        return self.history_bars_window_at(self.get_trading_dt_ordinal(dt), bar_count)
+
+    def history_bars_window_at(self, bar_ordinal:int, bar_count:int) -> np.ndarray:
+        start_position = bar_ordinal - bar_count + 1
+        if start_position < 0:
+            raise ValueError("there are less than {} trading_dts until {}".format(bar_count, self.trading_dts_index[bar_ordinal]))
+        return np.stack([column[start_position: bar_ordinal + 1].T for column in self._feature_columns], axis=-1)
+
+    def history_bars_padded(self, dt:datetime.datetime, bar_count:int, out:np.ndarray=None, mask:np.ndarray=None):
+        """
+        get the current state(feature) with look_backward_window as a fixed shape (order_book_id, bar_count, feature)
+        float32 array and the (order_book_id, bar_count) validity mask, refill out and mask in place if given
+        """
+        if out is None:
+            out = np.empty((len(self.order_book_ids_index), bar_count, len(self.feature_list)), dtype=np.float32)
+        if mask is None:
+            mask = np.empty((len(self.order_book_ids_index), bar_count), dtype=bool)
+        start_position, end_position = self._window(dt, bar_count)
+        fill_padded(self.history_bars_array(dt, bar_count), self._membership[start_position: end_position], out, mask)
+        return out, mask
+
+    def history_bars(self, dt:datetime.datetime, bar_count:int) -> pd.DataFrame:
+        """get the current state(feature) with look_backward_window of the order_book_ids alive at dt"""
+        start_position, end_position = self._window(dt, bar_count)
+        alive = self.get_universe(dt)
+
+        window_membership = self._membership[start_position: end_position, alive].T
+        id_position, dt_position = np.nonzero(window_membership)
+        values = np.column_stack([
+            column[start_position: end_position, alive].T[id_position, dt_position] for column in self._feature_columns
+        ])
+        index = pd.MultiIndex.from_arrays([
+            self.order_book_ids_index[alive][id_position],
+            self.trading_dts_index[start_position: end_position][dt_position]
+        ], names=self._index_names)
+        return pd.DataFrame(values, index=index, columns=self.feature_list)
+
+    def get_last_price(self, order_book_id, dt):
+        return self._price_matrix[self._trading_dt_map[dt], self._order_book_id_map[order_book_id]]
+
+    def get_last_price_at(self, order_book_id, bar_ordinal:int):
+        return self._price_matrix[bar_ordinal, self._order_book_id_map[order_book_id]]
+
+    def get_last_prices(self, dt, order_book_ids:List[str]=None) -> np.ndarray:
+        """the prices of order_book_ids at dt, the whole row ordered by order_book_ids_index if order_book_ids is None"""
+        return self.get_last_prices_at(self._trading_dt_map[dt], order_book_ids)
+
+    def get_last_prices_at(self, bar_ordinal:int, order_book_ids:List[str]=None) -> np.ndarray:
+        row = self._price_matrix[bar_ordinal]
+        if order_book_ids is None:
+            return row
+        return row[self.get_order_book_id_ordinals(order_book_ids)]
+
+    def get_previous_close(self, order_book_id, dt):
+        return self.get_previous_close_at(order_book_id, self._trading_dt_map[dt])
+
+    def get_previous_close_at(self, order_book_id, bar_ordinal:int):
+        if bar_ordinal == 0:
+            return np.nan
+        return self._price_matrix[bar_ordinal - 1, self._order_book_id_map[order_book_id]]
+
+    def get_available_trading_dts(self):
+        return self.trading_dts_index
+
+    def get_available_order_book_ids(self):
+        return self.order_book_ids_index
+
+
+if __name__ == "__main__":
+    import tempfile
+    from sharpe.utils.mock_data import create_toy_feature
+
+    feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3)
+    data_source = compile_data_source(feature_df, price_s, tempfile.mkdtemp())
+
+    availabel_dts = data_source.get_available_trading_dts()
+    state = data_source.history_bars(dt=availabel_dts[3], bar_count=2)
+    print(state)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import numpy as np
+import pandas as pd
+from sharpe.interface import AbstractDataSource
+
+# ====================================================================== #
+# a directory of date partitions, one parquet file per trading_dt named  #
+# by the date(e.g. 2020-01-02.parquet), every row is one order_book_id   #
+# with its features and price                                            #
+# ====================================================================== #
+
+PARQUET_SUFFIX = ".parquet"
+
+
+class ParquetDataSource(AbstractDataSource):
+    """
+    DataSource streaming the date partitions under path, only the requested feature columns are decoded
+    and a bounded LRU of partitions covering the look_backward_window is kept in memory, the next partition
+    is prefetched on a background thread while the current bar is processed
+    """
+
+    def __init__(self, path:str, columns:List[str]=None, price_column:str="price", order_book_id_column:str="order_book_id",
+                 order_book_ids:List[str]=None, cache_size:int=8, prefetch:bool=True, feature_dtype=None) -> None:
+        """
+        :param columns: the feature columns to read, all the columns except order_book_id and price if None
+        :param order_book_ids: the universe, collected by reading only the order_book_id column of every partition if None
+        :param cache_size: the number of decoded partitions kept, at least the look_backward_window
+        :param feature_dtype: the features are cast to feature_dtype when a partition is decoded, None to keep the file dtype
+        """
+        self.path = path
+        self._price_column = price_column
+        self._order_book_id_column = order_book_id_column
+        self._feature_dtype = feature_dtype
+        self._cache_size = cache_size
+
+        files = {}
+        for file_name in os.listdir(path):
+            if file_name.endswith(PARQUET_SUFFIX):
+                files[pd.Timestamp(file_name[:-len(PARQUET_SUFFIX)])] = os.path.join(path, file_name)
+        if not files:
+            raise ValueError("no {} partition under {}".format(PARQUET_SUFFIX, path))
+        self.trading_dts_index = pd.DatetimeIndex(sorted(files), name="datetime")
+        self._files = [files[dt] for dt in self.trading_dts_index]
+
+        if columns is None:
+            columns = [column for column in self._read_frame(self._files[0], None).columns if column != price_column]
+        self.feature_list = list(columns)
+        self._columns = [order_book_id_column] + self.feature_list + [price_column]
+
+        if order_book_ids is None:
+            order_book_ids = set()
+            for file in self._files:
+                order_book_ids.update(self._read_frame(file, [order_book_id_column]).index)
+        self.order_book_ids_index = pd.Index(sorted(order_book_ids), name=order_book_id_column)
+
+        self._trading_dt_map = {dt: i for i, dt in enumerate(self.trading_dts_index)}
+        self._order_book_id_map = {order_book_id: i for i, order_book_id in enumerate(self.order_book_ids_index)}
+
+        self._partitions = OrderedDict()
+        self._prefetching = {}
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+    def _read_frame(self, file, columns):
+        df = pd.read_parquet(file, columns=columns)
+        if self._order_book_id_column in df.columns:
+            df = df.set_index(self._order_book_id_column)
+        return df
+
+    def _read(self, position):
+        df = self._read_frame(self._files[position], self._columns)
+        if self._feature_dtype is not None:
+            df[self.feature_list] = df[self.feature_list].astype(self._feature_dtype)
+        return df
+
+    def _get_partition(self, position) -> pd.DataFrame:
+        try:
+            self._partitions.move_to_end(position)
+            partition = self._partitions[position]
+        except KeyError:
+            future = self._prefetching.pop(position, None)
+            partition = self._read(position) if future is None else future.result()
+            self._partitions[position] = partition
+            while len(self._partitions) > self._cache_size:
+                self._partitions.popitem(last=False)
+        self._prefetch(position + 1)
+        return partition
+
+    def _prefetch(self, position):
+        if self._prefetch_executor is None or position >= len(self._files):
+            return
+        if position in self._partitions or position in self._prefetching:
+            return
+        self._prefetching[position] = self._prefetch_executor.submit(self._read, position)
+
+    def get_trading_dt_ordinal(self, dt:datetime.datetime) -> int:
+        """the position of the latest trading_dt not after dt"""
+        try:
+            return self._trading_dt_map[dt]
+        except KeyError:
+            return self.trading_dts_index.searchsorted(dt, side="right") - 1
+
+    def get_order_book_id_ordinals(self, order_book_ids:List[str]) -> np.ndarray:
+        """the positions of order_book_ids in order_book_ids_index"""
+        return np.fromiter((self._order_book_id_map[order_book_id] for order_book_id in order_book_ids), dtype=np.intp, count=len(order_book_ids))
+
+    def _window(self, dt, bar_count):
+        # the whole look_backward_window should stay in the LRU, otherwise every bar decodes it again
+        if bar_count > self._cache_size:
+            raise ValueError("bar_count {} is larger than the cache_size {} of the partitions".format(bar_count, self._cache_size))
+        end_position = self.get_trading_dt_ordinal(dt) + 1
+        start_position = end_position - bar_count if end_position >= bar_count else 0
+        return start_position, end_position
+
+    def get_universe_order_book_ids(self, dt:datetime.datetime) -> pd.Index:
+        return self._get_partition(self.get_trading_dt_ordinal(dt)).index.sort_values()
+
+    def history_bars(self, dt:datetime.datetime, bar_count:int) -> pd.DataFrame:
+        """get the current state(feature) with look_backward_window of the order_book_ids alive at dt"""
+        start_position, end_position = self._window(dt, bar_count)
+        order_book_ids = self.get_universe_order_book_ids(dt)
+        frames = []
+        for position in range(start_position, end_position):
+            partition = self._get_partition(position)
+            frames.append(partition.loc[partition.index.intersection(order_book_ids), self.feature_list])
+        state = pd.concat(frames, keys=self.trading_dts_index[start_position: end_position], names=[self.trading_dts_index.name])
+        return state.swaplevel(0, 1).sort_index(level=[0, 1])
+
+    def history_bars_array(self, dt:datetime.datetime, bar_count:int) -> np.ndarray:
+        """
+        get the current state(feature) with look_backward_window, shape (order_book_id, bar_count, feature),
+        the instruments not alive are NaN
+        """
+        start_position, end_position = self._window(dt, bar_count)
+        return np.stack([
+            self._get_partition(position)[self.feature_list].reindex(self.order_book_ids_index).values
+            for position in range(start_position, end_position)
+        ], axis=1)
+
+    def get_last_price(self, order_book_id, dt):
+        return self._get_partition(self._trading_dt_map[dt])[self._price_column].get(order_book_id, np.nan)
+
+    def get_last_prices(self, dt, order_book_ids:List[str]=None) -> np.ndarray:
+        """the prices of order_book_ids at dt, ordered by order_book_ids_index if order_book_ids is None"""
+        price_s = self._get_partition(self._trading_dt_map[dt])[self._price_column]
+        return price_s.reindex(self.order_book_ids_index if order_book_ids is None else order_book_ids).values
+
+    def get_previous_close(self, order_book_id, dt):
+        position = self._trading_dt_map[dt]
+        if position == 0:
+            return np.nan
+        price_s = self._get_partition(position - 1)[self._price_column]
+        return price_s.get(order_book_id, np.nan)
+
+    def get_available_trading_dts(self):
+        return self.trading_dts_index
+
+    def get_available_order_book_ids(self):
+        return self.order_book_ids_index
+
+    def close(self):
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True)
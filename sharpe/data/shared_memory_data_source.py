@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+from sharpe.data.data_source import DataSource
+
+# ====================================================================== #
+# the arrays of a DataSource published once to shared memory by the      #
+# parent process, every worker attaches to the same pages instead of     #
+# unpickling its own copy of the frames                                  #
+# ====================================================================== #
+
+SHARED_ARRAYS = ("panel", "membership", "price_matrix", "prev_close_matrix")
+
+
+def create_shared_array(shape, dtype):
+    """allocate a zero filled array in a new shared memory block, return (shared_memory, array)"""
+    dtype = np.dtype(dtype)
+    shared_memory = SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    array = np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)
+    array[...] = 0
+    return shared_memory, array
+
+
+def attach_shared_array(spec):
+    """attach to the array described by spec (name, shape, dtype), return (shared_memory, array)"""
+    name, shape, dtype = spec
+    shared_memory = SharedMemory(name=name)
+    return shared_memory, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared_memory.buf)
+
+
+class SharedDataSourceHandle(object):
+    """
+    the picklable description of a DataSource published to shared memory, the publishing process owns
+    the blocks and should unlink them once every worker is done
+    """
+
+    def __init__(self, data_source:DataSource) -> None:
+        self.order_book_ids_index = data_source.order_book_ids_index
+        self.trading_dts_index = data_source.trading_dts_index
+        self.feature_list = data_source.feature_list
+        self.index_names = list(data_source.multi_index.names)
+
+        arrays = {
+            "panel": data_source.panel,
+            "membership": data_source._membership,
+            "price_matrix": data_source._price_matrix,
+            "prev_close_matrix": data_source._prev_close_matrix,
+        }
+        self.specs = {}
+        self._shared_memories = []
+        for name in SHARED_ARRAYS:
+            shared_memory, array = create_shared_array(arrays[name].shape, arrays[name].dtype)
+            array[...] = arrays[name]
+            self._shared_memories.append(shared_memory)
+            self.specs[name] = (shared_memory.name, arrays[name].shape, arrays[name].dtype)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shared_memories"] = []
+        return state
+
+    def unlink(self) -> None:
+        for shared_memory in self._shared_memories:
+            shared_memory.unlink()
+            shared_memory.close()
+        self._shared_memories = []
+
+
+class SharedMemoryDataSource(DataSource):
+    """
+    DataSource attached to the arrays of a SharedDataSourceHandle, read only and without the feature frame,
+    history_bars is rebuilt from the panel
+    """
+
+    def __init__(self, handle:SharedDataSourceHandle) -> None:
+        # keep the blocks referenced as long as the arrays live
+        self._shared_memories = []
+        arrays = {}
+        for name, spec in handle.specs.items():
+            shared_memory, arrays[name] = attach_shared_array(spec)
+            arrays[name].flags.writeable = False
+            self._shared_memories.append(shared_memory)
+
+        self._feature_dtype = arrays["panel"].dtype
+        self._price_dtype = arrays["price_matrix"].dtype
+        self._encode_order_book_ids = False
+        self._index_names = handle.index_names
+
+        self.order_book_ids_index = handle.order_book_ids_index
+        self.trading_dts_index = handle.trading_dts_index
+        self.feature_list = list(handle.feature_list)
+
+        self._trading_dt_map = {dt: i for i, dt in enumerate(self.trading_dts_index)}
+        self._order_book_id_map = {order_book_id: i for i, order_book_id in enumerate(self.order_book_ids_index)}
+
+        self._panel = arrays["panel"]
+        self._membership = arrays["membership"]
+        self._price_matrix = arrays["price_matrix"]
+        self._prev_close_matrix = arrays["prev_close_matrix"]
+        self._sliding_windows = {}
+
+    def history_bars(self, dt:datetime.datetime, bar_count:int) -> pd.DataFrame:
+        """get the current state(feature) with look_backward_window of the order_book_ids alive at dt"""
+        end_position = self.get_trading_dt_ordinal(dt) + 1
+        start_position = end_position - bar_count if end_position >= bar_count else 0
+        alive = self.get_universe(dt)
+
+        id_position, dt_position = np.nonzero(self._membership[start_position: end_position, alive].T)
+        values = self._panel[alive, start_position: end_position][id_position, dt_position]
+        index = pd.MultiIndex.from_arrays([
+            self.order_book_ids_index[alive][id_position],
+            self.trading_dts_index[start_position: end_position][dt_position]
+        ], names=self._index_names)
+        return pd.DataFrame(values, index=index, columns=self.feature_list)
@@ -7,13 +7,20 @@ import numpy as np
 from sharpe.mod.sys_simulation.event_source import SimulationEventSource
 from sharpe.core.context import Context
 from sharpe.core.events import Event, EVENT
-from sharpe.core.executor import Executor, RLExecutor
+from sharpe.core.executor import Executor, RLExecutor, INFO_DTYPE
 from sharpe.mod.sys_account import Portfolio
 from sharpe.core.strategy import Strategy
 from sharpe.mod.sys_simulation.simulation_broker import SimulationBroker
 from sharpe.mod.sys_transaction_cost.deciders import CNStockTransactionCostDecider
 from sharpe.mod.sys_tracker.tracker import Tracker 
 from sharpe.utils.plot.plot_performance import plot_performance
+from sharpe.utils.snapshot import pack_snapshot, unpack_snapshot, as_bytes_array
+
+OBS_FORMATS = ("dataframe", "padded", "numpy")
+# the bar_ordinal of the context, followed by the snapshots of the portfolio, the broker, the tracker and the
+# transaction cost deciders
+ENV_SNAPSHOT_HEADER = "q"
+
 
 class TradingEnv(gym.Env):
     
@@ -23,10 +30,24 @@ class TradingEnv(gym.Env):
                  starting_cash = {"STOCK":1000000},
                  commission_multiplier=1,
                  min_commission=5,
-                 tax_multiplier=1) -> None:
+                 tax_multiplier=1,
+                 obs_format="dataframe",
+                 fused=True) -> None:
+        """
+        :param obs_format: "dataframe", the labelled features of the alive order_book_ids;
+                           "padded", a dict of the fixed shape (order_book_id, look_backward_window, feature) float32 
+                           "features" and its bool "mask", both allocated once and refilled in place every step;
+                           "numpy", a read only view of the dense feature panel indexed by the current trading_dt and the info
+                           as a flat record(numpy structured array) refilled in place, no DataFrame is built
+        :param fused: when only the standard modules listen to the per bar events, the executor calls them directly
+                      instead of publishing every event on the bus, it falls back to the bus once a listener is added
+        """
+        if obs_format not in OBS_FORMATS:
+            raise ValueError("obs_format should be one of {}, got {}".format(OBS_FORMATS, obs_format))
         
         self.look_backward_window = look_backward_window
         self.mode = mode
+        self.obs_format = obs_format
         self.starting_cash = starting_cash
         self.commission_multiplier = commission_multiplier
         self.min_commission = min_commission
@@ -48,18 +69,19 @@ class TradingEnv(gym.Env):
         self._context.set_broker(broker)
         
         # transaction_cost decider
-        transaction_cost_decider = CNStockTransactionCostDecider(commission_multiplier=commission_multiplier, min_commission=min_commission, tax_multiplier=tax_multiplier)
+        transaction_cost_decider = CNStockTransactionCostDecider(commission_multiplier=commission_multiplier, min_commission=min_commission, tax_multiplier=tax_multiplier, context=self._context)
         self._context.set_transaction_cost_decider("CS", transaction_cost_decider)
         
         # setup account and portfolio
-        portfolio = Portfolio(starting_cash=starting_cash, init_positions={})
+        portfolio = Portfolio(starting_cash=starting_cash, init_positions={}, context=self._context)
         self._context.set_portfolio(portfolio)
         
         #setUP executor
+        info_record = np.zeros((), dtype=INFO_DTYPE) if obs_format == "numpy" else None
         if mode == "rl":
-            self._executor = RLExecutor(self._context)
+            self._executor = RLExecutor(self._context, info_record=info_record, fused=fused)
         else:
-            self._executor = Executor(self._context)
+            self._executor = Executor(self._context, info_record=info_record, fused=fused)
         
         # user strategy
         user_strategy = Strategy(self._context)
@@ -71,29 +93,169 @@ class TradingEnv(gym.Env):
         
         
         self._context.event_bus.publish_event(Event(EVENT.POST_SYSTEM_INIT))
-        self._context.update_time(calendar_dt=self._context.available_trading_dts[0], trading_dt=self._context.available_trading_dts[0])
+        # every module has subscribed, freeze the listeners for the per bar events
+        self._context.event_bus.compile()
+        self._executor.seal(owners=[broker, portfolio, tracker, user_strategy] + list(portfolio.accounts.values()),
+                            hold_excluded=[broker, user_strategy])
+        self._context.update_time(calendar_dt=self._context.available_trading_dts[0], trading_dt=self._context.available_trading_dts[0],
+                                  bar_ordinal=self._context.first_bar_ordinal)
+        self._context.start_bar_ordinal = self._context.first_bar_ordinal
+        self._context.end_bar_ordinal = self._context.last_bar_ordinal
         
         # action and observation space
         self.action_space = gym.spaces.Box(0, 1, shape=(len(data_source.order_book_ids_index),), dtype=np.float32)  # include cash
 
         # get the state space from the data min and max
-        if look_backward_window == 1:
+        if obs_format == "padded":
+            padded_shape = (len(data_source.order_book_ids_index), look_backward_window, len(data_source.feature_list))
+            self.observation_space = gym.spaces.Dict({
+                "features": gym.spaces.Box(low=-np.inf, high=np.inf, shape=padded_shape, dtype=np.float32),
+                "mask": gym.spaces.MultiBinary(padded_shape[:2]),
+            })
+            self._observation = {
+                "features": np.zeros(padded_shape, dtype=np.float32),
+                "mask": np.zeros(padded_shape[:2], dtype=bool),
+            }
+        elif look_backward_window == 1:
             self.observation_space = gym.spaces.Box(low=-np.inf, high=np.inf, shape=(len(data_source.order_book_ids_index), len(data_source.feature_list)), dtype=np.float32)
         else:
             self.observation_space = gym.spaces.Box(low=-np.inf, high=np.inf, shape=(len(data_source.order_book_ids_index), look_backward_window, len(data_source.feature_list)), dtype=np.float32)
+        
+        # reset restores it instead of rebuilding the environment
+        self._initial_snapshot = self.snapshot()
             
-    def reset(self):
-        self._context.update_time(calendar_dt=self._context.available_trading_dts[0], trading_dt=self._context.available_trading_dts[0])
-        state = Context.get_instance().history_bars()
+    def reset(self, start_dt=None, episode_length=None, seed=None):
+        """
+        :param start_dt: the first trading_dt of the episode(the latest available one not after start_dt), drawn
+                         uniformly among the ones leaving episode_length steps if None and episode_length is given,
+                         the first available trading_dt otherwise
+        :param episode_length: the number of steps of the episode, until the last available trading_dt if None
+        :param seed: seed the np_random drawing the start_dt
+        """
+        self._reset(start_dt=start_dt, episode_length=episode_length, seed=seed)
+        state = self._get_observation()
         return state
     
     def step(self, action):
-        
-        reward, is_done, info = self._executor.send(action)
+        """
+        :param action: the list of orders(see the order api), None to hold the positions, or an array of the target
+                       weights of the available order_book_ids, matched as one batch without Order objects
+        """
+        reward, is_done, info = self._step(action)
         #pdb.set_trace()
-        next_state = Context.get_instance().history_bars()
+        next_state = self._get_observation()
         return next_state, reward, is_done, info
     
+    def step_many(self, action, n_bars):
+        """
+        take action at the current bar then hold the positions for the following n_bars - 1 bars, without building
+        the intermediate observations, stop at the last bar
+        :return: the observation after the span, the compounded reward of the span, is_done and the info of the
+                 last bar with the profit_and_loss of the span
+        """
+        if n_bars < 1:
+            raise ValueError("n_bars should be at least 1, got {}".format(n_bars))
+        self._context.activate()
+        reward, is_done, info = self._executor.send_many(action, n_bars)
+        next_state = self._get_observation()
+        return next_state, reward, is_done, info
+    
+    def skip_until(self, dt, action=None):
+        """step_many from the current bar until dt is the current trading_dt(the latest trading_dt not after dt)"""
+        n_bars = self._context.data_source.get_trading_dt_ordinal(dt) - self._context.bar_ordinal
+        if n_bars < 1:
+            raise ValueError("{} is not after the current trading_dt {}".format(dt, self._context.trading_dt))
+        return self.step_many(action, n_bars)
+    
+    def snapshot(self) -> bytes:
+        """
+        a compact binary snapshot of the clock, the portfolio(accounts and positions), the open orders and turnover
+        of the broker, the tracker buffers and the commissions left of the deciders, see restore
+        """
+        context = self._context
+        return pack_snapshot(ENV_SNAPSHOT_HEADER, (context.bar_ordinal,),
+                             as_bytes_array(context.portfolio.get_snapshot()),
+                             as_bytes_array(context.broker.get_snapshot()),
+                             as_bytes_array(context.tracker.get_snapshot()),
+                             *(as_bytes_array(decider.get_snapshot()) for decider in context.get_transaction_cost_deciders()))
+    
+    def restore(self, snapshot:bytes) -> None:
+        """
+        restore a snapshot of this environment, the tracker buffers are truncated to their lengths in snapshot,
+        so it should be taken earlier in the current episode
+        """
+        context = self._context
+        deciders = context.get_transaction_cost_deciders()
+        (bar_ordinal,), (portfolio_snapshot, broker_snapshot, tracker_snapshot, *decider_snapshots) = unpack_snapshot(
+            ENV_SNAPSHOT_HEADER, snapshot, *([np.uint8] * (3 + len(deciders)))
+        )
+        context.activate()
+        trading_dt = context.data_source.get_available_trading_dts()[bar_ordinal]
+        context.update_time(calendar_dt=trading_dt, trading_dt=trading_dt, bar_ordinal=bar_ordinal)
+        context.portfolio.set_snapshot(portfolio_snapshot)
+        context.broker.set_snapshot(broker_snapshot)
+        context.tracker.set_snapshot(tracker_snapshot)
+        for decider, decider_snapshot in zip(deciders, decider_snapshots):
+            decider.set_snapshot(decider_snapshot)
+    
+    def _reset(self, start_dt=None, episode_length=None, seed=None):
+        if seed is not None:
+            super(TradingEnv, self).reset(seed=seed)
+        self.restore(self._initial_snapshot)
+        
+        if episode_length is not None and episode_length < 1:
+            raise ValueError("episode_length should be at least 1, got {}".format(episode_length))
+        context = self._context
+        # the executors only compare the bar_ordinal with end_bar_ordinal, a window costs nothing to set up
+        first_bar_ordinal, last_bar_ordinal = context.first_bar_ordinal, context.last_bar_ordinal
+        get_end_bar_ordinal = self._executor.get_end_bar_ordinal
+        if start_dt is not None:
+            start_bar_ordinal = context.data_source.get_trading_dt_ordinal(start_dt)
+        elif episode_length is not None:
+            last_start_bar_ordinal = last_bar_ordinal - (get_end_bar_ordinal(first_bar_ordinal, episode_length) - first_bar_ordinal)
+            if last_start_bar_ordinal < first_bar_ordinal:
+                raise ValueError("there are less than {} steps in the available trading_dts".format(episode_length))
+            start_bar_ordinal = int(self.np_random.integers(first_bar_ordinal, last_start_bar_ordinal + 1))
+        else:
+            start_bar_ordinal = first_bar_ordinal
+        end_bar_ordinal = last_bar_ordinal if episode_length is None else get_end_bar_ordinal(start_bar_ordinal, episode_length)
+        
+        if start_bar_ordinal < first_bar_ordinal or start_bar_ordinal > last_bar_ordinal:
+            raise ValueError("start_dt {} is out of the available trading_dts".format(start_dt))
+        if end_bar_ordinal > last_bar_ordinal or end_bar_ordinal < get_end_bar_ordinal(start_bar_ordinal, 1):
+            raise ValueError("an episode of {} steps from {} is out of the available trading_dts".format(
+                episode_length, context.data_source.get_available_trading_dts()[start_bar_ordinal]))
+        
+        start_trading_dt = context.data_source.get_available_trading_dts()[start_bar_ordinal]
+        context.update_time(calendar_dt=start_trading_dt, trading_dt=start_trading_dt, bar_ordinal=start_bar_ordinal)
+        context.start_bar_ordinal = start_bar_ordinal
+        context.end_bar_ordinal = end_bar_ordinal
+    
+    def _step(self, action):
+        # the order api called between steps uses the context of the latest stepped env
+        self._context.activate()
+        return self._executor.send(action)
+    
+    def _get_observation(self):
+        if self.obs_format == "padded":
+            self._context.data_source.history_bars_padded(dt=self._context.trading_dt,
+                                                          bar_count=self.look_backward_window,
+                                                          out=self._observation["features"],
+                                                          mask=self._observation["mask"])
+            return self._observation
+        elif self.obs_format == "numpy":
+            state = self._context.history_bars_window()
+            state = state[:, 0, :] if self.look_backward_window == 1 else state
+            # whatever the data source, the observation must not be written in place, copy it to modify it
+            state.flags.writeable = False
+            return state
+        return self._context.history_bars()
+    
+    @property
+    def context(self):
+        """the Context of this environment, pass it to the order api when several environments live in one process"""
+        return self._context
+    
     @property
     def trading_dt(self):
         return self._context.trading_dt
@@ -109,12 +271,122 @@ class TradingEnv(gym.Env):
         else:
             returns_list = self._context.tracker._portfolio_current_bar_returns.copy()
         #pdb.set_trace()
-        index = self._context.available_trading_dts
+        start = self._context.start_bar_ordinal
+        index = self._context.data_source.get_available_trading_dts()[start: start + len(returns_list)]
         returns = pd.DataFrame(returns_list, index=index,columns=["unit_net_value"])
         unit_net_value = (returns + 1).cumprod()
             
         plot_performance(unit_net_value, auto_open=auto_open)
     
+class VectorTradingEnv(gym.Env):
+    """
+    N independent portfolios(TradingEnv) stepped in lock-step over one shared data_source, the action is a
+    (N, order_book_id) array of target weights, the observation of the environments at the same trading_dt is
+    computed once and shared
+    """
+    
+    def __init__(self, data_source,
+                 num_envs,
+                 look_backward_window=1,
+                 mode="non-rl",
+                 starting_cash={"STOCK":1000000},
+                 commission_multiplier=1,
+                 min_commission=5,
+                 tax_multiplier=1,
+                 obs_format="numpy") -> None:
+        """
+        :param obs_format: "numpy" or "padded", see TradingEnv, the observations are stacked along a leading env axis
+        """
+        if obs_format not in ("numpy", "padded"):
+            raise ValueError("obs_format should be numpy or padded, got {}".format(obs_format))
+        
+        self.num_envs = num_envs
+        self.obs_format = obs_format
+        self.envs = [TradingEnv(data_source=data_source,
+                                look_backward_window=look_backward_window,
+                                mode=mode,
+                                starting_cash=starting_cash,
+                                commission_multiplier=commission_multiplier,
+                                min_commission=min_commission,
+                                tax_multiplier=tax_multiplier,
+                                obs_format=obs_format) for _ in range(num_envs)]
+        self.order_book_ids = data_source.get_available_order_book_ids()
+        
+        single_env = self.envs[0]
+        self.action_space = gym.spaces.Box(0, 1, shape=(num_envs, len(self.order_book_ids)), dtype=np.float32)
+        if obs_format == "padded":
+            self.observation_space = gym.spaces.Dict({
+                key: self._batch_space(space) for key, space in single_env.observation_space.spaces.items()
+            })
+        else:
+            self.observation_space = self._batch_space(single_env.observation_space)
+        self._dones = np.zeros(num_envs, dtype=bool)
+        # the last info of every environment, returned again once it is done
+        self._infos = [None] * num_envs
+    
+    def _batch_space(self, space):
+        if isinstance(space, gym.spaces.MultiBinary):
+            return gym.spaces.MultiBinary((self.num_envs,) + tuple(space.shape))
+        return gym.spaces.Box(low=-np.inf, high=np.inf, shape=(self.num_envs,) + space.shape, dtype=space.dtype)
+    
+    @property
+    def contexts(self):
+        return [env.context for env in self.envs]
+    
+    def reset(self, start_dt=None, episode_length=None, seed=None):
+        """
+        see TradingEnv.reset, the environment i is seeded with seed + i so that the random windows differ
+        """
+        for i, env in enumerate(self.envs):
+            env._reset(start_dt=start_dt, episode_length=episode_length, seed=None if seed is None else seed + i)
+        self._dones[:] = False
+        self._infos = [None] * self.num_envs
+        return self._get_observations()
+    
+    def step(self, actions):
+        """
+        :param actions: (N, order_book_id) target weights, None to hold the positions of every environment
+        :return: the stacked observations, the (N,) rewards and dones, and the list of infos,
+                 an environment already done is not stepped: it keeps its last observation and info, its reward is 0
+                 and it stays done until reset
+        """
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        if actions is not None:
+            actions = np.asarray(actions, dtype=np.float64)
+        for i, env in enumerate(self.envs):
+            if self._dones[i]:
+                continue
+            action = None if actions is None else actions[i]
+            rewards[i], self._dones[i], info = env._step(action)
+            self._infos[i] = info if env.obs_format != "numpy" else info.copy()
+        return self._get_observations(), rewards, self._dones.copy(), list(self._infos)
+    
+    def _get_observations(self):
+        # the environments are grouped by trading_dt, one observation is computed per group
+        groups = {}
+        for i, env in enumerate(self.envs):
+            groups.setdefault(env.trading_dt, []).append(i)
+        
+        if len(groups) == 1:
+            state = self.envs[0]._get_observation()
+            if self.obs_format == "padded":
+                return {key: np.broadcast_to(value, (self.num_envs,) + value.shape) for key, value in state.items()}
+            return np.broadcast_to(state, (self.num_envs,) + state.shape)
+        
+        observations = None
+        for indexes in groups.values():
+            state = self.envs[indexes[0]]._get_observation()
+            if self.obs_format == "padded":
+                if observations is None:
+                    observations = {key: np.empty((self.num_envs,) + value.shape, dtype=value.dtype) for key, value in state.items()}
+                for key, value in state.items():
+                    observations[key][indexes] = value
+            else:
+                if observations is None:
+                    observations = np.empty((self.num_envs,) + state.shape, dtype=state.dtype)
+                observations[indexes] = state
+        return observations
+    
 if __name__ == "__main__":
     from sharpe.utils.mock_data import create_toy_feature
     from sharpe.data.data_source import DataSource
@@ -124,16 +396,15 @@ if __name__ == "__main__":
     
     env= TradingEnv(data_source=data_source, look_backward_window=2)
     print('--------------------------------------------')
-    from sharpe.core.context import Context
-    print("current context \n",Context.get_instance().__dict__)
+    print("current context \n",env.context.__dict__)
     
     
     from sharpe.mod.sys_account.api.api import order_target_portfolio
-    to_submit_orders = order_target_portfolio({"000001.XSHE":0.5})
+    to_submit_orders = order_target_portfolio({"000001.XSHE":0.5}, context=env.context)
     
     state, reward, is_done, info = env.step(action=to_submit_orders)
     print(state, reward, is_done)
-    to_submit_orders2 = order_target_portfolio({"000001.XSHE":0.2})
+    to_submit_orders2 = order_target_portfolio({"000001.XSHE":0.2}, context=env.context)
     state, reward, is_done, info = env.step(action=to_submit_orders2)
     print(state, reward, is_done)
             
@@ -24,4 +24,56 @@ class AbstractBroker(with_metaclass(abc.ABCMeta)):
     def get_open_orders(self, order_book_id=None):
         """
         """
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+class AbstractDataSource(with_metaclass(abc.ABCMeta)):
+    """
+    DataSource Abstract Interface
+    
+    Provide the features and prices the executor touches bar by bar
+    """
+
+    @abc.abstractmethod
+    def history_bars(self, dt, bar_count):
+        """
+        the features of the alive order_book_ids within the look_backward_window ending at dt
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_last_price(self, order_book_id, dt):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_previous_close(self, order_book_id, dt):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_available_trading_dts(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_available_order_book_ids(self):
+        raise NotImplementedError
+
+    def instrument_type(self, order_book_id):
+        return "CS" # common stock
+
+    # ordinal based access, the bar_ordinal is the position in get_available_trading_dts,
+    # the data sources backed by arrays override them with a plain indexing
+
+    def get_trading_dt_ordinal(self, dt):
+        """the position of the latest trading_dt not after dt"""
+        return self.get_available_trading_dts().searchsorted(dt, side="right") - 1
+
+    def get_last_price_at(self, order_book_id, bar_ordinal):
+        return self.get_last_price(order_book_id, self.get_available_trading_dts()[bar_ordinal])
+
+    def get_last_prices_at(self, bar_ordinal, order_book_ids=None):
+        return self.get_last_prices(self.get_available_trading_dts()[bar_ordinal], order_book_ids)
+
+    def get_previous_close_at(self, order_book_id, bar_ordinal):
+        return self.get_previous_close(order_book_id, self.get_available_trading_dts()[bar_ordinal])
+
+    def history_bars_window_at(self, bar_ordinal, bar_count):
+        return self.history_bars_window(self.get_available_trading_dts()[bar_ordinal], bar_count)
@@ -1,25 +1,33 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import six
-from itertools import chain
+import numpy as np
 from typing import Dict, List,Tuple, Optional, Union, Iterable
 from sharpe.const import POSITION_DIRECTION, POSITION_EFFECT
 from sharpe.core.events import EVENT
 from sharpe.core.context import Context
 
-from sharpe.mod.sys_account.position import Position, PositionProxyDict
+from sharpe.utils.snapshot import pack_snapshot, unpack_snapshot
+from sharpe.mod.sys_account.position import (
+    Position, PositionBook, PositionProxyDict, POSITION_SNAPSHOT_DTYPE, POSITION_BOOK_AGGREGATES
+)
+
+# total_cash, frozen_cash, then the running totals of the book(POSITION_BOOK_AGGREGATES) so that a restored account
+# carries on with the same sums
+ACCOUNT_SNAPSHOT_HEADER = "dd" + "d" * len(POSITION_BOOK_AGGREGATES)
 
 class Account:
     """
     Account whicn contain all positions and cash.
     """
 
-    def __init__(self, type:str, total_cash:float, init_positions:Dict[str, int]={}) -> None:
+    def __init__(self, type:str, total_cash:float, init_positions:Dict[str, int]={}, context:Context=None) -> None:
 
+        self._context = context or Context.get_instance()
         self._type = type
         self._total_cash = total_cash 
 
-        self._positions = {}
+        # the positions of the available order_book_ids of the data_source
+        self._book = PositionBook(self._context.data_source.get_available_order_book_ids(), self._context)
         self._backward_trade_set = set()
         self._frozen_cash = 0
 
@@ -31,19 +39,17 @@ class Account:
 
     def __repr__(self):
         positions_repr = {}
-        for order_book_id, positions in self._positions.items():
-            for direction, position in positions.items():
-                if position.quantity != 0:
-                    positions_repr.setdefault(order_book_id, {})[direction.value] = position.quantity
+        for position in self._iter_pos():
+            if position.quantity != 0:
+                positions_repr.setdefault(position.order_book_id, {})[position.direction.value] = position.quantity
         return "Account(cash={}, total_value={}, positions={})".format(
             self.cash, self.total_value, positions_repr
         )
 
     def register_event(self):
-        event_bus = Context.get_instance().event_bus
-        event_bus.add_listener(
-            EVENT.TRADE, lambda e: self.apply_trade(e.trade, e.order) if e.account == self else None
-        )
+        event_bus = self._context.event_bus
+        event_bus.add_listener(EVENT.TRADE, self._on_trade)
+        event_bus.add_listener(EVENT.FILL_BATCH, self._on_fill_batch)
         event_bus.add_listener(EVENT.ORDER_PENDING_NEW, self._on_order_pending_new)
         event_bus.add_listener(EVENT.ORDER_CREATION_REJECT, self._on_order_unsolicited_update)
         event_bus.add_listener(EVENT.ORDER_UNSOLICITED_UPDATE, self._on_order_unsolicited_update)
@@ -60,7 +66,7 @@ class Account:
                 order_book_id: {
                     POSITION_DIRECTION.LONG: positions[POSITION_DIRECTION.LONG].get_state(),
                     POSITION_DIRECTION.SHORT: positions[POSITION_DIRECTION.SHORT].get_state()
-                } for order_book_id, positions in self._positions.items()
+                } for order_book_id, positions in self._get_position_dict().items()
             },
             'frozen_cash': self._frozen_cash,
             "total_cash": self._total_cash,
@@ -72,7 +78,7 @@ class Account:
         self._backward_trade_set = set(state['backward_trade_set'])
         self._total_cash = state["total_cash"]
 
-        self._positions.clear()
+        self._book.clear()
         for order_book_id, positions_state in state['positions'].items():
             for direction in POSITION_DIRECTION:
                 position = self._get_or_create_pos(order_book_id, direction)
@@ -81,6 +87,35 @@ class Account:
                 else:
                     position.set_state(positions_state[direction.lower()])
 
+    def get_snapshot(self) -> bytes:
+        """the binary counterpart of get_state: a header, the position records and the backward trade exec_ids"""
+        book = self._book
+        ordinals = book.get_alive_ordinals()
+        # the long record of an order_book_id then the short one
+        records = np.zeros(2 * len(ordinals), dtype=POSITION_SNAPSHOT_DTYPE)
+        records["ordinal"] = np.repeat(ordinals, 2)
+        records["direction"] = np.tile([0, 1], len(ordinals))
+        for name in POSITION_SNAPSHOT_DTYPE.names[2:]:
+            records[name] = getattr(book, name)[:, ordinals].ravel(order="F")
+        exec_ids = np.fromiter(self._backward_trade_set, dtype=np.int64, count=len(self._backward_trade_set))
+        totals = book.get_totals()
+        header = (self._total_cash, self._frozen_cash) + tuple(totals[name] for name in POSITION_BOOK_AGGREGATES)
+        return pack_snapshot(ACCOUNT_SNAPSHOT_HEADER, header, records, exec_ids)
+
+    def set_snapshot(self, snapshot) -> None:
+        header, (records, exec_ids) = unpack_snapshot(ACCOUNT_SNAPSHOT_HEADER, snapshot, POSITION_SNAPSHOT_DTYPE, np.int64)
+        self._total_cash, self._frozen_cash = header[:2]
+        self._backward_trade_set = set(exec_ids.tolist())
+
+        book = self._book
+        book.clear()
+        ordinals = records["ordinal"]
+        directions = records["direction"]
+        for name in POSITION_SNAPSHOT_DTYPE.names[2:]:
+            getattr(book, name)[directions, ordinals] = records[name]
+        book.alive[ordinals] = True
+        book.reset_aggregates(dict(zip(POSITION_BOOK_AGGREGATES, header[2:])))
+
     def fast_forward(self, orders=None, trades=None):
         if trades:
             close_trades = []
@@ -115,20 +150,37 @@ class Account:
         :param direction: position direction
         """
         try:
-            return self._positions[order_book_id][direction]
+            ordinal = self._book.get_ordinal(order_book_id)
         except KeyError:
-            return Position(order_book_id, direction)
+            ordinal = None
+        if ordinal is None or not self._book.alive[ordinal]:
+            return Position(order_book_id, direction, context=self._context)
+        return self._book.get_view(ordinal, direction)
+
+    def get_long_quantities(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        the ordinals(in the available order_book_ids) and the quantities of the long positions, read from the book
+        without the Position views
+        """
+        book = self._book
+        ordinals = book.get_alive_ordinals()
+        return ordinals, book.old_quantity[0, ordinals] + book.today_quantity[0, ordinals]
 
     def calc_close_today_amount(self, order_book_id, trade_amount, position_direction):
-        return self._get_or_create_pos(order_book_id, position_direction).calc_close_today_amount(trade_amount)
+        return self.get_position(order_book_id, position_direction).calc_close_today_amount(trade_amount)
 
     @property
     def type(self):
         return self._type
 
+    @property
+    def version(self):
+        """changes with every trade, price update and settlement of the account"""
+        return self._book.version, self._total_cash, self._frozen_cash
+
     @property
     def positions(self):
-        return PositionProxyDict(self._positions)
+        return PositionProxyDict(self._get_position_dict(), self._context)
 
     @property
     def frozen_cash(self) -> float:
@@ -150,14 +202,14 @@ class Account:
         """
         [float] market value
         """
-        return sum(p.market_value * (1 if p.direction == POSITION_DIRECTION.LONG else -1) for p in self._iter_pos())
+        return self._book.get_market_value()
 
     @property
     def transaction_cost(self):
         """
         total transaction cost and fee
         """
-        return sum(p.transaction_cost for p in self._iter_pos())
+        return self._book.get_transaction_cost()
 
     @property
     def margin(self):
@@ -165,21 +217,22 @@ class Account:
         """
         total margin
         """
-        return sum(p.margin for p in self._iter_pos())
+        # the positions of the book take no margin(Position.margin)
+        return 0
 
     @property
     def buy_margin(self):
         """
         buy margin
         """
-        return sum(p.margin for p in self._iter_pos(POSITION_DIRECTION.LONG))
+        return 0
 
     @property
     def sell_margin(self):
         """
         sell margin
         """
-        return sum(p.margin for p in self._iter_pos(POSITION_DIRECTION.SHORT))
+        return 0
 
     @property
     def daily_pnl(self):
@@ -193,7 +246,7 @@ class Account:
         """
         total equity value
         """
-        return sum(p.equity for p in self._iter_pos())
+        return self._book.get_equity()
 
     @property
     def total_value(self):
@@ -216,7 +269,7 @@ class Account:
         """
         position pnl
         """
-        return sum(p.position_pnl for p in self._iter_pos())
+        return self._book.get_position_pnl()
 
     @property
     def trading_pnl(self):
@@ -224,38 +277,33 @@ class Account:
         """
         trading pnl
         """
-        return sum(p.trading_pnl for p in self._iter_pos())
+        return self._book.get_trading_pnl()
 
     def _on_before_trading(self, _):
-        trading_date = Context.get_instance().trading_dt.date()
-        for position in self._iter_pos():
-            self._total_cash += position.before_trading(trading_date)
+        self._total_cash += self._book.before_trading()
 
     def _on_settlement(self, event):
-        trading_date = Context.get_instance().trading_dt.date()
-
-        for order_book_id, positions in list(self._positions.items()):
-            for position in six.itervalues(positions):
-                #print(trading_date)
-                #print(position)
-                delta_cash = position.settlement(trading_date)
-                #print(delta_cash)
-                self._total_cash += delta_cash
-
-        for order_book_id, positions in list(self._positions.items()):
-            if all(p.quantity == 0 and p.equity == 0 for p in six.itervalues(positions)):
-                del self._positions[order_book_id]
+        # settle the positions and remove the empty ones
+        self._total_cash += self._book.settlement()
 
         self._backward_trade_set.clear()
 
         # if total_value <= 0, forced_liquidation
         forced_liquidation = True#Environment.get_instance().config.base.forced_liquidation
         if self.total_value <= 0 and forced_liquidation:
-            if self._positions:
+            if self._book.alive.any():
                 print("Trigger Forced Liquidation, current total_value is 0")
-            self._positions.clear()
+            self._book.clear()
             self._total_cash = 0
 
+    def _on_trade(self, event):
+        if event.account is self:
+            self.apply_trade(event.trade, event.order)
+
+    def _on_fill_batch(self, event):
+        if event.account is self:
+            self.apply_fill_batch(event.fill_batch)
+
     def _on_order_pending_new(self, event):
         if event.account != self:
             return
@@ -293,40 +341,61 @@ class Account:
             self._total_cash += delta_cash
         self._backward_trade_set.add(trade.exec_id)
 
+    def apply_fill_batch(self, fill_batch) -> None:
+        """apply the fills of a batch in order, the positive quantities open long positions and the negative close them"""
+        ordinals = fill_batch.ordinals
+        if len(np.unique(ordinals)) == len(ordinals):
+            # one fill per position, all the positions at once, the cash in the order of the fills
+            delta_cashes = self._book.apply_long_fills(ordinals, fill_batch.quantities, fill_batch.prices, fill_batch.transaction_costs)
+            for delta_cash in delta_cashes.tolist():
+                self._total_cash += delta_cash
+            return
+        rows = zip(fill_batch.order_book_ids, fill_batch.quantities.tolist(), fill_batch.prices.tolist(),
+                   fill_batch.transaction_costs.tolist())
+        for order_book_id, quantity, price, transaction_cost in rows:
+            position = self._get_or_create_pos(order_book_id, POSITION_DIRECTION.LONG)
+            if quantity > 0:
+                self._total_cash += position.apply_fill(POSITION_EFFECT.OPEN, price, quantity, transaction_cost)
+            else:
+                self._total_cash += position.apply_fill(POSITION_EFFECT.CLOSE, price, -quantity, transaction_cost)
+
     def _iter_pos(self, direction=None):
         # type: (Optional[POSITION_DIRECTION]) -> Iterable[Position]
-        if direction:
-            return (p[direction] for p in six.itervalues(self._positions))
-        else:
-            return chain(*[six.itervalues(p) for p in six.itervalues(self._positions)])
+        return self._book.iter_views(direction)
+
+    def _get_position_dict(self):
+        # type: () -> Dict[str, Dict[POSITION_DIRECTION, Position]]
+        return {
+            self._book.order_book_ids[ordinal]: {
+                direction: self._book.get_view(ordinal, direction) for direction in (POSITION_DIRECTION.LONG, POSITION_DIRECTION.SHORT)
+            } for ordinal in self._book.get_alive_ordinals().tolist()
+        }
 
     def _get_or_create_pos(self, order_book_id, direction, init_quantity=0):
         # type: (str, Union[str, POSITION_DIRECTION], Optional[int]) -> Position
-        if order_book_id not in self._positions:
-            if direction == POSITION_DIRECTION.LONG:
-                long_init_position, short_init_position = init_quantity, 0
-            else:
-                long_init_position, short_init_position = 0, init_quantity
-
-            positions = self._positions.setdefault(order_book_id, {
-                POSITION_DIRECTION.LONG: Position(order_book_id, POSITION_DIRECTION.LONG, long_init_position),
-                POSITION_DIRECTION.SHORT: Position(order_book_id, POSITION_DIRECTION.SHORT, short_init_position)
-            })
-        else:
-            positions = self._positions[order_book_id]
-        return positions[direction]
+        book = self._book
+        try:
+            ordinal = book.get_ordinal(order_book_id)
+        except KeyError:
+            raise ValueError("{} is not an order_book_id of the data source, the account can not hold it".format(order_book_id))
+        if not book.alive[ordinal]:
+            book.alive[ordinal] = True
+            book.old_quantity[1 if direction == POSITION_DIRECTION.SHORT else 0, ordinal] = init_quantity
+            book.touch(ordinal)
+        return book.get_view(ordinal, direction)
 
     def _update_last_price(self, _):
-        context = Context.get_instance()
-        #print("_update_last_price", context.trading_dt)
-        for order_book_id, positions in self._positions.items():
-            price = context.get_last_price(order_book_id)
-            if price == price:
-                for position in six.itervalues(positions):
-                    #print("before update last price \n {}".format(position))
-                    position.update_last_price(price)
-                    #print("current price:{} of {} \n after update,position {}".format(price, order_book_id, position))
-        #print(context.portfolio)
+        # mark to market: one gather of the current price row for the held ordinals, the NaN prices are skipped
+        book = self._book
+        ordinals = book.get_alive_ordinals()
+        if len(ordinals) == 0:
+            return
+        prices = self._context.get_last_prices()[ordinals]
+        # NaN compares False, only the changed prices update the aggregates
+        is_changed = (prices == prices) & ((book.last_price[:, ordinals] != prices).any(axis=0))
+        ordinals = ordinals[is_changed]
+        book.last_price[:, ordinals] = prices[is_changed]
+        book.update(ordinals)
 
     def _frozen_cash_of_order(self, order):
         #context = Context.get_instance()
@@ -340,12 +409,14 @@ class Account:
     
     def get_current_trading_dt_total_value(self):
         # this method is stateless operation
-        total_equity = 0
-        for p in self._iter_pos():
-            if p.quantity !=0:
-                price = Context.get_instance().get_last_price(p.order_book_id)
-                total_equity += price * p.quantity
-        return self._total_cash + total_equity
+        book = self._book
+        ordinals = book.get_alive_ordinals()
+        quantities = book.quantity[:, ordinals]
+        is_held = quantities != 0
+        if not is_held.any():
+            return self._total_cash
+        equities = self._context.get_last_prices()[ordinals] * quantities
+        return self._total_cash + float(equities[is_held].sum())
     
     
     
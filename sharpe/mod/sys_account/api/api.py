@@ -5,7 +5,7 @@ import math
 import numpy as np
 from decimal import Decimal, getcontext
 from itertools import chain
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 from sharpe.core.context import Context
 from sharpe.const import (DEFAULT_ACCOUNT_TYPE, ORDER_TYPE, POSITION_DIRECTION,
                            POSITION_EFFECT, SIDE)
@@ -37,15 +37,16 @@ def cal_style(price, style):
 
     return LimitOrder(price)
 
-def _get_account_position_ins(order_book_id):
-    account = Context.get_instance().portfolio.accounts[DEFAULT_ACCOUNT_TYPE.STOCK]
+def _get_account_position_ins(order_book_id, context):
+    account = context.portfolio.accounts[DEFAULT_ACCOUNT_TYPE.STOCK]
     position = account.get_position(order_book_id, POSITION_DIRECTION.LONG)
     return account, position
 
 
-def is_cash_enough(order, account, warn=True):
+def is_cash_enough(order, account, warn=True, context=None):
+    context = context or Context.get_instance()
     order_cost = order.frozen_price*order.quantity #instrument.calc_cash_occupation(order.frozen_price, order.quantity, order.position_direction)
-    order_cost += Context.get_instance().get_order_transaction_cost(order)
+    order_cost += context.get_order_transaction_cost(order)
     if order_cost <= account.cash:
         return True
     if warn:
@@ -61,7 +62,7 @@ def _get_ksh_amount(amount):
     return 0 if abs(amount) < KSH_MIN_AMOUNT else amount // 1
 
 
-def get_positions() -> List[Position]:
+def get_positions(context:Context=None) -> List[Position]:
     """
     get all available positions，
     :example:
@@ -71,29 +72,29 @@ def get_positions() -> List[Position]:
         [BookingPosition({'order_book_id': '000014.XSHE', 'quantity': 100, 'direction': POSITION_DIRECTION.LONG, 'old_quantity': 0, 'trading_pnl': 1.0, 'avg_price': 9.56, 'last_price': 0, 'position_pnl': 0.0}),
          BookingPosition({'order_book_id': '000010.XSHE', 'quantity': 100, 'direction': POSITION_DIRECTION.LONG, 'old_quantity': 0, 'trading_pnl': 0.0, 'avg_price': 3.09, 'last_price': 0, 'position_pnl': 0.0})]
     """
-    portfolio = Context.get_instance().portfolio
+    portfolio = (context or Context.get_instance()).portfolio
     return portfolio.get_positions()
 
-def get_position(order_book_id:str, direction:POSITION_DIRECTION=POSITION_DIRECTION.LONG) -> Position:
+def get_position(order_book_id:str, direction:POSITION_DIRECTION=POSITION_DIRECTION.LONG, context:Context=None) -> Position:
 
     """
     get the position object from one specific order_book_id，
     :param order_book_id: 
     :param direction:
+    :param context: the context of the environment, the current one if None
     :example:
     ..  code-block:: python3
         [In] get_position('000014.XSHE','long_positions")
         [Out]
         [BookingPosition({'order_book_id': '000014.XSHE', 'quantity': 100, 'direction': POSITION_DIRECTION.LONG, 'old_quantity': 0, 'trading_pnl': 1.0, 'avg_price': 9.56, 'last_price': 0, 'position_pnl': 0.0})]
     """
-    portfolio = Context.get_instance().portfolio
+    portfolio = (context or Context.get_instance()).portfolio
     return portfolio.get_position(order_book_id, direction)
 
 
-def _submit_order(order_book_id, amount, side, position_effect, style, quantity, auto_switch_order_value):
+def _submit_order(order_book_id, amount, side, position_effect, style, quantity, auto_switch_order_value, context):
     # param: amount: the target quantity of this order
     # param: quantity: the quantity of exist position of order_book_id
-    context = Context.get_instance()
     if isinstance(style, LimitOrder):
         if not is_valid_price(style.get_limit_price()):
             raise RuntimeError((u"Limit order price should be positive"))
@@ -111,23 +112,22 @@ def _submit_order(order_book_id, amount, side, position_effect, style, quantity,
     if amount == 0:
         print("Order Creation Failed: 0 order quantity, order_book_id={order_book_id}").format(order_book_id=order_book_id)
         return
-    order = Order.__from_create__(order_book_id, abs(amount), side, style, position_effect)
+    order = Order.__from_create__(order_book_id, abs(amount), side, style, position_effect, context=context)
     if order.type == ORDER_TYPE.MARKET:
         order.set_frozen_price(price)
     if side == SIDE.BUY and auto_switch_order_value:
-        account, position = _get_account_position_ins(order_book_id)
-        if not is_cash_enough(order, account):
+        account, position = _get_account_position_ins(order_book_id, context)
+        if not is_cash_enough(order, account, context=context):
             print("insufficient cash, use all remaining cash({}) to create order").format(account.cash)
-            return _order_value(account, position, order_book_id, account.cash, style)
+            return _order_value(account, position, order_book_id, account.cash, style, context)
     return order
 
-def _order_shares(order_book_id, amount, style, quantity, auto_switch_order_value):
+def _order_shares(order_book_id, amount, style, quantity, auto_switch_order_value, context):
     side, position_effect = (SIDE.BUY, POSITION_EFFECT.OPEN) if amount > 0 else (SIDE.SELL, POSITION_EFFECT.CLOSE)
-    return _submit_order(order_book_id, amount, side, position_effect, style, quantity, auto_switch_order_value)
+    return _submit_order(order_book_id, amount, side, position_effect, style, quantity, auto_switch_order_value, context)
 
 
-def _order_value(account, position, order_book_id, cash_amount, style):
-    context = Context.get_instance()
+def _order_value(account, position, order_book_id, cash_amount, style, context):
     if cash_amount > 0:
         cash_amount = min(cash_amount, account.cash)
     if isinstance(style, LimitOrder):
@@ -145,7 +145,7 @@ def _order_value(account, position, order_book_id, cash_amount, style):
         amount = int(Decimal(amount) / Decimal(round_lot)) * round_lot
         while amount > 0:
             expected_transaction_cost = context.get_order_transaction_cost(Order.__from_create__(
-                order_book_id, amount, SIDE.BUY, LimitOrder(price), POSITION_EFFECT.OPEN
+                order_book_id, amount, SIDE.BUY, LimitOrder(price), POSITION_EFFECT.OPEN, context=context
             ))
             if amount * price + expected_transaction_cost <= cash_amount:
                 break
@@ -157,38 +157,43 @@ def _order_value(account, position, order_book_id, cash_amount, style):
     if amount < 0:
         amount = max(amount, -position.closable)
 
-    return _order_shares(order_book_id, amount, style, position.quantity, auto_switch_order_value=False)
+    return _order_shares(order_book_id, amount, style, position.quantity, auto_switch_order_value=False, context=context)
 
-def order_value(order_book_id, cash_amount, price=None, style=None):
-    account, position = _get_account_position_ins(order_book_id)
-    return _order_value(account, position, order_book_id, cash_amount, cal_style(price, style))
+def order_value(order_book_id, cash_amount, price=None, style=None, context=None):
+    context = context or Context.get_instance()
+    account, position = _get_account_position_ins(order_book_id, context)
+    return _order_value(account, position, order_book_id, cash_amount, cal_style(price, style), context)
 
-def order_target_value(order_book_id, cash_amount, price=None, style=None):
-    account, position = _get_account_position_ins(order_book_id)
+def order_target_value(order_book_id, cash_amount, price=None, style=None, context=None):
+    context = context or Context.get_instance()
+    account, position = _get_account_position_ins(order_book_id, context)
     if cash_amount == 0:
         return _submit_order(order_book_id, position.closable, SIDE.SELL, POSITION_EFFECT.CLOSE, cal_style(price, style),
-                             position.quantity, False)
-    return _order_value(account, position, order_book_id, cash_amount - position.market_value, cal_style(price, style))
+                             position.quantity, False, context)
+    return _order_value(account, position, order_book_id, cash_amount - position.market_value, cal_style(price, style), context)
 
-def order_percent(order_book_id, percent, price=None, style=None):
-    account, position = _get_account_position_ins(order_book_id)
-    return _order_value(account, position, order_book_id, account.total_value * percent, cal_style(price, style))
+def order_percent(order_book_id, percent, price=None, style=None, context=None):
+    context = context or Context.get_instance()
+    account, position = _get_account_position_ins(order_book_id, context)
+    return _order_value(account, position, order_book_id, account.total_value * percent, cal_style(price, style), context)
 
-def order_target_percent(order_book_id, percent, price=None, style=None):
-    account, position = _get_account_position_ins(order_book_id)
+def order_target_percent(order_book_id, percent, price=None, style=None, context=None):
+    context = context or Context.get_instance()
+    account, position = _get_account_position_ins(order_book_id, context)
     if percent == 0:
         return _submit_order(order_book_id, position.closable, SIDE.SELL, POSITION_EFFECT.CLOSE, cal_style(price, style),
-                             position.quantity, False)
+                             position.quantity, False, context)
     else:
         return _order_value(
-            account, position, order_book_id, account.total_value * percent - position.market_value, cal_style(price, style)
+            account, position, order_book_id, account.total_value * percent - position.market_value, cal_style(price, style), context
         )
 
 
-def order_target_weights(target_weights:Dict[str, float]) -> List[Order]:
+def order_target_weights(target_weights:Dict[str, float], context:Context=None) -> List[Order]:
     """
     make the account position to touch the target position
     :param target_weights: a dictionary contain the target weight of position
+    :param context: the context of the environment(`TradingEnv.context`), the current one if None
     :example:
     .. code-block:: python
         # adjust positions, to make the '000001.XSHE' to touch the target percent of account 10%
@@ -203,20 +208,20 @@ def order_target_weights(target_weights:Dict[str, float]) -> List[Order]:
     if total_percent > 1 and not np.isclose(total_percent, 1):
         raise RuntimeError("total percent should be lower than 1, current: {}").format(total_percent)
 
-    context = Context.get_instance()
+    context = context or Context.get_instance()
     account = context.portfolio.accounts[DEFAULT_ACCOUNT_TYPE.STOCK]
     account_value = account.get_current_trading_dt_total_value()
     
     
     #
     target_quantities = {}
-    for order_book_id, target_percent in target_weights.items():
+    prices = context.get_last_prices(list(target_weights.keys()))
+    for (order_book_id, target_percent), price in zip(target_weights.items(), prices):
 
         if target_percent < 0:
             raise RuntimeError("target percent of {} should between 0 and 1, current: {}".format(
                 order_book_id, target_percent
             ))
-        price = context.get_last_price(order_book_id)
         #print("trading_dt:{} current price: {}".format(context.trading_dt, price))
         if not is_valid_price(price):
             print("Order Creation Failed: [{order_book_id}] No market data".format(order_book_id=order_book_id))
@@ -232,7 +237,7 @@ def order_target_weights(target_weights:Dict[str, float]) -> List[Order]:
     for order_book_id, quantity in current_quantities.items():
         if order_book_id not in target_weights:
             close_orders.append(Order.__from_create__(
-                order_book_id, quantity, SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE
+                order_book_id, quantity, SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE, context=context
             ))
 
     round_lot = 100
@@ -245,12 +250,12 @@ def order_target_weights(target_weights:Dict[str, float]) -> List[Order]:
         if delta_quantity >= round_lot:
             delta_quantity = math.floor(delta_quantity / round_lot) * round_lot
             open_orders.append(Order.__from_create__(
-                order_book_id, delta_quantity, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN
+                order_book_id, delta_quantity, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN, context=context
             ))
         elif delta_quantity < -1:
             delta_quantity = math.floor(delta_quantity)
             close_orders.append(Order.__from_create__(
-                order_book_id, abs(delta_quantity), SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE
+                order_book_id, abs(delta_quantity), SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE, context=context
             ))
 
     to_submit_orders = []
@@ -260,10 +265,66 @@ def order_target_weights(target_weights:Dict[str, float]) -> List[Order]:
     return to_submit_orders
 
 
-def order_target_quantities(target_quantities:Dict[str, int]) -> List[Order]:
+def order_target_weights_array(weights:np.ndarray, context:Context=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    the array counterpart of order_target_weights computed in one pass over the price row, no Order is created
+    :param weights: the target weights aligned with data_source.get_available_order_book_ids(), the order_book_ids
+                    with a positive weight are targeted and the other positions are closed
+    :param context: the context of the environment(`TradingEnv.context`), the current one if None
+    :return: the ordinals(in the available order_book_ids) and the signed quantities(negative to sell) of the orders,
+             the sells first, to be passed to `SimulationBroker.submit_order_batch`
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    context = context or Context.get_instance()
+    account = context.portfolio.accounts[DEFAULT_ACCOUNT_TYPE.STOCK]
+    account_value = account.get_current_trading_dt_total_value()
+
+    held_ordinals, held_quantities = account.get_long_quantities()
+    current_quantities = np.zeros(len(weights), dtype=np.int64)
+    current_quantities[held_ordinals] = held_quantities
+    return target_weights_to_order_quantities(weights, account_value, context.get_last_prices(), current_quantities, held_ordinals)
+
+
+def target_weights_to_order_quantities(weights:np.ndarray, account_value:float, prices:np.ndarray,
+                                       current_quantities:np.ndarray, held_ordinals:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    the orders of order_target_weights_array from plain arrays aligned with the available order_book_ids
+    :param current_quantities: the quantities of the long positions
+    :param held_ordinals: the ordinals of the long positions, in the order their closing orders are sent
+    """
+    is_invalid = ~(weights >= 0)
+    if is_invalid.any():
+        ordinal = np.flatnonzero(is_invalid)[0]
+        raise RuntimeError("target percent of ordinal {} should between 0 and 1, current: {}".format(ordinal, weights[ordinal]))
+    targeted = weights > 0
+    total_percent = weights[targeted].sum()
+    if total_percent > 1 and not np.isclose(total_percent, 1):
+        raise RuntimeError("total percent should be lower than 1, current: {}".format(total_percent))
+
+    round_lot = 100
+    # NaN compares False
+    is_valid = targeted & (prices > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        target_quantities = np.round(account_value * weights / prices / round_lot) * round_lot
+    delta_quantities = np.where(is_valid, target_quantities, 0).astype(np.int64) - current_quantities
+
+    close_ordinals = held_ordinals[~targeted[held_ordinals]]
+    sell_ordinals = np.flatnonzero(is_valid & (delta_quantities < -1))
+    buy_ordinals = np.flatnonzero(is_valid & (delta_quantities >= round_lot))
+    ordinals = np.concatenate([close_ordinals, sell_ordinals, buy_ordinals])
+    quantities = np.concatenate([
+        -current_quantities[close_ordinals],
+        delta_quantities[sell_ordinals],
+        delta_quantities[buy_ordinals] // round_lot * round_lot,
+    ])
+    return ordinals, quantities
+
+
+def order_target_quantities(target_quantities:Dict[str, int], context:Context=None) -> List[Order]:
     """
     make the account position to touch the target quantities
     :param target_quantities: a dictionary contain the target quantities of position
+    :param context: the context of the environment(`TradingEnv.context`), the current one if None
     :example:
     .. code-block:: python
         # adjust positions, to make the '000001.XSHE' to touch the target quantities 800
@@ -274,7 +335,7 @@ def order_target_quantities(target_quantities:Dict[str, int]) -> List[Order]:
         })
     """
 
-    context = Context.get_instance()
+    context = context or Context.get_instance()
     account = context.portfolio.accounts[DEFAULT_ACCOUNT_TYPE.STOCK]
 
     close_orders, open_orders = [], []
@@ -286,7 +347,7 @@ def order_target_quantities(target_quantities:Dict[str, int]) -> List[Order]:
     for order_book_id, quantity in current_quantities.items():
         if order_book_id not in target_quantities:
             close_orders.append(Order.__from_create__(
-                order_book_id, quantity, SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE
+                order_book_id, quantity, SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE, context=context
             ))
 
     round_lot = 100
@@ -299,12 +360,12 @@ def order_target_quantities(target_quantities:Dict[str, int]) -> List[Order]:
         if delta_quantity >= round_lot:
             delta_quantity = math.floor(delta_quantity / round_lot) * round_lot
             open_orders.append(Order.__from_create__(
-                order_book_id, delta_quantity, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN
+                order_book_id, delta_quantity, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN, context=context
             ))
         elif delta_quantity < -1:
             delta_quantity = math.floor(delta_quantity)
             close_orders.append(Order.__from_create__(
-                order_book_id, abs(delta_quantity), SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE
+                order_book_id, abs(delta_quantity), SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE, context=context
             ))
 
     to_submit_orders = []
@@ -11,12 +11,16 @@ from itertools import chain
 from typing import Dict, List,Tuple, Optional, Union
 
 from sharpe.utils import merge_dicts
+from sharpe.utils.snapshot import pack_snapshot, unpack_snapshot, as_bytes_array
 from sharpe.utils.repr import PropertyReprMeta
 from sharpe.core.events import EVENT
 from sharpe.core.context import Context
 from sharpe.const import DEFAULT_ACCOUNT_TYPE
 from .account import Account
 
+# static_unit_net_value, last_unit_net_value, units
+PORTFOLIO_SNAPSHOT_HEADER = "ddd"
+
 class Portfolio(object, metaclass=PropertyReprMeta):
     """
     a manager(set) manage all account with different major INSTRUMENT type according __instrument_types__
@@ -25,14 +29,15 @@ class Portfolio(object, metaclass=PropertyReprMeta):
         "total_value", "unit_net_value", "daily_pnl", "daily_returns", "total_returns", "annualized_returns", "accounts"
     )
 
-    def __init__(self, starting_cash:Dict[str, float], init_positions:List[Tuple[str, int]]) -> None:
+    def __init__(self, starting_cash:Dict[str, float], init_positions:List[Tuple[str, int]], context:Context=None) -> None:
     
+        self._context = context or Context.get_instance()
         self._static_unit_net_value = 1
         self._last_unit_net_value = 1
 
         account_args = {}
         for account_type, cash in starting_cash.items():
-            account_args[account_type] = {"type": account_type, "total_cash": cash, "init_positions": {}}
+            account_args[account_type] = {"type": account_type, "total_cash": cash, "init_positions": {}, "context": self._context}
         for order_book_id, quantity in init_positions:
             account_type = self.get_account_type(order_book_id)
             if account_type in account_args:
@@ -40,6 +45,9 @@ class Portfolio(object, metaclass=PropertyReprMeta):
                 
         self._accounts = {account_type: Account(**args) for account_type, args in account_args.items()}
         self._units = sum(account.total_value for account in six.itervalues(self._accounts))
+        # the values of the properties read every bar, kept until an account or the static state changes
+        self._cache_key = None
+        self._cache = {}
 
         self._register_event()
 
@@ -62,6 +70,21 @@ class Portfolio(object, metaclass=PropertyReprMeta):
         for k, v in value['accounts'].items():
             self._accounts[k].set_state(v)
 
+    def get_snapshot(self) -> bytes:
+        """
+        the binary counterpart of get_state, cheap enough to be taken and restored every episode
+        """
+        return pack_snapshot(
+            PORTFOLIO_SNAPSHOT_HEADER, (self._static_unit_net_value, self._last_unit_net_value, self._units),
+            *(as_bytes_array(account.get_snapshot()) for account in self._accounts.values())
+        )
+
+    def set_snapshot(self, snapshot) -> None:
+        header, account_snapshots = unpack_snapshot(PORTFOLIO_SNAPSHOT_HEADER, snapshot, *([np.uint8] * len(self._accounts)))
+        self._static_unit_net_value, self._last_unit_net_value, self._units = header
+        for account, account_snapshot in zip(self._accounts.values(), account_snapshots):
+            account.set_snapshot(account_snapshot)
+
     def get_positions(self):
         return list(chain(*(a.get_positions() for a in six.itervalues(self._accounts))))
 
@@ -78,6 +101,18 @@ class Portfolio(object, metaclass=PropertyReprMeta):
     def get_account(self, order_book_id):
         return self._accounts[self.get_account_type(order_book_id)]
 
+    def _get_cached(self, name, compute):
+        # invalidated by the trades, price updates and settlements of the accounts(their version)
+        key = (self._units, self._static_unit_net_value) + tuple(account.version for account in six.itervalues(self._accounts))
+        if key != self._cache_key:
+            self._cache_key = key
+            self._cache = {}
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = compute()
+            return value
+
     @property
     def accounts(self) -> Dict[DEFAULT_ACCOUNT_TYPE, Account]:
         """
@@ -111,6 +146,9 @@ class Portfolio(object, metaclass=PropertyReprMeta):
         """
         [float] realtime net value
         """
+        return self._get_cached("unit_net_value", self._compute_unit_net_value)
+
+    def _compute_unit_net_value(self):
         if self._units == 0:
             return np.nan
         return self.total_value / self._units
@@ -134,7 +172,10 @@ class Portfolio(object, metaclass=PropertyReprMeta):
         """
         [float] the return of at current bar
         """
-        return np.nan if self._static_unit_net_value == 0 else self.unit_net_value / self._static_unit_net_value - 1
+        return self._get_cached(
+            "daily_returns",
+            lambda: np.nan if self._static_unit_net_value == 0 else self.unit_net_value / self._static_unit_net_value - 1
+        )
 
     @property
     def total_returns(self):
@@ -148,7 +189,7 @@ class Portfolio(object, metaclass=PropertyReprMeta):
         """
         [float] total value
         """
-        return sum(account.total_value for account in six.itervalues(self._accounts))
+        return self._get_cached("total_value", lambda: sum(account.total_value for account in six.itervalues(self._accounts)))
 
 
     @property
@@ -177,7 +218,7 @@ class Portfolio(object, metaclass=PropertyReprMeta):
         """
         [float] market value
         """
-        return sum(account.market_value for account in six.itervalues(self._accounts))
+        return self._get_cached("market_value", lambda: sum(account.market_value for account in six.itervalues(self._accounts)))
 
     @property
     def pnl(self):
@@ -210,7 +251,7 @@ class Portfolio(object, metaclass=PropertyReprMeta):
         self._last_unit_net_value = self.unit_net_value
 
     def _register_event(self):
-        event_bus = Context.get_instance().event_bus
+        event_bus = self._context.event_bus
         event_bus.prepend_listener(EVENT.PRE_BEFORE_TRADING, self._pre_before_trading)
         event_bus.prepend_listener(EVENT.POST_SETTLEMENT, self._post_settlement)
         
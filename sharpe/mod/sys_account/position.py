@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 from datetime import date
 from collections import UserDict
+import numpy as np
+import pandas as pd
 from sharpe.core.context import Context
 from sharpe.utils import is_valid_price
 from sharpe.utils.repr import property_repr, PropertyReprMeta
@@ -29,6 +31,107 @@ def new_position_meta():
 
 POSITION_TYPE_MAP, PositionMeta = new_position_meta()
 
+# one record per Position in the binary snapshot of an Account, the order_book_id is stored by its ordinal in the
+# data source, the direction by its row in the PositionBook(0 long, 1 short) and prev_close is NaN for None
+POSITION_SNAPSHOT_DTYPE = np.dtype([
+    ("ordinal", np.int64),
+    ("direction", np.uint8),
+    ("old_quantity", np.int64),
+    ("logical_old_quantity", np.int64),
+    ("today_quantity", np.int64),
+    ("avg_price", np.float64),
+    ("trade_cost", np.float64),
+    ("transaction_cost", np.float64),
+    ("prev_close", np.float64),
+    ("last_price", np.float64),
+    ("non_closable", np.int64),
+    ("dividend_receivable", np.float64),
+    ("dividend_payable_date", "M8[D]"),
+    ("transform_successor", np.int64),
+    ("transform_ratio", np.float64),
+])
+
+
+# the columns of a PositionBook: name, dtype and the value of an empty position, prev_close is NaN for None, the
+# dividend receivable of StockPosition is (dividend_payable_date, dividend_receivable), None for NaT, and its pending
+# transform (the order_book_id of transform_successor, transform_ratio), None for -1
+POSITION_BOOK_COLUMNS = (
+    ("old_quantity", np.int64, 0),
+    ("logical_old_quantity", np.int64, 0),
+    ("today_quantity", np.int64, 0),
+    ("avg_price", np.float64, 0.),
+    ("trade_cost", np.float64, 0.),
+    ("transaction_cost", np.float64, 0.),
+    ("prev_close", np.float64, np.nan),
+    ("last_price", np.float64, np.nan),
+    ("non_closable", np.int64, 0),
+    ("dividend_receivable", np.float64, 0.),
+    ("dividend_payable_date", "M8[D]", np.datetime64("NaT")),
+    ("transform_successor", np.int64, -1),
+    ("transform_ratio", np.float64, np.nan),
+)
+
+# the aggregates of a PositionBook, each position holds its contribution to them
+POSITION_BOOK_AGGREGATES = ("market_value", "equity", "transaction_cost", "trading_pnl", "position_pnl")
+
+
+def _direction_index(direction):
+    return 1 if direction == POSITION_DIRECTION.SHORT else 0
+
+
+def _book_column(name, cast):
+    def fget(self):
+        return cast(getattr(self._book, name)[self._index])
+
+    def fset(self, value):
+        book = self._book
+        getattr(book, name)[self._index] = value
+        book.touch(self._index[1])
+
+    return property(fget, fset)
+
+
+def _prev_close_or_none(value):
+    return None if value != value else float(value)
+
+
+def _dividend_receivable_column():
+    # (payable_date, dividend_value) or None
+    def fget(self):
+        book = self._book
+        payable_date = book.dividend_payable_date[self._index]
+        if np.isnat(payable_date):
+            return None
+        return payable_date.item(), float(book.dividend_receivable[self._index])
+
+    def fset(self, value):
+        book = self._book
+        payable_date, dividend_value = (np.datetime64("NaT"), 0.) if value is None else value
+        book.dividend_payable_date[self._index] = np.datetime64(payable_date, "D")
+        book.dividend_receivable[self._index] = dividend_value
+        book.touch(self._index[1])
+
+    return property(fget, fset)
+
+
+def _pending_transform_column():
+    # (successor order_book_id, conversion_ratio) or None, the successor is one of the order_book_ids of the book
+    def fget(self):
+        book = self._book
+        successor = book.transform_successor[self._index]
+        if successor < 0:
+            return None
+        return book.order_book_ids[successor], float(book.transform_ratio[self._index])
+
+    def fset(self, value):
+        book = self._book
+        successor, ratio = (None, np.nan) if value is None else value
+        book.transform_successor[self._index] = -1 if successor is None else book.get_ordinal(successor)
+        book.transform_ratio[self._index] = ratio
+        book.touch(self._index[1])
+
+    return property(fget, fset)
+
 
 class Position(object, metaclass=PositionMeta):
 
@@ -39,36 +142,47 @@ class Position(object, metaclass=PositionMeta):
     # istance Portfolio, but the instance will be StockPosition according the order_book_id instrument_types
     __instrument_types__ = []
 
-    def __new__(cls, order_book_id, direction, init_quantity=0):
+    # the state lives in the columns of a PositionBook, a Position is a view of one entry
+    _old_quantity = _book_column("old_quantity", int)
+    _logical_old_quantity = _book_column("logical_old_quantity", int)
+    _today_quantity = _book_column("today_quantity", int)
+    _avg_price = _book_column("avg_price", float)
+    _trade_cost = _book_column("trade_cost", float)
+    _transaction_cost = _book_column("transaction_cost", float)
+    _prev_close = _book_column("prev_close", _prev_close_or_none)
+    _last_price = _book_column("last_price", float)
+    _non_closable = _book_column("non_closable", int)
+
+    def __new__(cls, order_book_id, direction, init_quantity=0, context=None, book=None, ordinal=0):
         if cls == Position:
             ins_type = INSTRUMENT_TYPE.CS #Context.get_instance().data_proxy.instruments(order_book_id).type
             try:
                 position_cls = POSITION_TYPE_MAP[ins_type]
             except KeyError:
                 raise NotImplementedError("")
-            return position_cls.__new__(position_cls, order_book_id, direction, init_quantity)
+            return position_cls.__new__(position_cls, order_book_id, direction, init_quantity, context, book, ordinal)
         else:
             return object.__new__(cls)
 
-    def __init__(self, order_book_id, direction, init_quantity=0):
-        #self._context = Context.get_instance()
+    def __init__(self, order_book_id, direction, init_quantity=0, context=None, book=None, ordinal=0):
+        """
+        :param book: the PositionBook holding the state at ordinal, a standalone position owns a book of its own
+        """
+        # the context of the owner account, the current one if the position is created standalone
+        self._context = context or Context.get_instance()
 
         self._order_book_id = order_book_id
         #self._instrument = self._env.data_proxy.instruments(order_book_id)
         self._direction = direction
-
-        self._old_quantity = init_quantity
-        self._logical_old_quantity = 0
-        self._today_quantity = 0
-
-        self._avg_price = 0
-        self._trade_cost = 0
-        self._transaction_cost = 0
-        self._prev_close = None
-        self._last_price = float("NaN")
-
         self._direction_factor = 1 if direction == POSITION_DIRECTION.LONG else -1
 
+        if book is None:
+            book = PositionBook([order_book_id], self._context)
+        self._book = book
+        self._index = (_direction_index(direction), ordinal)
+        if init_quantity:
+            self._old_quantity = init_quantity
+
     @property
     def order_book_id(self):
         # type: () -> str
@@ -136,15 +250,13 @@ class Position(object, metaclass=PositionMeta):
     @property
     def prev_close(self):
         if not is_valid_price(self._prev_close):
-            context = Context.get_instance()
-            self._prev_close = context.data_source.get_prev_close(self._order_book_id, context.trading_dt)
+            self._prev_close = self._context.get_previous_close(self._order_book_id)
         return self._prev_close
 
     @property
     def last_price(self):
         if self._last_price != self._last_price:
-            context = Context.get_instance()
-            self._last_price = context.get_last_price(self._order_book_id)
+            self._last_price = self._context.get_last_price(self._order_book_id)
             if self._last_price != self._last_price:
                 raise RuntimeError("last price of position {} is not supposed to be nan".format(self._order_book_id))
         return self._last_price
@@ -193,24 +305,28 @@ class Position(object, metaclass=PositionMeta):
         return 0
 
     def apply_trade(self, trade):
-        self._transaction_cost += trade.transaction_cost
-        if trade.position_effect == POSITION_EFFECT.OPEN:
+        return self.apply_fill(trade.position_effect, trade.last_price, trade.last_quantity, trade.transaction_cost)
+
+    def apply_fill(self, position_effect, last_price, last_quantity, transaction_cost):
+        # return the cash change
+        self._transaction_cost += transaction_cost
+        if position_effect == POSITION_EFFECT.OPEN:
             if self.quantity < 0:
-                self._avg_price = trade.last_price if self.quantity + trade.last_quantity > 0 else 0
+                self._avg_price = last_price if self.quantity + last_quantity > 0 else 0
             else:
-                cost = self.quantity * self._avg_price + trade.last_quantity * trade.last_price
-                self._avg_price = cost / (self.quantity + trade.last_quantity)
-            self._today_quantity += trade.last_quantity
-            self._trade_cost += trade.last_price * trade.last_quantity
-            return (-1 * trade.last_price * trade.last_quantity) - trade.transaction_cost
-        elif trade.position_effect == POSITION_EFFECT.CLOSE:
-            self._today_quantity -= max(trade.last_quantity - self._old_quantity, 0)
-            self._old_quantity -= min(trade.last_quantity, self._old_quantity)
-            self._trade_cost -= trade.last_price * trade.last_quantity
-            return trade.last_price * trade.last_quantity - trade.transaction_cost
+                cost = self.quantity * self._avg_price + last_quantity * last_price
+                self._avg_price = cost / (self.quantity + last_quantity)
+            self._today_quantity += last_quantity
+            self._trade_cost += last_price * last_quantity
+            return (-1 * last_price * last_quantity) - transaction_cost
+        elif position_effect == POSITION_EFFECT.CLOSE:
+            self._today_quantity -= max(last_quantity - self._old_quantity, 0)
+            self._old_quantity -= min(last_quantity, self._old_quantity)
+            self._trade_cost -= last_price * last_quantity
+            return last_price * last_quantity - transaction_cost
         else:
             raise NotImplementedError("{} does not support position effect {}".format(
-                self.__class__.__name__, trade.position_effect
+                self.__class__.__name__, position_effect
             ))
 
     def settlement(self, trading_date):
@@ -228,7 +344,7 @@ class Position(object, metaclass=PositionMeta):
 
     @property
     def _open_orders(self):
-        for order in Context.get_instance().broker.get_open_orders(self.order_book_id):
+        for order in self._context.broker.get_open_orders(self.order_book_id):
             if order.position_direction == self._direction:
                 yield order
 
@@ -250,11 +366,8 @@ class StockPosition(Position):
     cash_return_by_stock_delisted = True
     t_plus_enabled = True
 
-    def __init__(self, order_book_id, direction, init_quantity=0):
-        super(StockPosition, self).__init__(order_book_id, direction, init_quantity)
-        self._dividend_receivable = None
-        self._pending_transform = None
-        self._non_closable = 0
+    _dividend_receivable = _dividend_receivable_column()
+    _pending_transform = _pending_transform_column()
 
     @property
     def dividend_receivable(self):
@@ -310,11 +423,11 @@ class StockPosition(Position):
         delta_cash = 0
         return delta_cash
 
-    def apply_trade(self, trade) -> float:
+    def apply_fill(self, position_effect, last_price, last_quantity, transaction_cost) -> float:
         # return the cash change
-        delta_cash = super(StockPosition, self).apply_trade(trade)
-        if trade.position_effect == POSITION_EFFECT.OPEN and self._market_tplus >= 1:
-            self._non_closable += trade.last_quantity
+        delta_cash = super(StockPosition, self).apply_fill(position_effect, last_price, last_quantity, transaction_cost)
+        if position_effect == POSITION_EFFECT.OPEN and self._market_tplus >= 1:
+            self._non_closable += last_quantity
         return delta_cash
 
     def settlement(self, trading_date):
@@ -378,10 +491,270 @@ class StockPosition(Position):
     #     self._prev_close /= ratio
 
 
+class PositionBook(object):
+    """
+    the long and short positions of a set of order_book_ids as columns(see POSITION_BOOK_COLUMNS) of shape
+    (2, len(order_book_ids)), the long ones in the first row, indexed by the ordinal of the order_book_id so that the
+    aggregates of an account are array reductions, alive marks the order_book_ids with positions.
+    the aggregates(see POSITION_BOOK_AGGREGATES) are running totals of the contributions of the positions, updated by
+    the deltas of the changed ones only: the writes of the Position views and of the owner to the columns touch their
+    ordinals and the totals are brought up to date on the next read, the book updates the ones it writes at once
+    """
+
+    def __init__(self, order_book_ids, context):
+        self._context = context
+        self.order_book_ids = pd.Index(order_book_ids)
+        shape = (2, len(self.order_book_ids))
+        for name, dtype, empty in POSITION_BOOK_COLUMNS:
+            setattr(self, name, np.full(shape, empty, dtype=dtype))
+        self.alive = np.zeros(len(self.order_book_ids), dtype=bool)
+        # the Position views, created on first access
+        self._views = ({}, {})
+        self._contributions = {name: np.zeros(shape, dtype=np.float64) for name in POSITION_BOOK_AGGREGATES}
+        self._totals = dict.fromkeys(POSITION_BOOK_AGGREGATES, 0.)
+        # the ordinals touched since the last read of the aggregates
+        self._pending = set()
+        # changes with every write of the columns
+        self.version = 0
+
+    def touch(self, ordinals) -> None:
+        """mark the positions of ordinals(an int or an array) as changed, their contributions are updated on the next read"""
+        if isinstance(ordinals, (int, np.integer)):
+            self._pending.add(int(ordinals))
+        else:
+            self._pending.update(np.asarray(ordinals).tolist())
+        self.version += 1
+
+    def update(self, ordinals:np.ndarray) -> None:
+        """update the contributions of the positions of ordinals now, after the touched ones"""
+        self._flush()
+        self._update(np.asarray(ordinals, dtype=np.intp), sequential=False)
+
+    def get_ordinal(self, order_book_id:str) -> int:
+        return self.order_book_ids.get_loc(order_book_id)
+
+    def get_alive_ordinals(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def get_view(self, ordinal:int, direction:POSITION_DIRECTION) -> "Position":
+        views = self._views[_direction_index(direction)]
+        try:
+            return views[ordinal]
+        except KeyError:
+            view = views[ordinal] = Position(self.order_book_ids[ordinal], direction, context=self._context, book=self, ordinal=ordinal)
+            return view
+
+    def iter_views(self, direction:POSITION_DIRECTION=None):
+        """the views of the alive positions, the long one before the short one of an order_book_id if direction is None"""
+        directions = (direction,) if direction else (POSITION_DIRECTION.LONG, POSITION_DIRECTION.SHORT)
+        for ordinal in self.get_alive_ordinals().tolist():
+            for d in directions:
+                yield self.get_view(ordinal, d)
+
+    def clear(self, ordinals=None) -> None:
+        """empty the positions of ordinals, all of them by default"""
+        if ordinals is None:
+            for name, dtype, empty in POSITION_BOOK_COLUMNS:
+                getattr(self, name)[:] = empty
+            self.alive[:] = False
+            for name in POSITION_BOOK_AGGREGATES:
+                self._contributions[name][:] = 0
+                self._totals[name] = 0.
+            self._pending.clear()
+            self.version += 1
+            return
+        for name, dtype, empty in POSITION_BOOK_COLUMNS:
+            getattr(self, name)[:, ordinals] = empty
+        self.alive[ordinals] = False
+        self.update(ordinals)
+
+    @property
+    def quantity(self) -> np.ndarray:
+        return self.old_quantity + self.today_quantity
+
+    # ====================================================================== #
+    # the aggregates over the alive positions, the rows long and short of    #
+    # an ordinal are (2, n) arrays weighted by the direction factors, the    #
+    # prices are looked up like Position.last_price and Position.prev_close  #
+    # and only where a position needs them                                   #
+    # ====================================================================== #
+
+    _DIRECTION_FACTORS = np.array([[1], [-1]])
+
+    def _get_last_prices(self, ordinals:np.ndarray, needed:np.ndarray) -> np.ndarray:
+        last_prices = self.last_price[:, ordinals]
+        is_missing = needed & np.isnan(last_prices)
+        if is_missing.any():
+            directions, columns = np.nonzero(is_missing)
+            last_prices[directions, columns] = self._context.get_last_prices()[ordinals[columns]]
+            self.last_price[directions, ordinals[columns]] = last_prices[directions, columns]
+            is_missing = needed & np.isnan(last_prices)
+            if is_missing.any():
+                order_book_id = self.order_book_ids[ordinals[np.nonzero(is_missing)[1][0]]]
+                raise RuntimeError("last price of position {} is not supposed to be nan".format(order_book_id))
+        return last_prices
+
+    def _get_prev_closes(self, ordinals:np.ndarray, needed:np.ndarray) -> np.ndarray:
+        prev_closes = self.prev_close[:, ordinals]
+        # NaN compares False
+        is_invalid = needed & ~(prev_closes > 0)
+        for direction, column in zip(*np.nonzero(is_invalid)):
+            prev_closes[direction, column] = self.prev_close[direction, ordinals[column]] = self._context.get_previous_close(
+                self.order_book_ids[ordinals[column]]
+            )
+        return prev_closes
+
+    def before_trading(self) -> float:
+        """StockPosition.before_trading of every alive position, the cash change"""
+        ordinals = self.get_alive_ordinals()
+        is_short = self.quantity[1, ordinals] != 0
+        if is_short.any():
+            raise RuntimeError("direction of stock position {} is not supposed to be short".format(self.order_book_ids[ordinals[is_short][0]]))
+        return 0
+
+    def settlement(self) -> float:
+        """StockPosition.settlement of every alive position, then the empty ones are removed, the cash change"""
+        ordinals = self.get_alive_ordinals()
+        prev_closes = self._get_last_prices(ordinals, np.ones((2, len(ordinals)), dtype=bool))
+        self.old_quantity[:, ordinals] += self.today_quantity[:, ordinals]
+        self.logical_old_quantity[:, ordinals] = self.old_quantity[:, ordinals]
+        for name in ("today_quantity", "trade_cost", "transaction_cost", "non_closable"):
+            getattr(self, name)[:, ordinals] = 0
+        self.prev_close[:, ordinals] = prev_closes
+        self.update(ordinals)
+        self.before_trading()
+
+        is_empty = ~self.old_quantity[:, ordinals].any(axis=0) & ~self.dividend_receivable[:, ordinals].any(axis=0)
+        self.clear(ordinals[is_empty])
+        return 0
+
+    def apply_long_fills(self, ordinals:np.ndarray, quantities:np.ndarray, prices:np.ndarray, transaction_costs:np.ndarray) -> np.ndarray:
+        """
+        Position.apply_fill of the long positions of distinct ordinals at once, the positive quantities open and the
+        negative close, the cash change of every fill
+        """
+        self.alive[ordinals] = True
+        # applied like the fills of Position.apply_fill, one touch per position
+        self.touch(ordinals)
+        is_open = quantities > 0
+        fill_quantities = np.abs(quantities)
+        old_quantities, today_quantities = self.old_quantity[0, ordinals], self.today_quantity[0, ordinals]
+        current_quantities = old_quantities + today_quantities
+
+        self.transaction_cost[0, ordinals] += transaction_costs
+        with np.errstate(divide="ignore", invalid="ignore"):
+            open_avg_prices = np.where(
+                current_quantities < 0,
+                np.where(current_quantities + fill_quantities > 0, prices, 0.),
+                (current_quantities * self.avg_price[0, ordinals] + fill_quantities * prices) / (current_quantities + fill_quantities)
+            )
+        self.avg_price[0, ordinals] = np.where(is_open, open_avg_prices, self.avg_price[0, ordinals])
+        self.today_quantity[0, ordinals] = np.where(
+            is_open, today_quantities + fill_quantities, today_quantities - np.maximum(fill_quantities - old_quantities, 0)
+        )
+        self.old_quantity[0, ordinals] = np.where(is_open, old_quantities, old_quantities - np.minimum(fill_quantities, old_quantities))
+        self.trade_cost[0, ordinals] += np.where(is_open, 1, -1) * (prices * fill_quantities)
+        if is_open.any() and self.get_view(ordinals[0], POSITION_DIRECTION.LONG)._market_tplus >= 1:
+            self.non_closable[0, ordinals[is_open]] += fill_quantities[is_open]
+        return np.where(is_open, (-1 * prices * fill_quantities) - transaction_costs, prices * fill_quantities - transaction_costs)
+
+    def _get_contributions(self, ordinals:np.ndarray) -> dict:
+        """the contribution of every position of ordinals to each aggregate, (2, n) arrays"""
+        quantities = self.quantity[:, ordinals]
+        is_held = quantities != 0
+        trade_quantities = (self.today_quantity + self.old_quantity - self.logical_old_quantity)[:, ordinals]
+        is_traded = trade_quantities != 0
+        logical_old_quantities = self.logical_old_quantity[:, ordinals]
+        is_old = logical_old_quantities != 0
+        last_prices = self._get_last_prices(ordinals, is_held | is_traded | is_old)
+        prev_closes = self._get_prev_closes(ordinals, is_old)
+        with np.errstate(invalid="ignore"):
+            equities = np.where(is_held, last_prices * quantities, 0.)
+            return {
+                "market_value": equities * self._DIRECTION_FACTORS,
+                "equity": equities + self.dividend_receivable[:, ordinals],
+                "transaction_cost": self.transaction_cost[:, ordinals].astype(np.float64),
+                "trading_pnl": np.where(
+                    is_traded, (trade_quantities * last_prices - self.trade_cost[:, ordinals]) * self._DIRECTION_FACTORS, 0.
+                ),
+                "position_pnl": np.where(
+                    is_old, logical_old_quantities * (last_prices - prev_closes) * self._DIRECTION_FACTORS, 0.
+                ),
+            }
+
+    def _update(self, ordinals:np.ndarray, sequential:bool) -> None:
+        # add the deltas of the contributions of ordinals to the totals, one by one in order if sequential so that the
+        # same fills give the same totals whether they are applied at once or position by position
+        if len(ordinals) == 0:
+            return
+        contributions = self._get_contributions(ordinals)
+        for name in POSITION_BOOK_AGGREGATES:
+            current = self._contributions[name]
+            deltas = contributions[name].sum(axis=0) - current[:, ordinals].sum(axis=0)
+            current[:, ordinals] = contributions[name]
+            if sequential:
+                # cumsum adds one by one
+                self._totals[name] = float(np.cumsum(np.concatenate(([self._totals[name]], deltas)))[-1])
+            else:
+                self._totals[name] += float(deltas.sum())
+        self.version += 1
+
+    def _flush(self) -> None:
+        if self._pending:
+            ordinals = np.array(sorted(self._pending), dtype=np.intp)
+            self._pending.clear()
+            self._update(ordinals, sequential=True)
+
+    def recompute(self) -> dict:
+        """the aggregates computed from scratch over the alive positions, the cached totals are left as they are"""
+        ordinals = self.get_alive_ordinals()
+        contributions = self._get_contributions(ordinals)
+        return {name: float(contributions[name].sum()) for name in POSITION_BOOK_AGGREGATES}
+
+    def reset_aggregates(self, totals:dict=None) -> None:
+        """rebuild the contributions of every position after the columns were written, the totals from scratch or totals"""
+        self._pending.clear()
+        for name in POSITION_BOOK_AGGREGATES:
+            self._contributions[name][:] = 0
+        ordinals = self.get_alive_ordinals()
+        contributions = self._get_contributions(ordinals)
+        for name in POSITION_BOOK_AGGREGATES:
+            self._contributions[name][:, ordinals] = contributions[name]
+        self._totals = dict(totals) if totals is not None else {
+            name: float(contributions[name].sum()) for name in POSITION_BOOK_AGGREGATES
+        }
+        self.version += 1
+
+    def get_totals(self) -> dict:
+        self._flush()
+        return dict(self._totals)
+
+    def get_market_value(self) -> float:
+        self._flush()
+        return self._totals["market_value"]
+
+    def get_equity(self) -> float:
+        self._flush()
+        return self._totals["equity"]
+
+    def get_transaction_cost(self) -> float:
+        self._flush()
+        return self._totals["transaction_cost"]
+
+    def get_trading_pnl(self) -> float:
+        self._flush()
+        return self._totals["trading_pnl"]
+
+    def get_position_pnl(self) -> float:
+        self._flush()
+        return self._totals["position_pnl"]
+
+
 class PositionProxyDict(UserDict):
-    def __init__(self, positions):
+    def __init__(self, positions, context=None):
         super(PositionProxyDict, self).__init__()
         self._positions = positions  
+        self._context = context
 
     def keys(self):
         return self._positions.keys()
@@ -389,8 +762,8 @@ class PositionProxyDict(UserDict):
     def __getitem__(self, order_book_id):
         position_type, position_proxy_type = self._get_position_types(order_book_id)
         if order_book_id not in self._positions:
-            long = position_type(order_book_id, POSITION_DIRECTION.LONG)
-            short = position_type(order_book_id, POSITION_DIRECTION.SHORT)
+            long = position_type(order_book_id, POSITION_DIRECTION.LONG, context=self._context)
+            short = position_type(order_book_id, POSITION_DIRECTION.SHORT, context=self._context)
         else:
             positions = self._positions[order_book_id]
             long = positions[POSITION_DIRECTION.LONG]
@@ -416,5 +789,5 @@ class PositionProxyDict(UserDict):
         return repr({k: self[k] for k in self._positions.keys()})
 
 if __name__ == "__main__":
-    position = Position(order_book_id="000001.XSHE", direction=None)
+    position = Position(order_book_id="000001.XSHE", direction=None, context=Context())
     print(type(position))
\ No newline at end of file
@@ -1,69 +1,79 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from sharpe.core.context import Context
-from sharpe.core.events import Event, EVENT
+from sharpe.core.events import Event, BarEvent, EVENT
+
+# the phases of one bar in normal mode
+BAR_EVENT_TYPES = (
+    EVENT.PRE_BEFORE_TRADING, EVENT.BEFORE_TRADING, EVENT.POST_BEFORE_TRADING,
+    EVENT.PRE_BAR, EVENT.BAR, EVENT.POST_BAR,
+    EVENT.PRE_AFTER_TRADING, EVENT.AFTER_TRADING, EVENT.POST_AFTER_TRADING,
+    EVENT.PRE_SETTLEMENT, EVENT.SETTLEMENT, EVENT.POST_SETTLEMENT,
+)
+
+# in rl mode a step closes the current bar and opens the next one, up to its PRE_BAR(the mark to market)
+RL_BAR_EVENT_TYPES = (
+    EVENT.BAR, EVENT.POST_BAR,
+    EVENT.PRE_AFTER_TRADING, EVENT.AFTER_TRADING, EVENT.POST_AFTER_TRADING,
+    EVENT.PRE_SETTLEMENT, EVENT.SETTLEMENT, EVENT.POST_SETTLEMENT,
+)
+RL_NEXT_BAR_EVENT_TYPES = (
+    EVENT.PRE_BEFORE_TRADING, EVENT.BEFORE_TRADING, EVENT.POST_BEFORE_TRADING,
+    EVENT.PRE_BAR,
+)
 
 class SimulationEventSource(object):
+    """
+    serve the events of a bar from a pool of preallocated BarEvent(one per phase), their calendar_dt and
+    trading_dt are rewritten for the requested bar, so the memory does not grow with the number of bars
+    """
     
     def __init__(self):
-        pass
+        self._bar_events = [BarEvent(event_type) for event_type in BAR_EVENT_TYPES]
+        self._rl_current_bar_events = [BarEvent(event_type) for event_type in RL_BAR_EVENT_TYPES]
+        self._rl_next_bar_events = [BarEvent(event_type) for event_type in RL_NEXT_BAR_EVENT_TYPES]
+        self._rl_bar_events = self._rl_current_bar_events + self._rl_next_bar_events
     
-    def events(self, trading_dts):
-        event_container = {}
-        #for trading_dt in trading_dts[:-1]:
-        for i, trading_dt in enumerate(trading_dts):
-            
-            #events_within_bar = ( Event(EVENT.BEFORE_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt),
-            #                 Event(EVENT.BAR, calendar_dt=trading_dt, trading_dt=trading_dt),
-            #                 Event(EVENT.AFTER_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt)
-            #    )
-            events_within_bar = []
-            events_within_bar.append(Event(EVENT.PRE_BEFORE_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.BEFORE_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.POST_BEFORE_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-
-            events_within_bar.append(Event(EVENT.PRE_BAR, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.BAR, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.POST_BAR, calendar_dt=trading_dt, trading_dt=trading_dt))
-            
-            events_within_bar.append(Event(EVENT.PRE_AFTER_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.AFTER_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.POST_AFTER_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            
-            events_within_bar.append(Event(EVENT.PRE_SETTLEMENT, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.SETTLEMENT, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.POST_SETTLEMENT, calendar_dt=trading_dt, trading_dt=trading_dt))
-            
-            #yield events_within_bar
-            event_container[trading_dt] = events_within_bar
-        return event_container
+    def bar_events(self, trading_dts, ordinal):
+        """the events of the bar trading_dts[ordinal], the returned events are reused by the next call"""
+        trading_dt = trading_dts[ordinal]
+        for event in self._bar_events:
+            event.calendar_dt = event.trading_dt = trading_dt
+        return self._bar_events
+    
+    def rl_bar_events(self, trading_dts, ordinal):
+        """the events from the bar trading_dts[ordinal] to the PRE_BAR of the next one, reused by the next call"""
+        trading_dt, next_trading_dt = trading_dts[ordinal], trading_dts[ordinal+1]
+        for event in self._rl_current_bar_events:
+            event.calendar_dt = event.trading_dt = trading_dt
+        for event in self._rl_next_bar_events:
+            event.calendar_dt = event.trading_dt = next_trading_dt
+        return self._rl_bar_events
+    
+    def iter_bar_events(self, trading_dts):
+        """lazily iterate the pooled events of every bar of trading_dts, a yielded list is only valid until the next one"""
+        for ordinal in range(len(trading_dts)):
+            yield self.bar_events(trading_dts, ordinal)
     
+    def iter_rl_bar_events(self, trading_dts):
+        """the rl counterpart of iter_bar_events, a yielded list is only valid until the next one"""
+        for ordinal in range(len(trading_dts) - 1):
+            yield self.rl_bar_events(trading_dts, ordinal)
+    
+    def events(self, trading_dts):
+        """the fresh events of every bar, keyed by trading_dt"""
+        return {
+            trading_dt: [Event(event_type, calendar_dt=trading_dt, trading_dt=trading_dt) for event_type in BAR_EVENT_TYPES]
+            for trading_dt in trading_dts
+        }
     
     def _rl_events(self, trading_dts):
         event_container = {}
-        for i, trading_dt in enumerate(trading_dts[:-1]):
-            events_within_bar = []
-            
-            events_within_bar.append(Event(EVENT.BAR, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.POST_BAR, calendar_dt=trading_dt, trading_dt=trading_dt))
-            
-            events_within_bar.append(Event(EVENT.PRE_AFTER_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.AFTER_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.POST_AFTER_TRADING, calendar_dt=trading_dt, trading_dt=trading_dt))
-            
-            events_within_bar.append(Event(EVENT.PRE_SETTLEMENT, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.SETTLEMENT, calendar_dt=trading_dt, trading_dt=trading_dt))
-            events_within_bar.append(Event(EVENT.POST_SETTLEMENT, calendar_dt=trading_dt, trading_dt=trading_dt))
-            
-            next_trading_dt = trading_dts[i+1]
-            
-            events_within_bar.append(Event(EVENT.PRE_BEFORE_TRADING, calendar_dt=next_trading_dt, trading_dt=next_trading_dt))
-            events_within_bar.append(Event(EVENT.BEFORE_TRADING, calendar_dt=next_trading_dt, trading_dt=next_trading_dt))
-            events_within_bar.append(Event(EVENT.POST_BEFORE_TRADING, calendar_dt=next_trading_dt, trading_dt=next_trading_dt))
-            
-            events_within_bar.append(Event(EVENT.PRE_BAR, calendar_dt=next_trading_dt, trading_dt=next_trading_dt))
-            event_container[trading_dt] = events_within_bar
+        for trading_dt, next_trading_dt in zip(trading_dts[:-1], trading_dts[1:]):
+            event_container[trading_dt] = (
+                [Event(event_type, calendar_dt=trading_dt, trading_dt=trading_dt) for event_type in RL_BAR_EVENT_TYPES]
+                + [Event(event_type, calendar_dt=next_trading_dt, trading_dt=next_trading_dt) for event_type in RL_NEXT_BAR_EVENT_TYPES]
+            )
         return event_container
 
 if __name__ == "__main__":
@@ -72,12 +82,5 @@ if __name__ == "__main__":
     trading_dts = pd.date_range(start="2020-01-01", end="2020-01-05")
     
     event_simulator = SimulationEventSource()
-    normal_event_container = event_simulator.events(trading_dts)
-    rl_event_container = event_simulator._rl_events(trading_dts)
-
-    
-    
-    
-    
-    
-    
\ No newline at end of file
+    for events_within_bar in event_simulator.iter_rl_bar_events(trading_dts):
+        print(events_within_bar)
@@ -1,9 +1,42 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from collections import defaultdict
+import numpy as np
 from sharpe.const import MATCHING_TYPE, POSITION_EFFECT, SIDE, ORDER_TYPE
 from sharpe.core.events import EVENT, Event
 from sharpe.object.trade import Trade
+from sharpe.object.fill_batch import FillBatch
+
+ROUND_LOT = 100
+
+
+def fit_batch_to_cash(context, cash, order_book_ids, prices, quantities, commissions, taxes):
+    """
+    scale down the buys of a batch of fills(signed quantities, in the order they are filled) to the round lots the
+    cash left pays for, commissions and taxes included, like the single orders switch to the remaining cash
+    :return: the quantities, commissions and taxes, the buys which can not be paid at all have a 0 quantity
+    """
+    quantities, commissions, taxes = quantities.copy(), commissions.copy(), taxes.copy()
+    for i in range(len(quantities)):
+        quantity, price = int(quantities[i]), float(prices[i])
+        cost = price * quantity + commissions[i] + taxes[i]
+        if quantity > 0 and cost > cash:
+            quantity = min(quantity, int(cash // price) // ROUND_LOT * ROUND_LOT)
+            while quantity > 0:
+                commission, tax = context.get_batch_transaction_cost(order_book_ids[i: i + 1], prices[i: i + 1],
+                                                                     np.array([quantity]))
+                cost = price * quantity + commission[0] + tax[0]
+                if cost <= cash:
+                    commissions[i], taxes[i] = commission[0], tax[0]
+                    break
+                quantity -= ROUND_LOT
+            if quantity <= 0:
+                quantity, cost = 0, 0.
+                commissions[i] = taxes[i] = 0.
+            quantities[i] = quantity
+        cash -= cost
+    return quantities, commissions, taxes
+
 
 class AbstractMatcher:
     def match(self, account, order, open_auction):
@@ -12,6 +45,13 @@ class AbstractMatcher:
     def update(self):
         raise NotImplementedError
 
+    def get_turnover(self) -> dict:
+        """the quantity matched per order_book_id in the current bar, kept in the snapshot of the broker"""
+        return {}
+
+    def set_turnover(self, turnover:dict) -> None:
+        pass
+
 
 class DefaultMatcher(AbstractMatcher):
     def __init__(self, context, matching_type):
@@ -61,7 +101,8 @@ class DefaultMatcher(AbstractMatcher):
             position_effect=order.position_effect,
             order_book_id=order.order_book_id,
             frozen_price=order.frozen_price,
-            close_today_amount=ct_amount
+            close_today_amount=ct_amount,
+            context=self._context
         )
         trade._commission = self._context.get_trade_commission(trade)
         trade._tax = self._context.get_trade_tax(trade)
@@ -78,6 +119,45 @@ class DefaultMatcher(AbstractMatcher):
             )
             order.mark_cancelled(reason)
 
+    def match_batch(self, account, ordinals, quantities):
+        """
+        fill a batch of market orders(ordinals in the available order_book_ids, signed quantities) at the current
+        bar close in one pass, the orders without a valid price are dropped and the buys the cash can not pay are
+        scaled down(see fit_batch_to_cash)
+        """
+        context = self._context
+        prices = context.get_last_prices()[ordinals]
+        # NaN compares False
+        is_valid = prices > 0
+        if not is_valid.all():
+            ordinals, quantities, prices = ordinals[is_valid], quantities[is_valid], prices[is_valid]
+        order_book_ids = context.data_source.get_available_order_book_ids()[ordinals]
+        if len(order_book_ids) == 0:
+            return
+        commissions, taxes = context.get_batch_transaction_cost(order_book_ids, prices, quantities)
+        # the batch is filled within this call so no cash stays frozen, but its buys have to be paid by the cash
+        # available(the cash frozen by the open orders excluded) and the sells before them
+        balances = account.cash - np.cumsum(prices * quantities + commissions + taxes)
+        if (balances < 0).any():
+            quantities, commissions, taxes = fit_batch_to_cash(context, account.cash, order_book_ids, prices, quantities,
+                                                               commissions, taxes)
+            is_filled = quantities != 0
+            if not is_filled.all():
+                order_book_ids, ordinals = order_book_ids[is_filled], ordinals[is_filled]
+                quantities, prices = quantities[is_filled], prices[is_filled]
+                commissions, taxes = commissions[is_filled], taxes[is_filled]
+            if len(order_book_ids) == 0:
+                return
+        fill_batch = FillBatch(context.calendar_dt, context.trading_dt, order_book_ids, ordinals, quantities, prices, commissions, taxes)
+        context.event_bus.publish_event(Event(EVENT.FILL_BATCH, account=account, fill_batch=fill_batch))
+
     def update(self):
         self._turnover.clear()
+
+    def get_turnover(self) -> dict:
+        return dict(self._turnover)
+
+    def set_turnover(self, turnover:dict) -> None:
+        self._turnover.clear()
+        self._turnover.update(turnover)
         
\ No newline at end of file
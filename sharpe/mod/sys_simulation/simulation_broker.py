@@ -1,12 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from functools import lru_cache
+import numpy as np
 from sharpe.const import MATCHING_TYPE, INSTRUMENT_TYPE
 from typing import Dict, List,Tuple, Optional, Union, Iterable
 from sharpe.interface import AbstractBroker
-from sharpe.const import POSITION_EFFECT, ORDER_STATUS
+from sharpe.const import POSITION_EFFECT, ORDER_STATUS, SIDE
 from sharpe.core.events import EVENT, Event
 from sharpe.mod.sys_simulation.matcher import DefaultMatcher
+from sharpe.object.order import Order, MarketOrder, ORDER_SNAPSHOT_DTYPE
+from sharpe.utils.snapshot import pack_snapshot, unpack_snapshot
+
+# the number of open orders and of delayed orders(the exercise orders follow them)
+BROKER_SNAPSHOT_HEADER = "QQ"
+# the turnover of the matchers in the current bar, the order_book_id is stored by its ordinal in the data source
+TURNOVER_SNAPSHOT_DTYPE = np.dtype([
+    ("ordinal", np.int64),
+    ("turnover", np.float64),
+])
 
 class SimulationBroker(AbstractBroker):
     def __init__(self, context, matching_type=MATCHING_TYPE.CURRENT_BAR_CLOSE):
@@ -38,15 +49,99 @@ class SimulationBroker(AbstractBroker):
     def register_matcher(self, instrument_type, matcher):
         self._matchers[instrument_type] = matcher
     
+    def has_open_orders(self) -> bool:
+        """whether an order is open, delayed to the next bar or waiting for exercise"""
+        return bool(self._open_orders or self._delayed_orders or self._open_exercise_orders)
+
     def get_open_orders(self, order_book_id=None):
         if order_book_id is None:
             return [order for account, order in self._open_orders]
         else:
             return [order for account, order in self._open_orders if order.order_book_id == order_book_id]
 
+    def _get_ordinals(self, order_book_ids) -> np.ndarray:
+        ordinals = self._context.data_source.get_available_order_book_ids().get_indexer(order_book_ids)
+        if (ordinals < 0).any():
+            raise ValueError("{} is not an order_book_id of the data source".format(order_book_ids[int(np.flatnonzero(ordinals < 0)[0])]))
+        return ordinals
+
+    def get_snapshot(self) -> bytes:
+        """
+        the open, delayed and exercise orders as ORDER_SNAPSHOT_DTYPE records, restored as new Order objects, and the
+        turnover of the matchers
+        """
+        orders = [order for account, order in self._open_orders + self._delayed_orders + self._open_exercise_orders]
+        ordinals = self._get_ordinals([order.order_book_id for order in orders])
+        records = np.array([order.get_snapshot_record(ordinal) for order, ordinal in zip(orders, ordinals.tolist())],
+                           dtype=ORDER_SNAPSHOT_DTYPE)
+        turnover = {}
+        for matcher in self._matchers.values():
+            turnover.update(matcher.get_turnover())
+        turnover_records = np.zeros(len(turnover), dtype=TURNOVER_SNAPSHOT_DTYPE)
+        turnover_records["ordinal"] = self._get_ordinals(list(turnover))
+        turnover_records["turnover"] = list(turnover.values())
+        return pack_snapshot(BROKER_SNAPSHOT_HEADER, (len(self._open_orders), len(self._delayed_orders)), records, turnover_records)
+
+    def set_snapshot(self, snapshot) -> None:
+        (n_open_orders, n_delayed_orders), (records, turnover_records) = unpack_snapshot(
+            BROKER_SNAPSHOT_HEADER, snapshot, ORDER_SNAPSHOT_DTYPE, TURNOVER_SNAPSHOT_DTYPE
+        )
+        available_order_book_ids = self._context.data_source.get_available_order_book_ids()
+        orders = []
+        for record, order_book_id in zip(records, available_order_book_ids[records["ordinal"]]):
+            order = Order.__from_snapshot_record__(record, order_book_id)
+            orders.append((self._context.get_account(order.order_book_id), order))
+        n_orders = n_open_orders + n_delayed_orders
+        self._open_orders, self._delayed_orders = orders[:n_open_orders], orders[n_open_orders:n_orders]
+        self._open_exercise_orders = orders[n_orders:]
+
+        turnovers = {}
+        for order_book_id, turnover in zip(available_order_book_ids[turnover_records["ordinal"]], turnover_records["turnover"].tolist()):
+            turnovers.setdefault(self._get_matcher(order_book_id), {})[order_book_id] = turnover
+        for matcher in self._matchers.values():
+            matcher.set_turnover(turnovers.get(matcher, {}))
+
+    def submit_order_batch(self, ordinals, quantities):
+        """
+        match a batch of market orders of the stock account at once, see order_target_weights_array, no Order nor
+        Trade object is created and the fills are published as one FILL_BATCH event per matcher, when the orders are
+        not matched at the current bar close they are submitted one by one as market orders
+        """
+        if len(ordinals) == 0:
+            return
+        order_book_ids = self._context.data_source.get_available_order_book_ids()[ordinals]
+        if not self._match_immediately:
+            self._submit_as_orders(order_book_ids, quantities)
+            return
+        matchers = [self._get_matcher(order_book_id) for order_book_id in order_book_ids]
+        first_matcher = matchers[0]
+        if all(matcher is first_matcher for matcher in matchers):
+            first_matcher.match_batch(self._context.get_account(order_book_ids[0]), ordinals, quantities)
+            return
+        # the orders of every matcher in the order of the batch
+        matchers = np.array(matchers, dtype=object)
+        for matcher in dict.fromkeys(matchers.tolist()):
+            positions = np.flatnonzero(matchers == matcher)
+            account = self._context.get_account(order_book_ids[int(positions[0])])
+            matcher.match_batch(account, ordinals[positions], quantities[positions])
+
+    def _submit_as_orders(self, order_book_ids, quantities):
+        prices = self._context.get_last_prices()[self._get_ordinals(order_book_ids)]
+        for order_book_id, quantity, price in zip(order_book_ids, quantities.tolist(), prices.tolist()):
+            if quantity > 0:
+                order = Order.__from_create__(order_book_id, quantity, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN,
+                                              context=self._context)
+            else:
+                order = Order.__from_create__(order_book_id, -quantity, SIDE.SELL, MarketOrder(), POSITION_EFFECT.CLOSE,
+                                              context=self._context)
+            order.set_frozen_price(price)
+            self.submit_order(order)
+
     def submit_order(self, order):
         if order.position_effect == POSITION_EFFECT.MATCH:
             raise TypeError("unsupported position_effect {}".format(order.position_effect))
+        if order.order_book_id not in self._context.data_source.get_available_order_book_ids():
+            raise ValueError("{} is not an order_book_id of the data source".format(order.order_book_id))
         account = self._context.get_account(order.order_book_id)
         self._context.event_bus.publish_event(Event(EVENT.ORDER_PENDING_NEW, account=account, order=order))
         if order.is_final():
@@ -64,11 +159,11 @@ class SimulationBroker(AbstractBroker):
     def cancel_order(self, order):
         account = self._context.get_account(order.order_book_id)
 
-        self._env.event_bus.publish_event(Event(EVENT.ORDER_PENDING_CANCEL, account=account, order=order))
+        self._context.event_bus.publish_event(Event(EVENT.ORDER_PENDING_CANCEL, account=account, order=order))
 
         order.mark_cancelled("{order_id} order has been cancelled by user.".format(order_id=order.order_id))
 
-        self._env.event_bus.publish_event(Event(EVENT.ORDER_CANCELLATION_PASS, account=account, order=order))
+        self._context.event_bus.publish_event(Event(EVENT.ORDER_CANCELLATION_PASS, account=account, order=order))
 
         try:
             self._open_orders.remove((account, order))
@@ -81,14 +176,14 @@ class SimulationBroker(AbstractBroker):
     def before_trading(self, _):
         for account, order in self._open_orders:
             order.active()
-            self._env.event_bus.publish_event(Event(EVENT.ORDER_CREATION_PASS, account=account, order=order))
+            self._context.event_bus.publish_event(Event(EVENT.ORDER_CREATION_PASS, account=account, order=order))
 
     def after_trading(self, __):
         for account, order in self._open_orders:
             order.mark_rejected("Order Rejected: {order_book_id} can not match. Market close.".format(
                 order_book_id=order.order_book_id
             ))
-            self._env.event_bus.publish_event(Event(EVENT.ORDER_UNSOLICITED_UPDATE, account=account, order=order))
+            self._context.event_bus.publish_event(Event(EVENT.ORDER_UNSOLICITED_UPDATE, account=account, order=order))
         self._open_orders = self._delayed_orders
         self._delayed_orders = []
 
@@ -110,4 +205,4 @@ class SimulationBroker(AbstractBroker):
 
         for account, order in final_orders:
             if order.status == ORDER_STATUS.REJECTED or order.status == ORDER_STATUS.CANCELLED:
-                self._env.event_bus.publish_event(Event(EVENT.ORDER_UNSOLICITED_UPDATE, account=account, order=order))
\ No newline at end of file
+                self._context.event_bus.publish_event(Event(EVENT.ORDER_UNSOLICITED_UPDATE, account=account, order=order))
\ No newline at end of file
@@ -6,15 +6,31 @@ import numpy as np
 import pandas as pd
 from enum import Enum
 from sharpe.core.events import EVENT
+from sharpe.const import SIDE, POSITION_EFFECT
+from sharpe.object.order import Order
+from sharpe.object.trade import Trade
 from sharpe.mod.sys_tracker.performance import calc_draw_down
+from sharpe.utils.snapshot import pack_snapshot, unpack_snapshot
 import pdb
 
+# the append only buffers of the Tracker, a snapshot keeps their lengths
+TRACKER_BUFFERS = (
+    "_orders", "_trades", "_fill_batches", "_total_portfolio", "_total_forward_portfolio",
+    "_portfolio_current_bar_returns", "_portfolio_forward_bar_returns",
+    "_portfolio_current_bar_pnl", "_portfolio_forward_bar_pnl", "trading_dt_list",
+    "_returns_mean", "_forward_bar_returns_mean", "_unit_sharpe_ratio", "_forward_bar_unit_sharpe_ratio",
+    "_draw_down", "_forward_bar_draw_down", "_max_draw_down", "_forward_bar_max_draw_down",
+)
+# rl_static_unit_net_value, rl_static_total_value and the lengths of TRACKER_BUFFERS
+TRACKER_SNAPSHOT_HEADER = "dd" + "Q" * len(TRACKER_BUFFERS)
+
 class Tracker(object):
     
     def __init__(self, context):
         self._context = context
         self._orders = []
         self._trades = []
+        self._fill_batches = []
         self._total_portfolio = []
         self._total_forward_portfolio = []
         self._portfolio_current_bar_returns = []
@@ -42,8 +58,29 @@ class Tracker(object):
         
         self._context.event_bus.add_listener(EVENT.POST_SYSTEM_INIT, self._subscribe_events)
     
+    def get_snapshot(self) -> bytes:
+        lengths = tuple(len(getattr(self, name)) for name in TRACKER_BUFFERS)
+        return pack_snapshot(TRACKER_SNAPSHOT_HEADER, (self._rl_static_unit_net_value, self._rl_static_total_value) + lengths)
+
+    def set_snapshot(self, snapshot) -> None:
+        """
+        truncate the buffers to their lengths in snapshot, the records appended since then are dropped, so the
+        snapshot should be taken earlier in the current episode(e.g. the initial one), a ValueError is raised
+        otherwise
+        """
+        header, _ = unpack_snapshot(TRACKER_SNAPSHOT_HEADER, snapshot)
+        for name, length in zip(TRACKER_BUFFERS, header[2:]):
+            if length > len(getattr(self, name)):
+                raise ValueError("the snapshot has {} records of {}, only {} are left, it was taken later in the episode".format(
+                    length, name, len(getattr(self, name))
+                ))
+        self._rl_static_unit_net_value, self._rl_static_total_value = header[:2]
+        for name, length in zip(TRACKER_BUFFERS, header[2:]):
+            del getattr(self, name)[length:]
+
     def _subscribe_events(self, event):
         self._context.event_bus.add_listener(EVENT.TRADE, self._collect_trade)
+        self._context.event_bus.add_listener(EVENT.FILL_BATCH, self._collect_fill_batch)
         self._context.event_bus.add_listener(EVENT.ORDER_CREATION_PASS, self._collect_order)
         self._context.event_bus.add_listener(EVENT.POST_SETTLEMENT, self._collect_daily)        
         self._context.event_bus.add_listener(EVENT.PRE_BAR, self._calculate_forward_reward)
@@ -51,6 +88,10 @@ class Tracker(object):
     def _collect_trade(self, event):
         self._trades.append(self._to_trade_record(event.trade))
     
+    def _collect_fill_batch(self, event):
+        self._fill_batches.append(event.fill_batch)
+        self._trades.extend(self._to_trade_records(event.fill_batch))
+    
     def _collect_order(self, event):
         self._orders.append(event.order)
     
@@ -128,6 +169,33 @@ class Tracker(object):
             'transaction_cost': trade.transaction_cost,
         }
     
+    def _to_trade_records(self, fill_batch):
+        """the _to_trade_record of every fill of fill_batch, no Order nor Trade object exists so the ids are drawn here"""
+        datetime = fill_batch.calendar_dt.strftime("%Y-%m-%d %H:%M:%S")
+        trading_datetime = fill_batch.trading_dt.strftime("%Y-%m-%d %H:%M:%S")
+        records = []
+        for order_book_id, quantity, price, commission, tax in zip(
+            fill_batch.order_book_ids, fill_batch.quantities.tolist(), fill_batch.prices.tolist(),
+            fill_batch.commissions.tolist(), fill_batch.taxes.tolist()
+        ):
+            side, position_effect = (SIDE.BUY, POSITION_EFFECT.OPEN) if quantity > 0 else (SIDE.SELL, POSITION_EFFECT.CLOSE)
+            records.append({
+                'datetime': datetime,
+                'trading_datetime': trading_datetime,
+                'order_book_id': order_book_id,
+                'symbol': order_book_id,
+                'side': self._safe_convert(side),
+                'position_effect': self._safe_convert(position_effect),
+                'exec_id': next(Trade.trade_id_gen),
+                'tax': tax,
+                'commission': commission,
+                'last_quantity': abs(quantity),
+                'last_price': self._safe_convert(price),
+                'order_id': next(Order.order_id_gen),
+                'transaction_cost': commission + tax,
+            })
+        return records
+    
     def _to_portfolio_record(self, dt, portfolio):
         return {
             'datetime': dt,
@@ -157,12 +225,15 @@ class Tracker(object):
     
     @property
     def bar_returns(self) -> pd.Series:
+        # the episode starts at start_bar_ordinal of the trading_dts
+        start = self._context.start_bar_ordinal
+        trading_dts = self._context.data_source.get_available_trading_dts()
         if self._context.mode == "rl":
             bar_returns_list = self._portfolio_forward_bar_returns 
-            bar_reutrns_s = pd.Series(bar_returns_list, index=self._context.available_trading_dts[:len(bar_returns_list)])
+            bar_reutrns_s = pd.Series(bar_returns_list, index=trading_dts[start: start + len(bar_returns_list)])
         else:
             bar_returns_list = self._portfolio_current_bar_returns
-            bar_reutrns_s = pd.Series(bar_returns_list, index=self._context.available_trading_dts[:len(bar_returns_list)])
+            bar_reutrns_s = pd.Series(bar_returns_list, index=trading_dts[start: start + len(bar_returns_list)])
         return bar_reutrns_s 
 
     
@@ -2,18 +2,37 @@
 # -*- coding: utf-8 -*-
 
 from collections import defaultdict
+import numpy as np
 from sharpe.core.context import Context
 from sharpe.const import SIDE, HEDGE_TYPE, COMMISSION_TYPE, POSITION_EFFECT
+from sharpe.utils.snapshot import pack_snapshot, unpack_snapshot
+
+# the minimum commission left to charge per order_id(commission_map)
+COMMISSION_SNAPSHOT_DTYPE = np.dtype([
+    ("order_id", np.int64),
+    ("commission", np.float64),
+])
 
 
 class StockTransactionCostDecider(object):
-    def __init__(self, commission_rate, commission_multiplier, min_commission):
+    def __init__(self, commission_rate, commission_multiplier, min_commission, context=None):
         self.commission_rate = commission_rate
         self.commission_multiplier = commission_multiplier
         self.commission_map = defaultdict(lambda: min_commission)
         self.min_commission = min_commission
 
-        self.context = Context.get_instance()
+        self.context = context or Context.get_instance()
+
+    def get_snapshot(self) -> bytes:
+        records = np.zeros(len(self.commission_map), dtype=COMMISSION_SNAPSHOT_DTYPE)
+        records["order_id"] = list(self.commission_map.keys())
+        records["commission"] = list(self.commission_map.values())
+        return pack_snapshot("", (), records)
+
+    def set_snapshot(self, snapshot) -> None:
+        _, (records,) = unpack_snapshot("", snapshot, COMMISSION_SNAPSHOT_DTYPE)
+        self.commission_map.clear()
+        self.commission_map.update(zip(records["order_id"].tolist(), records["commission"].tolist()))
 
     def _get_order_commission(self, order_book_id, side, price, quantity):
         commission = price * quantity * self.commission_rate * self.commission_multiplier
@@ -49,17 +68,29 @@ class StockTransactionCostDecider(object):
         tax = self._get_tax(order.order_book_id, order.side, order.frozen_price * order.quantity)
         return tax + commission
 
+    def get_batch_commissions(self, prices:np.ndarray, quantities:np.ndarray) -> np.ndarray:
+        """the commissions of fully filled orders, quantities are signed(negative to sell)"""
+        cost_commissions = prices * np.abs(quantities) * self.commission_rate * self.commission_multiplier
+        return np.maximum(cost_commissions, self.min_commission)
+
+    def get_batch_taxes(self, prices:np.ndarray, quantities:np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
 
 class CNStockTransactionCostDecider(StockTransactionCostDecider):
-    def __init__(self, commission_multiplier=1, min_commission=5, tax_multiplier=1):
-        super(CNStockTransactionCostDecider, self).__init__(0.0005, commission_multiplier, min_commission)
+    def __init__(self, commission_multiplier=1, min_commission=5, tax_multiplier=1, context=None):
+        super(CNStockTransactionCostDecider, self).__init__(0.0005, commission_multiplier, min_commission, context)
         self.tax_rate = 0.001
         self.tax_multiplier = tax_multiplier
 
     def _get_tax(self, order_book_id, side, cost_money):
-        instrument_type = Context.get_instance().data_source.instrument_type(order_book_id)
+        instrument_type = self.context.data_source.instrument_type(order_book_id)
         if instrument_type != 'CS':
             return 0
         return cost_money * self.tax_rate * self.tax_multiplier if side == SIDE.SELL else 0
 
+    def get_batch_taxes(self, prices:np.ndarray, quantities:np.ndarray) -> np.ndarray:
+        """the taxes of fully filled orders of common stocks, quantities are signed(negative to sell)"""
+        return np.where(quantities < 0, prices * np.abs(quantities) * self.tax_rate * self.tax_multiplier, 0.)
+
 
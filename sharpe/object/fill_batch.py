@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+class FillBatch(object):
+    """
+    the fills of a batch of orders matched at once, as columns instead of one Trade per order, a row per order with
+    the ordinal of its order_book_id(in data_source.get_available_order_book_ids()) and a signed quantity,
+    positive for a buy(open) and negative for a sell(close)
+    """
+    __slots__ = ("calendar_dt", "trading_dt", "order_book_ids", "ordinals", "quantities", "prices", "commissions", "taxes")
+
+    def __init__(self, calendar_dt, trading_dt, order_book_ids, ordinals, quantities, prices, commissions, taxes):
+        self.calendar_dt = calendar_dt
+        self.trading_dt = trading_dt
+        self.order_book_ids = order_book_ids
+        self.ordinals = ordinals
+        self.quantities = quantities
+        self.prices = prices
+        self.commissions = commissions
+        self.taxes = taxes
+
+    def __len__(self):
+        return len(self.quantities)
+
+    @property
+    def transaction_costs(self) -> np.ndarray:
+        return self.commissions + self.taxes
+
+    def __repr__(self):
+        return "FillBatch(trading_dt={}, fills={})".format(self.trading_dt, len(self))
@@ -3,6 +3,7 @@
 import time
 from decimal import Decimal
 import numpy as np
+import pandas as pd
 from datetime import datetime
 
 from sharpe.const import ORDER_STATUS, ORDER_TYPE, SIDE, POSITION_EFFECT, POSITION_DIRECTION
@@ -10,6 +11,23 @@ from sharpe.utils import id_gen, decimal_rounding_floor, get_position_direction
 from sharpe.utils.repr import property_repr, properties
 from sharpe.core.context import Context
 
+# one record per open Order in the binary snapshot of the broker, the order_book_id is stored by its ordinal in the
+# data source, the enums by value("" for None), the message and kwargs of an open order are empty and not kept
+ORDER_SNAPSHOT_DTYPE = np.dtype([
+    ("order_id", np.int64),
+    ("calendar_dt", "M8[us]"),
+    ("trading_dt", "M8[us]"),
+    ("ordinal", np.int64),
+    ("quantity", np.float64),
+    ("side", "U16"),
+    ("position_effect", "U16"),
+    ("filled_quantity", np.float64),
+    ("status", "U16"),
+    ("frozen_price", np.float64),
+    ("type", "U16"),
+    ("avg_price", np.float64),
+    ("transaction_cost", np.float64),
+])
 class Order(object):
 
     order_id_gen = id_gen(int(time.time()) * 10000)
@@ -77,8 +95,8 @@ class Order(object):
         self._kwargs = d['kwargs']
 
     @classmethod
-    def __from_create__(cls, order_book_id, quantity, side, style, position_effect, **kwargs):
-        context = Context.get_instance()
+    def __from_create__(cls, order_book_id, quantity, side, style, position_effect, context=None, **kwargs):
+        context = context or Context.get_instance()
         order = cls()
         order._order_id = next(order.order_id_gen)
         order._calendar_dt = context.calendar_dt
@@ -101,6 +119,34 @@ class Order(object):
         order._kwargs = kwargs
         return order
 
+    def get_snapshot_record(self, ordinal:int) -> tuple:
+        """the fields of an ORDER_SNAPSHOT_DTYPE record, ordinal is the one of the order_book_id in the data source"""
+        return (
+            self._order_id, np.datetime64(self._calendar_dt, "us"), np.datetime64(self._trading_dt, "us"), ordinal,
+            self._quantity, self._side.value, "" if self._position_effect is None else self._position_effect.value,
+            self._filled_quantity, self._status.value, self._frozen_price, self._type.value, self._avg_price, self._transaction_cost,
+        )
+
+    @classmethod
+    def __from_snapshot_record__(cls, record, order_book_id:str):
+        order = cls()
+        order._order_id = record["order_id"].item()
+        order._calendar_dt = pd.Timestamp(record["calendar_dt"])
+        order._trading_dt = pd.Timestamp(record["trading_dt"])
+        order._order_book_id = order_book_id
+        order._quantity = record["quantity"].item()
+        order._side = SIDE[str(record["side"])]
+        order._position_effect = POSITION_EFFECT[str(record["position_effect"])] if record["position_effect"] else None
+        order._message = ""
+        order._filled_quantity = record["filled_quantity"].item()
+        order._status = ORDER_STATUS[str(record["status"])]
+        order._frozen_price = record["frozen_price"].item()
+        order._type = ORDER_TYPE[str(record["type"])]
+        order._avg_price = record["avg_price"].item()
+        order._transaction_cost = record["transaction_cost"].item()
+        order._kwargs = {}
+        return order
+
     @property
     def order_id(self) -> int:
         """
@@ -33,7 +33,7 @@ class Trade(object):
     @classmethod
     def __from_create__(
             cls, order_id, price, amount, side, position_effect, order_book_id, commission=0., tax=0.,
-            trade_id=None, close_today_amount=0, frozen_price=0, calendar_dt=None, trading_dt=None
+            trade_id=None, close_today_amount=0, frozen_price=0, calendar_dt=None, trading_dt=None, context=None
     ):
 
         trade = cls()
@@ -48,7 +48,7 @@ class Trade(object):
                     frozen_price=frozen_price
                 ))
 
-        context = Context.get_instance()
+        context = context or Context.get_instance()
         trade._calendar_dt = calendar_dt or context.calendar_dt
         trade._trading_dt = trading_dt or context.trading_dt
         trade._price = price
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import multiprocessing
+import gym
+import numpy as np
+from sharpe.core.executor import INFO_DTYPE
+from sharpe.environment import TradingEnv
+from sharpe.data.shared_memory_data_source import (SharedDataSourceHandle, SharedMemoryDataSource,
+                                                    create_shared_array, attach_shared_array)
+from sharpe.utils.wrapper.numpy_wrapper import Numpy
+
+# ====================================================================== #
+# the workers only receive small commands through the pipes, the data    #
+# source, the actions and the (env, slot) ring buffers of observations,  #
+# rewards, dones and infos all live in shared memory                     #
+# ====================================================================== #
+
+HOLD, STEP, RESET, CLOSE = "hold", "step", "reset", "close"
+
+
+def _worker(remote, parent_remote, handle, env_indexes, buffer_specs, env_kwargs):
+    parent_remote.close()
+    data_source = SharedMemoryDataSource(handle)
+    shared_memories, buffers = [], {}
+    for name, spec in buffer_specs.items():
+        shared_memory, buffers[name] = attach_shared_array(spec)
+        shared_memories.append(shared_memory)
+
+    envs = [Numpy(TradingEnv(data_source=data_source, obs_format="numpy", **env_kwargs)) for _ in env_indexes]
+    # the last slot of every environment, an environment already done is not stepped and repeats it
+    last_slots = [None] * len(envs)
+    while True:
+        command, slot, kwargs = remote.recv()
+        if command == CLOSE:
+            break
+        try:
+            for j, (i, env) in enumerate(zip(env_indexes, envs)):
+                if command == RESET:
+                    seed = kwargs["seed"]
+                    buffers["observations"][i, slot] = env.reset(start_dt=kwargs["start_dt"], episode_length=kwargs["episode_length"],
+                                                                 seed=None if seed is None else seed + i)
+                    last_slots[j] = None
+                    continue
+                last_slot = last_slots[j]
+                last_slots[j] = slot
+                if last_slot is not None and buffers["dones"][i, last_slot]:
+                    if last_slot != slot:
+                        for name in ("observations", "dones", "infos"):
+                            buffers[name][i, slot] = buffers[name][i, last_slot]
+                    buffers["rewards"][i, slot] = 0
+                    continue
+                action = buffers["actions"][i] if command == STEP else None
+                state, reward, is_done, info = env.step(action)
+                buffers["observations"][i, slot] = state
+                buffers["rewards"][i, slot] = reward
+                buffers["dones"][i, slot] = is_done
+                buffers["infos"][i, slot] = info
+            remote.send(None)
+        except Exception as e:
+            remote.send(e)
+    remote.close()
+
+
+class SubprocVectorTradingEnv(gym.Env):
+    """
+    N TradingEnv(obs_format="numpy") stepped in lock-step by a pool of worker processes, the workers attach to
+    the DataSource published to shared memory and write their results into shared memory ring buffers,
+    the returned arrays are views of the slot of the step, valid for the following buffer_size - 1 steps
+    """
+
+    def __init__(self, data_source,
+                 num_envs,
+                 num_workers=None,
+                 buffer_size=2,
+                 look_backward_window=1,
+                 mode="non-rl",
+                 starting_cash={"STOCK":1000000},
+                 commission_multiplier=1,
+                 min_commission=5,
+                 tax_multiplier=1,
+                 start_method=None) -> None:
+        """
+        :param num_workers: the number of worker processes, os.cpu_count() by default and at most num_envs
+        :param buffer_size: the number of slots of the ring buffers
+        :param start_method: the multiprocessing start method, the platform default if None
+        """
+        self.num_envs = num_envs
+        self.num_workers = min(num_workers or os.cpu_count(), num_envs)
+        self.buffer_size = buffer_size
+        self.order_book_ids = data_source.get_available_order_book_ids()
+
+        self._handle = SharedDataSourceHandle(data_source)
+
+        n_order_book_ids, n_features = len(self.order_book_ids), len(data_source.feature_list)
+        if look_backward_window == 1:
+            obs_shape = (n_order_book_ids, n_features)
+        else:
+            obs_shape = (n_order_book_ids, look_backward_window, n_features)
+        self.action_space = gym.spaces.Box(0, 1, shape=(num_envs, n_order_book_ids), dtype=np.float32)
+        self.observation_space = gym.spaces.Box(low=-np.inf, high=np.inf, shape=(num_envs,) + obs_shape, dtype=np.float32)
+
+        buffer_layouts = {
+            "actions": ((num_envs, n_order_book_ids), np.float64),
+            "observations": ((num_envs, buffer_size) + obs_shape, data_source.panel.dtype),
+            "rewards": ((num_envs, buffer_size), np.float64),
+            "dones": ((num_envs, buffer_size), bool),
+            "infos": ((num_envs, buffer_size), INFO_DTYPE),
+        }
+        self._shared_memories, self._buffers, buffer_specs = [], {}, {}
+        for name, (shape, dtype) in buffer_layouts.items():
+            shared_memory, self._buffers[name] = create_shared_array(shape, dtype)
+            self._shared_memories.append(shared_memory)
+            buffer_specs[name] = (shared_memory.name, shape, np.dtype(dtype))
+
+        env_kwargs = {
+            "look_backward_window": look_backward_window,
+            "mode": mode,
+            "starting_cash": starting_cash,
+            "commission_multiplier": commission_multiplier,
+            "min_commission": min_commission,
+            "tax_multiplier": tax_multiplier,
+        }
+        mp_context = multiprocessing.get_context(start_method)
+        self._remotes, self._processes = [], []
+        for env_indexes in np.array_split(np.arange(num_envs), self.num_workers):
+            remote, worker_remote = mp_context.Pipe()
+            process = mp_context.Process(
+                target=_worker,
+                args=(worker_remote, remote, self._handle, env_indexes.tolist(), buffer_specs, env_kwargs),
+                daemon=True
+            )
+            process.start()
+            worker_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        self._slot = -1
+        self._closed = False
+
+    def _send(self, command, **kwargs):
+        self._slot = (self._slot + 1) % self.buffer_size
+        for remote in self._remotes:
+            remote.send((command, self._slot, kwargs))
+        # every reply is read before raising, a reply left in a pipe would answer the next command
+        errors = [remote.recv() for remote in self._remotes]
+        for error in errors:
+            if error is not None:
+                raise error
+        return self._slot
+
+    def reset(self, start_dt=None, episode_length=None, seed=None):
+        """
+        see VectorTradingEnv.reset, the environment i is seeded with seed + i
+        """
+        slot = self._send(RESET, start_dt=start_dt, episode_length=episode_length, seed=seed)
+        return self._buffers["observations"][:, slot]
+
+    def step(self, actions):
+        """
+        :param actions: (N, order_book_id) target weights, None to hold the positions of every environment
+        :return: the (N, ...) observations, the (N,) rewards and dones and the (N,) info records, see
+                 VectorTradingEnv.step for the environments already done
+        """
+        if actions is None:
+            slot = self._send(HOLD)
+        else:
+            self._buffers["actions"][:] = actions
+            slot = self._send(STEP)
+        return (self._buffers["observations"][:, slot], self._buffers["rewards"][:, slot],
+                self._buffers["dones"][:, slot], self._buffers["infos"][:, slot])
+
+    def close(self):
+        if self._closed:
+            return
+        for remote in self._remotes:
+            remote.send((CLOSE, None, None))
+        for process in self._processes:
+            process.join()
+        self._buffers = {}
+        for shared_memory in self._shared_memories:
+            shared_memory.unlink()
+            try:
+                shared_memory.close()
+            except BufferError:
+                # an observation returned by step is still referenced, the mapping goes with it
+                pass
+        self._handle.unlink()
+        self._closed = True
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
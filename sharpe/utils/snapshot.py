@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import struct
+import numpy as np
+
+# ====================================================================== #
+# binary snapshot layout: a little endian struct header, then every      #
+# array as its byte length(uint64) followed by its raw bytes, the dtypes #
+# are fixed by the owner of the snapshot and not stored                  #
+# ====================================================================== #
+
+_LENGTH = struct.Struct("<Q")
+
+
+def pack_snapshot(header_format:str, header:tuple, *arrays:np.ndarray) -> bytes:
+    """pack the header values with struct header_format followed by the arrays"""
+    chunks = [struct.pack("<" + header_format, *header)]
+    for array in arrays:
+        data = np.ascontiguousarray(array).tobytes()
+        chunks.append(_LENGTH.pack(len(data)))
+        chunks.append(data)
+    return b"".join(chunks)
+
+
+def unpack_snapshot(header_format:str, snapshot:bytes, *dtypes):
+    """the header tuple and one read only array per dtype of a snapshot made by pack_snapshot"""
+    header_struct = struct.Struct("<" + header_format)
+    header = header_struct.unpack_from(snapshot, 0)
+    offset = header_struct.size
+    arrays = []
+    for dtype in dtypes:
+        length, = _LENGTH.unpack_from(snapshot, offset)
+        offset += _LENGTH.size
+        arrays.append(np.frombuffer(snapshot, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset))
+        offset += length
+    return header, arrays
+
+
+def as_bytes_array(snapshot:bytes) -> np.ndarray:
+    """a nested snapshot as a uint8 array to be packed"""
+    return np.frombuffer(snapshot, dtype=np.uint8)
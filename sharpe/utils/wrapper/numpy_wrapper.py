@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import numpy as np
 import pandas as pd
 import gym
 
@@ -13,6 +14,9 @@ class Numpy(gym.Wrapper):
     
     def _convert_state(self, state):
         if isinstance(state, pd.DataFrame):
+            if state.size != np.prod(self.observation_space.shape):
+                raise ValueError("the state with shape {} can not be reshaped to {}, use TradingEnv(obs_format=\"padded\") "
+                                 "for unbalance data".format(state.shape, self.observation_space.shape))
             state = state.values.reshape(*self.observation_space.shape)
         return state
     
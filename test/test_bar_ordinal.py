@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+import unittest
+
+
+class TestBarOrdinal(unittest.TestCase):
+
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.trading_dts = self.data_source.get_available_trading_dts()
+
+    def test_context_tracks_the_ordinal(self):
+        for mode in ("non-rl", "rl"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            env.reset()
+            context = env.context
+            self.assertEqual(context.bar_ordinal, 1)
+            is_done = False
+            while not is_done:
+                self.assertEqual(self.trading_dts[context.bar_ordinal], context.trading_dt)
+                state, reward, is_done, info = env.step(None)
+            self.assertEqual(context.bar_ordinal, len(self.trading_dts) - 1)
+
+            env.reset()
+            self.assertEqual(context.bar_ordinal, 1)
+
+    def test_ordinal_access_same_as_dt_access(self):
+        order_book_id = self.data_source.get_available_order_book_ids()[0]
+        for bar_ordinal, dt in enumerate(self.trading_dts):
+            self.assertEqual(self.data_source.get_trading_dt_ordinal(dt), bar_ordinal)
+            np.testing.assert_array_equal(self.data_source.get_last_prices_at(bar_ordinal), self.data_source.get_last_prices(dt))
+            np.testing.assert_array_equal(self.data_source.get_previous_close_at(order_book_id, bar_ordinal),
+                                          self.data_source.get_previous_close(order_book_id, dt))
+            np.testing.assert_array_equal(self.data_source.get_last_price_at(order_book_id, bar_ordinal),
+                                          self.data_source.get_last_price(order_book_id, dt))
+            if bar_ordinal >= 1:
+                np.testing.assert_array_equal(self.data_source.history_bars_window_at(bar_ordinal, 2),
+                                              self.data_source.history_bars_window(dt, 2))
+        with self.assertRaises(ValueError):
+            self.data_source.history_bars_window_at(0, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import mock
+import numpy as np
 import pandas as pd
 from sharpe.data.data_source import DataSource
 from sharpe.utils.mock_data import create_toy_feature
@@ -39,6 +44,98 @@ class TestDataSource(unittest.TestCase):
         last_price_expected = 20.11
         self.assertEqual(last_price, last_price_expected)
     
+    def test_history_bars_array(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=555)
+        data_source = DataSource(feature_df=feature_df, price_s=price_s, dense=True)
+        availabel_dts = data_source.get_available_trading_dts()
+        
+        state = data_source.history_bars(dt=availabel_dts[3], bar_count=2)
+        state_array = data_source.history_bars_array(dt=availabel_dts[3], bar_count=2)
+        self.assertEqual(state_array.shape, (3, 2, 2))
+        self.assertTrue(np.shares_memory(state_array, data_source.panel))
+        np.testing.assert_array_equal(state_array.reshape(-1, 2), state.values)
+        
+        # the window is truncated at the first trading_dt
+        state_array = data_source.history_bars_array(dt=availabel_dts[0], bar_count=2)
+        self.assertEqual(state_array.shape, (3, 1, 2))
+    
+    def test_history_bars_array_unbalance(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=2, random_seed=555)
+        feature_df = feature_df.drop(index=pd.Timestamp("2020-01-01"), level=1).drop(index=("000002.XSHE", pd.Timestamp("2020-01-05")))
+        data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        
+        state_array = data_source.history_bars_array(dt=pd.Timestamp("2020-01-05"), bar_count=3)
+        self.assertTrue(np.isnan(state_array[1, -1]).all())
+        
+        # the universe of a trading_dt is a row of the membership bitmap
+        np.testing.assert_array_equal(data_source.get_universe(pd.Timestamp("2020-01-05")), [0])
+        np.testing.assert_array_equal(data_source.get_universe(pd.Timestamp("2020-01-06")), [0, 1])
+        self.assertFalse(data_source.is_alive("000002.XSHE", pd.Timestamp("2020-01-05")))
+        self.assertEqual(data_source.membership.shape, (10, 2))
+        state = data_source.history_bars(dt=pd.Timestamp("2020-01-05"), bar_count=3)
+        self.assertListEqual(list(state.index.get_level_values(0).unique()), ["000001.XSHE"])
+        np.testing.assert_array_equal(state_array[0, -1], feature_df.loc[("000001.XSHE", pd.Timestamp("2020-01-05"))].values)
+    
+    def test_last_prices_and_previous_close(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=555)
+        data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        order_book_ids = data_source.get_available_order_book_ids()
+        availabel_dts = data_source.get_available_trading_dts()
+        
+        last_prices = data_source.get_last_prices(dt=availabel_dts[3])
+        np.testing.assert_array_equal(last_prices, price_s.xs(availabel_dts[3], level=1).values)
+        
+        last_prices = data_source.get_last_prices(dt=availabel_dts[3], order_book_ids=[order_book_ids[2], order_book_ids[0]])
+        np.testing.assert_array_equal(last_prices, price_s.loc[[(order_book_ids[2], availabel_dts[3]), (order_book_ids[0], availabel_dts[3])]].values)
+        
+        previous_close = data_source.get_previous_close(order_book_id=order_book_ids[1], dt=availabel_dts[3])
+        self.assertEqual(previous_close, price_s.loc[(order_book_ids[1], availabel_dts[2])])
+        self.assertTrue(np.isnan(data_source.get_previous_close(order_book_id=order_book_ids[1], dt=availabel_dts[0])))
+    
+    def test_build_cache(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=555)
+        cache_dir = tempfile.mkdtemp()
+        try:
+            data_source = DataSource(feature_df=feature_df, price_s=price_s, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            
+            # the second build on the same data skip sorting and validation
+            with mock.patch.object(DataSource, "_build", side_effect=AssertionError), mock.patch.object(DataSource, "_validate", side_effect=AssertionError):
+                cached_data_source = DataSource(feature_df=feature_df, price_s=price_s, cache_dir=cache_dir)
+            dt = data_source.get_available_trading_dts()[3]
+            pd.testing.assert_frame_equal(cached_data_source.history_bars(dt, 2), data_source.history_bars(dt, 2))
+            np.testing.assert_array_equal(cached_data_source.get_last_prices(dt), data_source.get_last_prices(dt))
+            
+            # any change of the content is a new fingerprint
+            feature_df.iloc[0, 0] += 1
+            DataSource(feature_df=feature_df, price_s=price_s, validation="off", cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+        finally:
+            shutil.rmtree(cache_dir)
+    
+    def test_dtype_policy(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=555)
+        # the input dtype is kept by default
+        data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        dt = data_source.get_available_trading_dts()[3]
+        self.assertEqual(data_source.panel.dtype, np.float64)
+        self.assertEqual(data_source.history_bars_array(dt, 2).dtype, np.float64)
+        self.assertTrue((data_source.history_bars(dt, 2).dtypes == np.float64).all())
+        np.testing.assert_array_equal(data_source.history_bars(dt, 2).values, feature_df.loc[(slice(None), data_source.get_available_trading_dts()[2:4]), :].values)
+        
+        data_source = DataSource(feature_df=feature_df, price_s=price_s, feature_dtype=np.float32)
+        self.assertEqual(data_source.panel.dtype, np.float32)
+        self.assertEqual(data_source.history_bars_array(dt, 2).dtype, np.float32)
+        self.assertTrue((data_source.history_bars(dt, 2).dtypes == np.float32).all())
+        self.assertEqual(data_source.get_last_prices(dt).dtype, np.float64)
+        
+        data_source = DataSource(feature_df=feature_df, price_s=price_s, feature_dtype=None, encode_order_book_ids=True)
+        self.assertEqual(data_source.panel.dtype, np.float64)
+        state = data_source.history_bars(dt, 2)
+        self.assertEqual(state.index.get_level_values(0).dtype, np.int32)
+        self.assertListEqual(list(data_source.get_order_book_ids(state.index.get_level_values(0).unique())), list(data_source.get_available_order_book_ids()))
+        np.testing.assert_array_equal(state.values, feature_df.loc[(slice(None), data_source.get_available_trading_dts()[2:4]), :].values)
+    
 if __name__ == "__main__":
     unittest.main()
     
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv, VectorTradingEnv
+from sharpe.mod.sys_account.api import order_target_weights
+import unittest
+
+
+class TestEpisodeWindow(unittest.TestCase):
+
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, start="2020-01-01", end="2020-01-20", random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.trading_dts = self.data_source.get_available_trading_dts()
+
+    def _run(self, env):
+        records, is_done = [], False
+        while not is_done:
+            action = order_target_weights({"000001.XSHE": 0.3, "000002.XSHE": 0.4}, context=env.context)
+            state, reward, is_done, info = env.step(action)
+            records.append((env.trading_dt, reward, dict(info), env.context.portfolio.total_value))
+        return records
+
+    def test_window(self):
+        for mode in ("non-rl", "rl"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            env.reset()
+            self._run(env)
+
+            env.reset(start_dt=self.trading_dts[5], episode_length=4)
+            self.assertEqual(env.trading_dt, self.trading_dts[5])
+            records = self._run(env)
+            self.assertEqual(len(records), 4)
+            self.assertEqual(len(env.context.tracker.bar_returns), 4)
+            self.assertEqual(env.context.tracker.bar_returns.index[0], self.trading_dts[5])
+
+            # the same window of a fresh environment
+            fresh_env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            fresh_env.reset(start_dt=self.trading_dts[5], episode_length=4)
+            self.assertListEqual(self._run(fresh_env), records)
+
+            # until the last trading_dt
+            env.reset(start_dt=self.trading_dts[-4])
+            self.assertEqual(len(self._run(env)), 4 if mode == "non-rl" else 3)
+            self.assertEqual(env.trading_dt, self.trading_dts[-1])
+
+    def test_random_start(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode="rl")
+        start_dts = []
+        for seed in (1, 1, 2):
+            env.reset(episode_length=5, seed=seed)
+            start_dts.append(env.trading_dt)
+            self.assertEqual(len(self._run(env)), 5)
+        self.assertEqual(start_dts[0], start_dts[1])
+
+        with self.assertRaises(ValueError):
+            env.reset(episode_length=len(self.trading_dts))
+        with self.assertRaises(ValueError):
+            env.reset(start_dt=self.trading_dts[-3], episode_length=5)
+
+    def test_vector_env(self):
+        env = VectorTradingEnv(data_source=self.data_source, num_envs=3, look_backward_window=2)
+        observations = env.reset(episode_length=3, seed=0)
+        self.assertEqual(observations.shape[0], 3)
+        for i in range(3):
+            observations, rewards, dones, infos = env.step(np.full((3, 2), 0.3))
+            self.assertEqual(dones.all(), i == 2)
+
+if __name__ == "__main__":
+    unittest.main()
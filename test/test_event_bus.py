@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from sharpe.core.events import EventBus, Event, EVENT
+import unittest
+
+
+class TestEventBus(unittest.TestCase):
+    
+    def setUp(self):
+        self.event_bus = EventBus()
+        self.calls = []
+    
+    def _listener(self, name, stop=False):
+        def listener(event):
+            self.calls.append(name)
+            return stop
+        return listener
+    
+    def test_dispatch_order(self):
+        self.event_bus.add_listener(EVENT.BAR, self._listener("system"))
+        self.event_bus.add_listener(EVENT.BAR, self._listener("user"), user=True)
+        self.event_bus.prepend_listener(EVENT.BAR, self._listener("first", stop=True))
+        self.event_bus.add_listener(EVENT.PRE_BAR, self._listener("pre_bar"))
+        self.event_bus.compile()
+        
+        self.event_bus.publish_event(Event(EVENT.BAR))
+        # a system listener returning True stops the system listeners only
+        self.assertListEqual(self.calls, ["first", "user"])
+        
+        # no listener, nothing to do
+        self.event_bus.publish_event(Event(EVENT.POST_BAR))
+        self.assertListEqual(self.calls, ["first", "user"])
+    
+    def test_recompile_after_adding_listener(self):
+        self.event_bus.compile()
+        self.event_bus.publish_event(Event(EVENT.AFTER_TRADING))
+        self.assertListEqual(self.calls, [])
+        
+        self.event_bus.add_listener(EVENT.AFTER_TRADING, self._listener("after_trading"))
+        self.event_bus.publish_event(Event(EVENT.AFTER_TRADING))
+        self.assertListEqual(self.calls, ["after_trading"])
+    
+    def test_listener_added_while_publishing(self):
+        def subscribe(event):
+            self.event_bus.add_listener(EVENT.SETTLEMENT, self._listener("settlement"))
+        self.event_bus.add_listener(EVENT.POST_SYSTEM_INIT, subscribe)
+        self.event_bus.publish_event(Event(EVENT.POST_SYSTEM_INIT))
+        self.event_bus.publish_event(Event(EVENT.SETTLEMENT))
+        self.assertListEqual(self.calls, ["settlement"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import pandas as pd
+from sharpe.core.events import EVENT
+from sharpe.mod.sys_simulation.event_source import SimulationEventSource, BAR_EVENT_TYPES
+import unittest
+
+
+class TestSimulationEventSource(unittest.TestCase):
+    
+    def setUp(self):
+        self.trading_dts = pd.date_range(start="2020-01-01", end="2020-01-05")
+        self.event_source = SimulationEventSource()
+    
+    def test_bar_events(self):
+        first_bar_events = self.event_source.bar_events(self.trading_dts, 0)
+        self.assertListEqual([event.event_type for event in first_bar_events], list(BAR_EVENT_TYPES))
+        self.assertTrue(all(event.trading_dt == self.trading_dts[0] for event in first_bar_events))
+        
+        # the same preallocated events are rewritten for another bar
+        events = self.event_source.bar_events(self.trading_dts, 3)
+        self.assertIs(events, first_bar_events)
+        self.assertTrue(all(event.calendar_dt == event.trading_dt == self.trading_dts[3] for event in events))
+    
+    def test_rl_bar_events(self):
+        events = self.event_source.rl_bar_events(self.trading_dts, 1)
+        self.assertEqual(events[0].event_type, EVENT.BAR)
+        self.assertEqual(events[0].trading_dt, self.trading_dts[1])
+        self.assertEqual(events[-1].event_type, EVENT.PRE_BAR)
+        self.assertEqual(events[-1].trading_dt, self.trading_dts[2])
+        
+        with self.assertRaises(IndexError):
+            self.event_source.rl_bar_events(self.trading_dts, len(self.trading_dts) - 1)
+    
+    def test_pooled_iterators(self):
+        trading_dts = [events[0].trading_dt for events in self.event_source.iter_bar_events(self.trading_dts)]
+        self.assertListEqual(trading_dts, list(self.trading_dts))
+        self.assertEqual(len(list(self.event_source.iter_rl_bar_events(self.trading_dts))), len(self.trading_dts) - 1)
+    
+    def test_event_containers(self):
+        event_container = self.event_source.events(self.trading_dts)
+        self.assertListEqual(list(event_container), list(self.trading_dts))
+        for trading_dt, events in event_container.items():
+            self.assertListEqual([event.event_type for event in events], list(BAR_EVENT_TYPES))
+            self.assertTrue(all(event.trading_dt == trading_dt for event in events))
+        
+        rl_event_container = self.event_source._rl_events(self.trading_dts)
+        self.assertListEqual(list(rl_event_container), list(self.trading_dts[:-1]))
+        for trading_dt, events in rl_event_container.items():
+            self.assertEqual(events[0].trading_dt, trading_dt)
+            self.assertEqual(events[-1].event_type, EVENT.PRE_BAR)
+            self.assertGreater(events[-1].trading_dt, trading_dt)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+from sharpe.core.events import EVENT, EventBus, BarEvent
+from sharpe.core.executor import build_fused_plan, run_fused_plan
+from sharpe.mod.sys_account.api import order_target_weights
+import unittest
+
+
+class TestFusedExecutor(unittest.TestCase):
+    
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.target_weights = [
+            {"000001.XSHE": 0.5},
+            {"000001.XSHE": 0.2, "000002.XSHE": 0.3},
+            {"000002.XSHE": 0.6},
+            {},
+        ]
+    
+    def _run(self, env, on_step=None):
+        env.reset()
+        records = []
+        for i, target_weights in enumerate(self.target_weights):
+            if on_step is not None:
+                on_step(i, env)
+            state, reward, is_done, info = env.step(order_target_weights(target_weights, context=env.context))
+            records.append((reward, is_done, dict(info), env.context.portfolio.total_value))
+        return records
+    
+    def test_same_as_event_bus(self):
+        for mode in ("non-rl", "rl"):
+            fused_env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            self.assertIsNotNone(fused_env._executor._fused_plan)
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode, fused=False)
+            self.assertIsNone(env._executor._fused_plan)
+            
+            self.assertListEqual(self._run(fused_env), self._run(env))
+            # the ids come from process wide generators
+            strip_ids = lambda trades: [{k: v for k, v in trade.items() if k not in ("exec_id", "order_id")} for trade in trades]
+            self.assertListEqual(strip_ids(fused_env.context.tracker._trades), strip_ids(env.context.tracker._trades))
+    
+    def test_fall_back_to_event_bus(self):
+        for mode in ("non-rl", "rl"):
+            expected = self._run(TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode, fused=False))
+            
+            settled_dts = []
+            def on_step(i, env):
+                if i == 2:
+                    env.context.event_bus.add_listener(EVENT.SETTLEMENT, lambda event: settled_dts.append(event.trading_dt), user=True)
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            self.assertListEqual(self._run(env, on_step), expected)
+            self.assertIsNone(env._executor._fused_plan)
+            self.assertEqual(len(settled_dts), 2)
+
+    def test_stop_propagation(self):
+        class Module(object):
+            def __init__(self):
+                self.calls = []
+
+            def stop(self, event):
+                self.calls.append(("stop", event.event_type))
+                return True
+
+            def record(self, event):
+                self.calls.append(("record", event.event_type))
+
+            def record_user(self, event):
+                self.calls.append(("record_user", event.event_type))
+
+        module = Module()
+        event_bus = EventBus()
+        event_bus.add_listener(EVENT.PRE_BAR, module.record)
+        event_bus.add_listener(EVENT.BAR, module.record)
+        event_bus.add_listener(EVENT.BAR, module.stop)
+        event_bus.add_listener(EVENT.BAR, module.record)
+        event_bus.add_listener(EVENT.BAR, module.record_user, user=True)
+        event_bus.add_listener(EVENT.POST_BAR, module.record)
+        events = [BarEvent(EVENT.PRE_BAR), BarEvent(EVENT.BAR), BarEvent(EVENT.POST_BAR)]
+
+        for event in events:
+            event_bus.publish_event(event)
+        expected, module.calls = module.calls, []
+        run_fused_plan(build_fused_plan(event_bus, events, owners=[module]))
+        self.assertListEqual(module.calls, expected)
+        self.assertNotIn(("record", EVENT.BAR), expected[2:])
+
+if __name__ == "__main__":
+    unittest.main()
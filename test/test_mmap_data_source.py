@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from sharpe.data.data_source import DataSource
+from sharpe.data.mmap_data_source import MmapDataSource, compile_data_source
+from sharpe.environment import TradingEnv
+from sharpe.mod.sys_account.api import order_target_weights
+from sharpe.utils.mock_data import create_toy_feature
+import unittest
+
+
+class TestMmapDataSource(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=555)
+        # make it unbalance
+        feature_df = feature_df.drop(index=("000002.XSHE", pd.Timestamp("2020-01-05")))
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        compile_data_source(feature_df, price_s, self.path)
+        self.mmap_data_source = MmapDataSource(self.path)
+    
+    def tearDown(self):
+        shutil.rmtree(self.path)
+    
+    def test_same_contract_as_data_source(self):
+        self.assertListEqual(list(self.mmap_data_source.get_available_trading_dts()), list(self.data_source.get_available_trading_dts()))
+        self.assertListEqual(list(self.mmap_data_source.get_available_order_book_ids()), list(self.data_source.get_available_order_book_ids()))
+        self.assertIsInstance(self.mmap_data_source._price_matrix, np.memmap)
+        
+        order_book_ids = self.data_source.get_available_order_book_ids()
+        for dt in self.data_source.get_available_trading_dts():
+            for bar_count in (1, 3):
+                pd.testing.assert_frame_equal(self.mmap_data_source.history_bars(dt, bar_count), self.data_source.history_bars(dt, bar_count))
+                np.testing.assert_array_equal(self.mmap_data_source.history_bars_array(dt, bar_count), self.data_source.history_bars_array(dt, bar_count))
+            self.assertEqual(self.mmap_data_source.get_last_price(order_book_ids[0], dt), self.data_source.get_last_price(order_book_ids[0], dt))
+            np.testing.assert_array_equal(self.mmap_data_source.get_previous_close(order_book_ids[2], dt), self.data_source.get_previous_close(order_book_ids[2], dt))
+    
+    def test_chunked_compile(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=555)
+        feature_df = feature_df.drop(index=("000002.XSHE", pd.Timestamp("2020-01-05")))
+        path = tempfile.mkdtemp()
+        try:
+            data_source = compile_data_source(feature_df, price_s, path, chunk_rows=2)
+            np.testing.assert_array_equal(data_source._membership, self.mmap_data_source._membership)
+            np.testing.assert_array_equal(data_source._price_matrix, self.mmap_data_source._price_matrix)
+            for column, expected in zip(data_source._feature_columns, self.mmap_data_source._feature_columns):
+                np.testing.assert_array_equal(column, expected)
+            del data_source
+        finally:
+            shutil.rmtree(path)
+
+    def test_int_order_book_ids(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=555)
+        # the order_book_ids as int codes, 000001.XSHE -> 1
+        codes = {order_book_id: int(order_book_id[:6]) for order_book_id in feature_df.index.get_level_values(0).unique()}
+        feature_df = feature_df.rename(index=codes, level=0)
+        price_s = price_s.rename(index=codes, level=0)
+        path = tempfile.mkdtemp()
+        try:
+            data_source = compile_data_source(feature_df, price_s, path)
+            order_book_ids = data_source.get_available_order_book_ids()
+            self.assertEqual(order_book_ids.dtype, np.int64)
+            self.assertListEqual(list(order_book_ids), [1, 2, 3])
+            
+            expected = DataSource(feature_df=feature_df, price_s=price_s)
+            dt = expected.get_available_trading_dts()[3]
+            pd.testing.assert_frame_equal(data_source.history_bars(dt, 2), expected.history_bars(dt, 2))
+            self.assertEqual(data_source.get_last_price(2, dt), expected.get_last_price(2, dt))
+            del data_source
+        finally:
+            shutil.rmtree(path)
+
+    def test_trading_env(self):
+        rewards = []
+        for data_source in (self.data_source, self.mmap_data_source):
+            env = TradingEnv(data_source=data_source, look_backward_window=2)
+            env.reset()
+            env_rewards = []
+            for target_weight in (0.5, 0.2, 0.3):
+                state, reward, is_done, info = env.step(action=order_target_weights({"000001.XSHE": target_weight}))
+                env_rewards.append(reward)
+            rewards.append(env_rewards)
+        self.assertListEqual(rewards[0], rewards[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+import numpy as np
+import pandas as pd
+from sharpe.environment import TradingEnv, VectorTradingEnv
+from sharpe.subproc_environment import SubprocVectorTradingEnv
+from sharpe.data.shared_memory_data_source import SharedDataSourceHandle, SharedMemoryDataSource
+from sharpe.core.context import Context
+from sharpe.mod.sys_account.api import order_target_weights
+import unittest
+
+
+class TestMultipleEnvironments(unittest.TestCase):
+    
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.target_weights = {
+            "rl": [0.5, 0.2, 0.8, 0.3],
+            "non-rl": [0.3, 0.6, 0.1, 0.4],
+        }
+    
+    def _run(self, env, target_weights):
+        env.reset()
+        rewards = []
+        for target_weight in target_weights:
+            action = order_target_weights({"000001.XSHE": target_weight}, context=env.context)
+            state, reward, is_done, info = env.step(action)
+            rewards.append(reward)
+        return rewards, env.context.portfolio.total_value
+    
+    def test_interleaved_environments_are_independent(self):
+        expected = {}
+        for mode, target_weights in self.target_weights.items():
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            expected[mode] = self._run(env, target_weights)
+        
+        envs = {mode: TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode) for mode in self.target_weights}
+        for env in envs.values():
+            env.reset()
+        rewards = {mode: [] for mode in envs}
+        for i in range(4):
+            for mode, env in envs.items():
+                action = order_target_weights({"000001.XSHE": self.target_weights[mode][i]}, context=env.context)
+                state, reward, is_done, info = env.step(action)
+                rewards[mode].append(reward)
+        
+        for mode, env in envs.items():
+            self.assertListEqual(rewards[mode], expected[mode][0])
+            self.assertEqual(env.context.portfolio.total_value, expected[mode][1])
+    
+    def test_current_context(self):
+        first_env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        second_env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        self.assertIs(Context.get_instance(), second_env.context)
+        
+        first_env.step([])
+        self.assertIs(Context.get_instance(), first_env.context)
+        
+        with second_env.context:
+            self.assertIs(Context.get_instance(), second_env.context)
+        self.assertIs(Context.get_instance(), first_env.context)
+
+
+class TestVectorTradingEnv(unittest.TestCase):
+    
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        # (step, env, order_book_id)
+        self.weights = np.array([
+            [[0.5, 0.0], [0.2, 0.3], [0.0, 0.0]],
+            [[0.1, 0.4], [0.2, 0.3], [0.6, 0.3]],
+            [[0.0, 0.9], [0.5, 0.1], [0.3, 0.3]],
+        ])
+    
+    def test_same_as_single_environments(self):
+        for mode in ("non-rl", "rl"):
+            for obs_format in ("numpy", "padded"):
+                vector_env = VectorTradingEnv(data_source=self.data_source, num_envs=3, look_backward_window=2, mode=mode, obs_format=obs_format)
+                observations = vector_env.reset()
+                vector_rewards = []
+                for weights in self.weights:
+                    observations, rewards, dones, infos = vector_env.step(weights)
+                    vector_rewards.append(rewards)
+                vector_rewards = np.array(vector_rewards)
+                
+                for i in range(3):
+                    env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode, obs_format=obs_format)
+                    env.reset()
+                    for step, weights in enumerate(self.weights):
+                        target_weights = {order_book_id: weight for order_book_id, weight in zip(["000001.XSHE", "000002.XSHE"], weights[i]) if weight > 0}
+                        state, reward, is_done, info = env.step(order_target_weights(target_weights, context=env.context))
+                        self.assertEqual(vector_rewards[step, i], reward)
+                    if obs_format == "numpy":
+                        np.testing.assert_array_equal(observations[i], state)
+                    else:
+                        np.testing.assert_array_equal(observations["features"][i], state["features"])
+    
+    def test_shared_observation(self):
+        vector_env = VectorTradingEnv(data_source=self.data_source, num_envs=4, look_backward_window=2)
+        observations = vector_env.reset()
+        self.assertEqual(observations.shape, vector_env.observation_space.shape)
+        # one observation broadcasted over the environments on the same trading_dt
+        self.assertEqual(observations.strides[0], 0)
+        observations, rewards, dones, infos = vector_env.step(None)
+        self.assertEqual(rewards.shape, (4,))
+        self.assertEqual(dones.shape, (4,))
+
+    def test_step_past_the_end(self):
+        trading_dts = self.data_source.get_available_trading_dts()
+        weights = np.array([[0.5, 0.3], [0.2, 0.3]])
+        target_weights = {"000001.XSHE": 0.5, "000002.XSHE": 0.3}
+        for mode in ("non-rl", "rl"):
+            vector_env = VectorTradingEnv(data_source=self.data_source, num_envs=2, look_backward_window=2, mode=mode)
+            vector_env.reset()
+            # the first environment ends well before the second one
+            vector_env.envs[0]._reset(start_dt=trading_dts[-3])
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode, obs_format="numpy")
+            env.reset(start_dt=trading_dts[-3])
+            is_done, n_steps = False, 0
+            while not is_done:
+                state, reward, is_done, info = env.step(order_target_weights(target_weights, context=env.context))
+                observations, rewards, dones, infos = vector_env.step(weights)
+                self.assertEqual(rewards[0], reward)
+                n_steps += 1
+            self.assertListEqual(list(dones), [True, False])
+            expected = (state.copy(), info.copy(), env.context.portfolio.total_value, list(env.context.tracker._total_portfolio))
+
+            for _ in range(3):
+                observations, rewards, dones, infos = vector_env.step(weights)
+                self.assertListEqual(list(dones), [True, False])
+                self.assertEqual(rewards[0], 0)
+                np.testing.assert_array_equal(observations[0], expected[0])
+                self.assertEqual(infos[0], expected[1])
+                # the finished environment is not replayed
+                self.assertEqual(vector_env.envs[0].context.portfolio.total_value, expected[2])
+                self.assertListEqual(vector_env.envs[0].context.tracker._total_portfolio, expected[3])
+
+class TestSubprocVectorTradingEnv(unittest.TestCase):
+    
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.weights = np.array([
+            [[0.5, 0.0], [0.2, 0.3], [0.0, 0.0]],
+            [[0.1, 0.4], [0.2, 0.3], [0.6, 0.3]],
+            [[0.0, 0.9], [0.5, 0.1], [0.3, 0.3]],
+        ])
+    
+    def test_shared_memory_data_source(self):
+        handle = SharedDataSourceHandle(self.data_source)
+        try:
+            data_source = SharedMemoryDataSource(handle)
+            order_book_id = self.data_source.get_available_order_book_ids()[0]
+            for dt in self.data_source.get_available_trading_dts()[1:]:
+                np.testing.assert_array_equal(data_source.history_bars_window(dt, 2), self.data_source.history_bars_window(dt, 2))
+                np.testing.assert_array_equal(data_source.get_last_prices(dt), self.data_source.get_last_prices(dt))
+                self.assertEqual(data_source.get_previous_close(order_book_id, dt), self.data_source.get_previous_close(order_book_id, dt))
+                pd.testing.assert_frame_equal(data_source.history_bars(dt, 2), self.data_source.history_bars(dt, 2))
+            del data_source
+        finally:
+            handle.unlink()
+    
+    def test_same_as_vector_environment(self):
+        for mode in ("non-rl", "rl"):
+            subproc_env = SubprocVectorTradingEnv(data_source=self.data_source, num_envs=3, num_workers=2, look_backward_window=2, mode=mode)
+            vector_env = VectorTradingEnv(data_source=self.data_source, num_envs=3, look_backward_window=2, mode=mode)
+            try:
+                np.testing.assert_array_equal(subproc_env.reset(), vector_env.reset())
+                for weights in self.weights:
+                    observations, rewards, dones, infos = subproc_env.step(weights)
+                    expected_observations, expected_rewards, expected_dones, expected_infos = vector_env.step(weights)
+                    np.testing.assert_array_equal(observations, expected_observations)
+                    np.testing.assert_array_equal(rewards, expected_rewards)
+                    np.testing.assert_array_equal(dones, expected_dones)
+                    np.testing.assert_array_equal(infos["max_draw_down"], [info["max_draw_down"] for info in expected_infos])
+            finally:
+                subproc_env.close()
+
+    def test_worker_error(self):
+        subproc_env = SubprocVectorTradingEnv(data_source=self.data_source, num_envs=2, num_workers=2, look_backward_window=2, mode="rl")
+        try:
+            subproc_env.reset()
+            with self.assertRaises(RuntimeError):
+                # the total weight is above 1
+                subproc_env.step(np.full((2, 2), 0.9))
+            # the replies of the other workers were read, the next command gets its own
+            np.testing.assert_array_equal(subproc_env.reset(), subproc_env.reset())
+        finally:
+            subproc_env.close()
+
+    def test_reset_window(self):
+        trading_dts = self.data_source.get_available_trading_dts()
+        subproc_env = SubprocVectorTradingEnv(data_source=self.data_source, num_envs=3, num_workers=2, look_backward_window=2)
+        vector_env = VectorTradingEnv(data_source=self.data_source, num_envs=3, look_backward_window=2)
+        try:
+            for kwargs in ({"start_dt": trading_dts[4], "episode_length": 3}, {"episode_length": 3, "seed": 5}):
+                np.testing.assert_array_equal(subproc_env.reset(**kwargs), vector_env.reset(**kwargs))
+                for i in range(3):
+                    observations, rewards, dones, infos = subproc_env.step(self.weights[i])
+                    expected_observations, expected_rewards, expected_dones, expected_infos = vector_env.step(self.weights[i])
+                    np.testing.assert_array_equal(observations, expected_observations)
+                    np.testing.assert_array_equal(dones, expected_dones)
+                self.assertTrue(dones.all())
+                # the environments already done are not stepped
+                observations, rewards, dones, infos = subproc_env.step(self.weights[0])
+                expected_observations, expected_rewards, expected_dones, expected_infos = vector_env.step(self.weights[0])
+                np.testing.assert_array_equal(observations, expected_observations)
+                np.testing.assert_array_equal(rewards, 0)
+                self.assertTrue(dones.all())
+                np.testing.assert_array_equal(infos["max_draw_down"], [info["max_draw_down"] for info in expected_infos])
+        finally:
+            subproc_env.close()
+
+if __name__ == "__main__":
+    unittest.main()
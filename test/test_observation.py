@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.mod.sys_account.api import order_target_weights
+from unittest import mock
+import unittest
+
+
+def create_unbalance_data_source():
+    feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=111)
+    # 000002.XSHE is listed on 2020-01-04, 000003.XSHE is suspended on 2020-01-06
+    feature_df = feature_df.drop(index=[("000002.XSHE", dt) for dt in pd.date_range("2020-01-01", "2020-01-03")])
+    feature_df = feature_df.drop(index=("000003.XSHE", pd.Timestamp("2020-01-06")))
+    return DataSource(feature_df=feature_df, price_s=price_s), feature_df
+
+
+class TestPaddedObservation(unittest.TestCase):
+    
+    def setUp(self):
+        self.data_source, self.feature_df = create_unbalance_data_source()
+    
+    def test_history_bars_padded(self):
+        features, mask = self.data_source.history_bars_padded(dt=pd.Timestamp("2020-01-04"), bar_count=3)
+        self.assertEqual(features.shape, (3, 3, 2))
+        self.assertEqual(features.dtype, np.float32)
+        np.testing.assert_array_equal(mask, [[True, True, True], [False, False, True], [True, True, True]])
+        np.testing.assert_array_equal(features[1, :2], 0)
+        np.testing.assert_array_equal(features[1, 2], self.feature_df.loc[("000002.XSHE", pd.Timestamp("2020-01-04"))].values.astype(np.float32))
+        
+        # the head of the window before the first trading_dt is padded
+        features, mask = self.data_source.history_bars_padded(dt=pd.Timestamp("2020-01-01"), bar_count=3, out=features, mask=mask)
+        np.testing.assert_array_equal(mask, [[False, False, True], [False, False, False], [False, False, True]])
+    
+    def test_trading_env(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2, obs_format="padded")
+        state = env.reset()
+        features, mask = state["features"], state["mask"]
+        self.assertTrue(env.observation_space.contains(state))
+        
+        is_done = False
+        while not is_done:
+            state, reward, is_done, info = env.step(action=None)
+            # the same buffers are refilled every step
+            self.assertIs(state["features"], features)
+            self.assertIs(state["mask"], mask)
+            self.assertEqual(features.shape, (3, 2, 2))
+            if env.trading_dt == pd.Timestamp("2020-01-06"):
+                np.testing.assert_array_equal(mask[2], [True, False])
+
+
+class TestSlidingWindow(unittest.TestCase):
+    
+    def test_sliding_window_view(self):
+        data_source, _ = create_unbalance_data_source()
+        trading_dts = data_source.get_available_trading_dts()
+        windows = data_source.sliding_window_view(3)
+        self.assertEqual(windows.shape, (len(trading_dts) - 2, 3, 3, 2))
+        self.assertTrue(np.shares_memory(windows, data_source.panel))
+        self.assertIs(data_source.sliding_window_view(3), windows)
+        
+        for dt in trading_dts[2:]:
+            state = data_source.history_bars_window(dt=dt, bar_count=3)
+            self.assertTrue(np.shares_memory(state, data_source.panel))
+            np.testing.assert_array_equal(state, data_source.history_bars_array(dt=dt, bar_count=3))
+        
+        with self.assertRaises(ValueError):
+            data_source.history_bars_window(dt=trading_dts[1], bar_count=3)
+    
+    def test_read_only(self):
+        data_source, _ = create_unbalance_data_source()
+        trading_dts = data_source.get_available_trading_dts()
+        panel = data_source.panel.copy()
+        for view in (data_source.sliding_window_view(3)[0], data_source.history_bars_window(dt=trading_dts[-1], bar_count=3),
+                     data_source.history_bars_array(dt=trading_dts[-1], bar_count=3), data_source.panel):
+            self.assertFalse(view.flags.writeable)
+            with self.assertRaises(ValueError):
+                view[0, 0, 0] = 1.
+        np.testing.assert_array_equal(data_source.panel, panel)
+
+
+class TestNumpyObservation(unittest.TestCase):
+    
+    def run_env(self, obs_format, mode, look_backward_window):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=111)
+        data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        env = TradingEnv(data_source=data_source, look_backward_window=look_backward_window, mode=mode, obs_format=obs_format)
+        states, rewards, infos = [env.reset()], [], []
+        is_done = False
+        while not is_done:
+            action = order_target_weights({"000001.XSHE": 0.3, "000003.XSHE": 0.2 * len(rewards) % 0.6})
+            state, reward, is_done, info = env.step(action=action)
+            states.append(state.copy() if obs_format == "numpy" else state.values.reshape(*env.observation_space.shape))
+            rewards.append(reward)
+            infos.append(dict(info) if obs_format != "numpy" else {k: info[k].item() for k in info.dtype.names})
+        return states, rewards, infos, info
+    
+    def test_same_as_dataframe(self):
+        for mode in ("rl", "non-rl"):
+            for look_backward_window in (1, 2):
+                with mock.patch.object(DataSource, "history_bars", side_effect=AssertionError):
+                    states, rewards, infos, info = self.run_env("numpy", mode, look_backward_window)
+                expect_states, expect_rewards, expect_infos, _ = self.run_env("dataframe", mode, look_backward_window)
+                
+                self.assertIsInstance(info, np.ndarray)
+                self.assertListEqual(rewards, expect_rewards)
+                self.assertListEqual(infos, expect_infos)
+                for state, expect_state in zip(states[1:], expect_states[1:]):
+                    np.testing.assert_array_equal(state, expect_state)
+    
+    def test_read_only(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=2, random_seed=111)
+        data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        for look_backward_window in (1, 2):
+            env = TradingEnv(data_source=data_source, look_backward_window=look_backward_window, obs_format="numpy")
+            state = env.reset()
+            panel = data_source.panel.copy()
+            self.assertFalse(state.flags.writeable)
+            with self.assertRaises(ValueError):
+                state[0] = 1.
+            state, reward, is_done, info = env.step(action=None)
+            self.assertFalse(state.flags.writeable)
+            with self.assertRaises(ValueError):
+                state += 1.
+            np.testing.assert_array_equal(data_source.panel, panel)
+
+if __name__ == "__main__":
+    unittest.main()
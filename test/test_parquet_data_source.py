@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import importlib.util
+import numpy as np
+import pandas as pd
+from sharpe.data.data_source import DataSource
+from sharpe.data.parquet_data_source import ParquetDataSource
+from sharpe.environment import TradingEnv
+from sharpe.mod.sys_account.api import order_target_weights
+from sharpe.utils.mock_data import create_toy_feature
+import unittest
+
+
+@unittest.skipIf(importlib.util.find_spec("pyarrow") is None, "pyarrow is not installed")
+class TestParquetDataSource(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        feature_df, price_s = create_toy_feature(order_book_ids_number=3, feature_number=3, random_seed=555)
+        feature_df = feature_df.drop(index=("000002.XSHE", pd.Timestamp("2020-01-05")))
+        price_s = price_s.drop(index=("000002.XSHE", pd.Timestamp("2020-01-05")))
+        # one partition per trading day
+        for dt, partition in feature_df.join(price_s).groupby(level=1):
+            partition.droplevel(1).reset_index().to_parquet(os.path.join(self.path, "{:%Y-%m-%d}.parquet".format(dt)))
+        
+        self.columns = ["feature_1", "feature_3"]
+        self.data_source = DataSource(feature_df=feature_df[self.columns], price_s=price_s)
+        self.parquet_data_source = ParquetDataSource(self.path, columns=self.columns, cache_size=3)
+    
+    def tearDown(self):
+        self.parquet_data_source.close()
+        shutil.rmtree(self.path)
+    
+    def test_same_contract_as_data_source(self):
+        self.assertListEqual(list(self.parquet_data_source.get_available_trading_dts()), list(self.data_source.get_available_trading_dts()))
+        self.assertListEqual(list(self.parquet_data_source.get_available_order_book_ids()), list(self.data_source.get_available_order_book_ids()))
+        self.assertListEqual(self.parquet_data_source.feature_list, self.columns)
+        
+        order_book_ids = self.data_source.get_available_order_book_ids()
+        for dt in self.data_source.get_available_trading_dts():
+            pd.testing.assert_frame_equal(self.parquet_data_source.history_bars(dt, 3), self.data_source.history_bars(dt, 3))
+            np.testing.assert_array_equal(self.parquet_data_source.history_bars_array(dt, 3), self.data_source.history_bars_array(dt, 3))
+            np.testing.assert_array_equal(self.parquet_data_source.get_last_prices(dt), self.data_source.get_last_prices(dt))
+            self.assertEqual(self.parquet_data_source.get_last_price(order_book_ids[0], dt), self.data_source.get_last_price(order_book_ids[0], dt))
+            # the LRU only covers the look_backward_window
+            self.assertLessEqual(len(self.parquet_data_source._partitions), 3)
+    
+    def test_missing_price_and_window(self):
+        # 000002.XSHE is not in the partition of 2020-01-05
+        dt = pd.Timestamp("2020-01-05")
+        self.assertTrue(np.isnan(self.parquet_data_source.get_last_price("000002.XSHE", dt)))
+        self.assertTrue(np.isnan(self.data_source.get_last_price("000002.XSHE", dt)))
+        self.assertTrue(np.isnan(self.parquet_data_source.get_last_price("000009.XSHE", dt)))
+        
+        # a look_backward_window larger than the LRU is rejected instead of growing it
+        with self.assertRaises(ValueError):
+            self.parquet_data_source.history_bars(dt, 4)
+        with self.assertRaises(ValueError):
+            self.parquet_data_source.history_bars_array(dt, 4)
+        self.assertEqual(self.parquet_data_source._cache_size, 3)
+    
+    def test_trading_env(self):
+        rewards = []
+        for data_source in (self.data_source, self.parquet_data_source):
+            env = TradingEnv(data_source=data_source, look_backward_window=2)
+            env.reset()
+            env_rewards = []
+            for target_weight in (0.5, 0.2, 0.3):
+                state, reward, is_done, info = env.step(action=order_target_weights({"000001.XSHE": target_weight}))
+                env_rewards.append(reward)
+            rewards.append(env_rewards)
+        self.assertListEqual(rewards[0], rewards[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+from sharpe.const import POSITION_DIRECTION
+from sharpe.core.events import EVENT
+from sharpe.mod.sys_account.api import order_target_weights, get_position
+from sharpe.mod.sys_account.account import Account
+from sharpe.object.order import Order, MarketOrder
+from sharpe.const import SIDE, POSITION_EFFECT
+import unittest
+
+
+class TestPositionBook(unittest.TestCase):
+
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=10, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.order_book_ids = self.data_source.get_available_order_book_ids()
+        rng = np.random.RandomState(7)
+        self.weights = []
+        for _ in range(6):
+            weights = rng.uniform(size=len(self.order_book_ids)) * (rng.uniform(size=len(self.order_book_ids)) > 0.4)
+            self.weights.append(weights / weights.sum() * 0.95)
+
+    def test_aggregates_of_the_views(self):
+        for action in ("orders", "weights"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+            env.reset()
+            account = env.context.portfolio.stock_account
+            for weights in self.weights:
+                if action == "orders":
+                    env.step(order_target_weights(dict(zip(self.order_book_ids, weights)), context=env.context))
+                else:
+                    env.step(weights)
+                positions = list(account.get_positions())
+                self.assertAlmostEqual(account.market_value, sum(p.market_value * (1 if p.direction == POSITION_DIRECTION.LONG else -1) for p in positions))
+                self.assertAlmostEqual(account.equity, sum(p.equity for p in positions))
+                self.assertAlmostEqual(account.transaction_cost, sum(p.transaction_cost for p in positions))
+                self.assertAlmostEqual(account.trading_pnl, sum(p.trading_pnl for p in positions))
+                self.assertAlmostEqual(account.position_pnl, sum(p.position_pnl for p in positions))
+                self.assertTrue(all(p.quantity > 0 for p in positions if p.direction == POSITION_DIRECTION.LONG))
+
+    def test_cached_aggregates(self):
+        for mode in ("non-rl", "rl"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            env.reset()
+            portfolio = env.context.portfolio
+            account = portfolio.stock_account
+            book = account._book
+
+            def check(event=None):
+                expected = book.recompute()
+                for name, value in book.get_totals().items():
+                    self.assertAlmostEqual(value, expected[name], places=6)
+                total_value = account._total_cash + expected["equity"]
+                self.assertAlmostEqual(portfolio.total_value, total_value, places=6)
+                self.assertAlmostEqual(portfolio.market_value, expected["market_value"], places=6)
+                self.assertAlmostEqual(portfolio.unit_net_value, total_value / portfolio.units)
+                self.assertAlmostEqual(portfolio.daily_returns, total_value / portfolio.units / portfolio.static_unit_net_value - 1)
+
+            # after every trade, price update and settlement
+            for event_type in (EVENT.TRADE, EVENT.FILL_BATCH, EVENT.PRE_BAR, EVENT.SETTLEMENT, EVENT.POST_SETTLEMENT):
+                env.context.event_bus.add_listener(event_type, check)
+            for i, weights in enumerate(self.weights):
+                if i % 2:
+                    env.step(order_target_weights(dict(zip(self.order_book_ids, weights)), context=env.context))
+                else:
+                    env.step(weights)
+                check()
+
+            # a write through a view updates the totals by its delta
+            market_value, total_value = account.market_value, portfolio.total_value
+            position = next(p for p in account.get_positions() if p.quantity > 0)
+            position.update_last_price(position.last_price * 2)
+            self.assertAlmostEqual(account.market_value, market_value + position.market_value / 2)
+            self.assertAlmostEqual(portfolio.total_value, total_value + position.market_value / 2)
+            check()
+
+    def test_cached_portfolio_values(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        env.step(self.weights[0])
+        portfolio = env.context.portfolio
+        # read once per change
+        total_value = portfolio.total_value
+        portfolio.stock_account._book.get_equity = None
+        self.assertEqual(portfolio.total_value, total_value)
+        self.assertEqual(portfolio.unit_net_value, total_value / portfolio.units)
+
+    def test_mark_to_market(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        env.step(order_target_weights({"000001.XSHE": 0.3, "000002.XSHE": 0.3}, context=env.context))
+        account = env.context.portfolio.stock_account
+        first = account.get_position("000001.XSHE", POSITION_DIRECTION.LONG)
+        second = account.get_position("000002.XSHE", POSITION_DIRECTION.LONG)
+        last_price = first.last_price
+
+        # no price for 000001.XSHE at the next bar, it keeps its last price
+        bar_ordinal = env.context.bar_ordinal
+        self.data_source._price_matrix[bar_ordinal, self.order_book_ids.get_loc("000001.XSHE")] = np.nan
+        account._update_last_price(None)
+        self.assertEqual(first.last_price, last_price)
+        self.assertEqual(account.get_position("000001.XSHE", POSITION_DIRECTION.SHORT).last_price, last_price)
+        self.assertEqual(second.last_price, env.context.get_last_price("000002.XSHE"))
+        self.assertAlmostEqual(account.market_value, first.market_value + second.market_value)
+
+    def test_views(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        env.step(order_target_weights({"000001.XSHE": 0.5}, context=env.context))
+        account = env.context.portfolio.stock_account
+        position = account.get_position("000001.XSHE", POSITION_DIRECTION.LONG)
+        # a view of the book, the same object every time
+        self.assertIs(position, account.get_position("000001.XSHE", POSITION_DIRECTION.LONG))
+        self.assertEqual(position.quantity, account._book.quantity[0, self.order_book_ids.get_loc("000001.XSHE")])
+        self.assertIsInstance(position.quantity, int)
+
+        # a standalone position for the ones not held
+        empty = account.get_position("000002.XSHE", POSITION_DIRECTION.LONG)
+        self.assertEqual(empty.quantity, 0)
+        self.assertFalse(account._book.alive[self.order_book_ids.get_loc("000002.XSHE")])
+
+        env.step(order_target_weights({}, context=env.context))
+        self.assertEqual(len(list(account.get_positions())), 0)
+
+    def test_unknown_order_book_id(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        account = env.context.portfolio.stock_account
+        # an empty position, like the ones not held
+        for position in (account.get_position("999999.XSHE", POSITION_DIRECTION.LONG),
+                         get_position("999999.XSHE", context=env.context)):
+            self.assertEqual(position.quantity, 0)
+        self.assertEqual(account.calc_close_today_amount("999999.XSHE", 100, POSITION_DIRECTION.LONG), 0)
+
+        # it can not be held nor traded
+        with self.assertRaisesRegex(ValueError, "999999.XSHE"):
+            Account("STOCK", 10000, init_positions={"999999.XSHE": 100}, context=env.context)
+        order = Order.__from_create__("999999.XSHE", 100, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN, context=env.context)
+        with self.assertRaisesRegex(ValueError, "999999.XSHE"):
+            env.context.broker.submit_order(order)
+        self.assertEqual(account.frozen_cash, 0)
+
+if __name__ == "__main__":
+    unittest.main()
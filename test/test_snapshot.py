@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+import datetime
+from sharpe.const import SIDE, POSITION_EFFECT, POSITION_DIRECTION
+from sharpe.object.order import Order, MarketOrder
+from sharpe.mod.sys_account.api import order_target_weights
+import unittest
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.target_weights = [
+            {"000001.XSHE": 0.5},
+            {"000001.XSHE": 0.2, "000002.XSHE": 0.3},
+            {"000002.XSHE": 0.6},
+            {},
+            {"000001.XSHE": 0.4},
+        ]
+
+    def _run(self, env, target_weights_list):
+        records = []
+        for target_weights in target_weights_list:
+            state, reward, is_done, info = env.step(order_target_weights(target_weights, context=env.context))
+            records.append((reward, is_done, dict(info), env.context.portfolio.total_value, env.context.portfolio.cash))
+        return records
+
+    @staticmethod
+    def _tracker_records(env):
+        tracker = env.context.tracker
+        # the ids come from process wide generators
+        trades = [{k: v for k, v in trade.items() if k not in ("exec_id", "order_id")} for trade in tracker._trades]
+        return trades, tracker._total_portfolio, tracker._total_forward_portfolio, tracker._portfolio_current_bar_returns
+
+    def test_reset_restores_the_initial_state(self):
+        for mode in ("non-rl", "rl"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            env.reset()
+            expected = self._run(env, self.target_weights)
+            expected_tracker_records = self._tracker_records(env)
+
+            env.reset()
+            self.assertEqual(env.context.portfolio.total_value, 1000000)
+            self.assertEqual(len(env.context.portfolio.get_positions()), 0)
+            self.assertEqual(len(env.context.tracker._trades), 0)
+            self.assertListEqual(self._run(env, self.target_weights), expected)
+            self.assertEqual(self._tracker_records(env), expected_tracker_records)
+
+    def test_restore_within_an_episode(self):
+        for mode in ("non-rl", "rl"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            env.reset()
+            self._run(env, self.target_weights[:2])
+            snapshot = env.snapshot()
+            trading_dt, positions = env.trading_dt, repr(env.context.portfolio.stock_account)
+            expected = self._run(env, self.target_weights[2:])
+            expected_tracker_records = self._tracker_records(env)
+
+            env.restore(snapshot)
+            self.assertEqual(env.trading_dt, trading_dt)
+            self.assertEqual(repr(env.context.portfolio.stock_account), positions)
+            self.assertListEqual(self._run(env, self.target_weights[2:]), expected)
+            self.assertEqual(self._tracker_records(env), expected_tracker_records)
+
+    def test_full_state(self):
+        # 000001.XSHE is held until the end, a dividend keeps an empty position alive
+        target_weights = [{"000001.XSHE": 0.3, "000002.XSHE": 0.3}, {"000001.XSHE": 0.4}, {"000001.XSHE": 0.2}]
+        for mode in ("non-rl", "rl"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            env.reset()
+            self._run(env, self.target_weights[:2])
+            context = env.context
+            position = context.portfolio.stock_account.get_position("000001.XSHE", POSITION_DIRECTION.LONG)
+            position._dividend_receivable = (datetime.date(2020, 3, 1), 12.5)
+            position._pending_transform = ("000002.XSHE", 1.5)
+            matcher = context.broker._get_matcher("000001.XSHE")
+            matcher.set_turnover({"000001.XSHE": 300})
+            decider, = context.get_transaction_cost_deciders()
+            decider.commission_map[123] = 2.5
+            snapshot = env.snapshot()
+            expected_state = (position.dividend_receivable, position._dividend_receivable, position._pending_transform,
+                              matcher.get_turnover(), dict(decider.commission_map), context.portfolio.total_value)
+            expected = self._run(env, target_weights)
+            expected_tracker_records = self._tracker_records(env)
+
+            env.restore(snapshot)
+            self.assertEqual((position.dividend_receivable, position._dividend_receivable, position._pending_transform,
+                              matcher.get_turnover(), dict(decider.commission_map), context.portfolio.total_value), expected_state)
+            self.assertListEqual(self._run(env, target_weights), expected)
+            self.assertEqual(self._tracker_records(env), expected_tracker_records)
+
+            # the buffers can not grow back to a later snapshot
+            later_snapshot = env.snapshot()
+            env.reset()
+            with self.assertRaises(ValueError):
+                env.restore(later_snapshot)
+
+    def test_long_order_book_ids(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, random_seed=111)
+        # longer than any fixed width string field
+        mapping = {order_book_id: order_book_id + "." + "X" * 40 for order_book_id in ("000001.XSHE", "000002.XSHE")}
+        data_source = DataSource(feature_df=feature_df.rename(index=mapping, level=0), price_s=price_s.rename(index=mapping, level=0))
+        env = TradingEnv(data_source=data_source, look_backward_window=2)
+        env.reset()
+        target_weights = [{mapping[k]: v for k, v in weights.items()} for weights in self.target_weights]
+        self._run(env, target_weights[:2])
+        snapshot = env.snapshot()
+        positions = repr(env.context.portfolio.stock_account)
+        expected = self._run(env, target_weights[2:])
+
+        env.restore(snapshot)
+        self.assertEqual(repr(env.context.portfolio.stock_account), positions)
+        self.assertListEqual(self._run(env, target_weights[2:]), expected)
+
+        broker = env.context.broker
+        order = Order.__from_create__(mapping["000002.XSHE"], 200, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN, context=env.context)
+        order.active()
+        broker._delayed_orders.append((env.context.portfolio.stock_account, order))
+        broker.set_snapshot(broker.get_snapshot())
+        (account, restored), = broker._delayed_orders
+        self.assertEqual(restored.order_book_id, mapping["000002.XSHE"])
+
+    def test_broker_open_orders(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        broker = env.context.broker
+        order = Order.__from_create__("000001.XSHE", 200, SIDE.BUY, MarketOrder(), POSITION_EFFECT.OPEN, context=env.context)
+        order.active()
+        broker._delayed_orders.append((env.context.portfolio.stock_account, order))
+        exercise_order = Order.__from_create__("000002.XSHE", 100, SIDE.SELL, MarketOrder(), POSITION_EFFECT.EXERCISE, context=env.context)
+        broker._open_exercise_orders.append((env.context.portfolio.stock_account, exercise_order))
+        snapshot = broker.get_snapshot()
+
+        broker._delayed_orders = []
+        broker._open_exercise_orders = []
+        broker.set_snapshot(snapshot)
+        self.assertEqual(broker._open_orders, [])
+        (account, restored_exercise_order), = broker._open_exercise_orders
+        self.assertEqual(restored_exercise_order.get_snapshot_record(1), exercise_order.get_snapshot_record(1))
+        (account, restored), = broker._delayed_orders
+        self.assertIs(account, env.context.portfolio.stock_account)
+        self.assertEqual(restored.order_book_id, order.order_book_id)
+        self.assertEqual(restored.get_snapshot_record(0), order.get_snapshot_record(0))
+        self.assertEqual(restored.status, order.status)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+from sharpe.mod.sys_account.api import order_target_weights
+from sharpe.core.strategy import Strategy
+import unittest
+
+
+class TestStepMany(unittest.TestCase):
+
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=2, feature_number=3, start="2020-01-01", end="2020-01-20", random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        # (target_weights, n_bars) of a rebalance every few bars
+        self.schedule = [({"000001.XSHE": 0.5}, 3), ({"000001.XSHE": 0.2, "000002.XSHE": 0.3}, 4), ({"000002.XSHE": 0.6}, 2)]
+
+    def _create_env(self, mode):
+        return TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode, obs_format="numpy")
+
+    def test_same_as_bar_by_bar(self):
+        for mode in ("non-rl", "rl"):
+            env = self._create_env(mode)
+            env.reset()
+            expected = []
+            for target_weights, n_bars in self.schedule:
+                rewards, pnl = [], []
+                for i in range(n_bars):
+                    action = order_target_weights(target_weights, context=env.context) if i == 0 else None
+                    state, reward, is_done, info = env.step(action)
+                    rewards.append(reward)
+                    pnl.append(float(info["profit_and_loss"]))
+                # the numpy observation and info record are refilled in place
+                expected.append((state.copy(), np.prod(np.add(rewards, 1)) - 1, is_done, np.sum(pnl), float(info["max_draw_down"]),
+                                 env.context.portfolio.total_value))
+
+            many_env = self._create_env(mode)
+            many_env.reset()
+            for (target_weights, n_bars), expected_step in zip(self.schedule, expected):
+                action = order_target_weights(target_weights, context=many_env.context)
+                state, reward, is_done, info = many_env.step_many(action, n_bars)
+                np.testing.assert_array_equal(state, expected_step[0])
+                self.assertEqual((reward, is_done, float(info["profit_and_loss"]), float(info["max_draw_down"]), many_env.context.portfolio.total_value),
+                                 expected_step[1:])
+            self.assertListEqual(many_env.context.tracker._total_portfolio, env.context.tracker._total_portfolio)
+            self.assertListEqual(many_env.context.tracker._total_forward_portfolio, env.context.tracker._total_forward_portfolio)
+
+    def test_hold_plan(self):
+        for mode in ("non-rl", "rl"):
+            env = self._create_env(mode)
+            env.reset()
+            executor = env._executor
+            owners = [getattr(listener, "__self__", None) for listener, event, n_skip in executor._hold_plan]
+            self.assertFalse(any(owner is env.context.broker or isinstance(owner, Strategy) for owner in owners))
+            self.assertTrue(any(owner is env.context.tracker for owner in owners))
+
+            # only the bar of the action runs the full plan
+            run_bar = executor._run_bar
+            calls = []
+            executor._run_bar = lambda action: calls.append(action) or run_bar(action)
+            env.step_many(order_target_weights({"000001.XSHE": 0.5}, context=env.context), 4)
+            self.assertEqual(len(calls), 1)
+
+    def test_skip_until(self):
+        env = self._create_env("non-rl")
+        env.reset()
+        trading_dts = env.available_trading_dts
+        env.skip_until(trading_dts[3], action=order_target_weights({"000001.XSHE": 0.5}, context=env.context))
+        self.assertEqual(env.trading_dt, trading_dts[3])
+        with self.assertRaises(ValueError):
+            env.skip_until(trading_dts[3])
+
+        # stops at the last bar
+        state, reward, is_done, info = env.step_many(None, len(trading_dts))
+        self.assertTrue(is_done)
+        self.assertEqual(env.trading_dt, trading_dts[-1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+from sharpe.const import POSITION_DIRECTION
+from sharpe.backtest import VectorizedBacktest
+from sharpe.core.context import Context
+import unittest
+
+
+class TestVectorizedBacktest(unittest.TestCase):
+
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=20, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.order_book_ids = self.data_source.get_available_order_book_ids()
+        self.trading_dts = self.data_source.get_available_trading_dts()
+        rng = np.random.RandomState(7)
+        # rebalance every other trading_dt
+        weights = rng.uniform(size=(len(self.trading_dts), len(self.order_book_ids))) * (rng.uniform(size=(len(self.trading_dts), len(self.order_book_ids))) > 0.4)
+        weights = weights / weights.sum(axis=1, keepdims=True) * 0.95
+        self.weights_df = pd.DataFrame(weights, index=self.trading_dts, columns=self.order_book_ids).iloc[::2]
+
+    def test_same_as_trading_env(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=1, min_commission=20)
+        env.reset()
+        expected_positions, is_done = [], False
+        while not is_done:
+            action = self.weights_df.loc[env.trading_dt].to_numpy() if env.trading_dt in self.weights_df.index else None
+            state, reward, is_done, info = env.step(action)
+            positions = pd.Series(0, index=self.order_book_ids)
+            for position in env.context.portfolio.get_positions():
+                if position.direction == POSITION_DIRECTION.LONG:
+                    positions[position.order_book_id] = position.quantity
+            expected_positions.append(positions)
+        expected = pd.DataFrame(env.context.tracker._total_portfolio).set_index("datetime")
+
+        backtest = VectorizedBacktest(self.data_source, self.weights_df, min_commission=20)
+        portfolio_df = backtest.run()
+        np.testing.assert_array_equal(backtest.positions.to_numpy(), np.array(expected_positions))
+        np.testing.assert_allclose(portfolio_df["returns"].to_numpy(), env.context.tracker.bar_returns.to_numpy(), rtol=0, atol=1e-10)
+        np.testing.assert_allclose(portfolio_df["total_value"].to_numpy(), expected["total_value"].to_numpy(), rtol=1e-9)
+        np.testing.assert_allclose(portfolio_df["cash"].to_numpy(), expected["cash"].to_numpy(), rtol=1e-9)
+        fill_batches = env.context.tracker._fill_batches
+        self.assertAlmostEqual(portfolio_df["commission"].sum(), sum(fill_batch.commissions.sum() for fill_batch in fill_batches))
+        self.assertAlmostEqual(portfolio_df["tax"].sum(), sum(fill_batch.taxes.sum() for fill_batch in fill_batches))
+
+    def test_current_context_is_kept(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=1)
+        VectorizedBacktest(self.data_source, self.weights_df).run()
+        self.assertIs(Context.get_instance(), env.context)
+
+    def test_window(self):
+        backtest = VectorizedBacktest(self.data_source, self.weights_df, start_dt=self.trading_dts[3], end_dt=self.trading_dts[8])
+        portfolio_df = backtest.run()
+        self.assertListEqual(list(portfolio_df.index), list(self.trading_dts[3:9]))
+        # nothing is held before the first rebalance
+        self.assertEqual(portfolio_df["total_value"].iloc[0], 1000000)
+        self.assertTrue((backtest.positions.iloc[1] > 0).any())
+
+        with self.assertRaises(ValueError):
+            VectorizedBacktest(self.data_source, self.weights_df, start_dt=self.trading_dts[8], end_dt=self.trading_dts[3])
+
+if __name__ == "__main__":
+    unittest.main()
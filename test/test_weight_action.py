@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+from unittest import mock
+from sharpe.utils.mock_data import create_toy_feature
+from sharpe.data.data_source import DataSource
+from sharpe.environment import TradingEnv
+from sharpe.mod.sys_account.api import order_target_weights, order_target_weights_array
+from sharpe.mod.sys_transaction_cost.deciders import CNStockTransactionCostDecider
+import unittest
+
+
+class TestWeightAction(unittest.TestCase):
+
+    def setUp(self):
+        feature_df, price_s = create_toy_feature(order_book_ids_number=20, feature_number=3, random_seed=111)
+        self.data_source = DataSource(feature_df=feature_df, price_s=price_s)
+        self.order_book_ids = self.data_source.get_available_order_book_ids()
+        rng = np.random.RandomState(7)
+        self.weights = []
+        for _ in range(6):
+            weights = rng.uniform(size=len(self.order_book_ids)) * (rng.uniform(size=len(self.order_book_ids)) > 0.4)
+            self.weights.append(weights / weights.sum() * 0.95)
+
+    def test_same_as_orders(self):
+        for mode in ("non-rl", "rl"):
+            env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            order_env = TradingEnv(data_source=self.data_source, look_backward_window=2, mode=mode)
+            env.reset()
+            order_env.reset()
+            for weights in self.weights:
+                target_weights = {order_book_id: weight for order_book_id, weight in zip(self.order_book_ids, weights) if weight > 0}
+                expected = order_env.step(order_target_weights(target_weights, context=order_env.context))
+                state, reward, is_done, info = env.step(weights)
+                self.assertEqual((reward, is_done, info), expected[1:])
+                self.assertEqual(repr(env.context.portfolio.stock_account), repr(order_env.context.portfolio.stock_account))
+
+            tracker, order_tracker = env.context.tracker, order_env.context.tracker
+            # the ids come from process wide generators
+            strip_ids = lambda trades: [{k: v for k, v in trade.items() if k not in ("exec_id", "order_id")} for trade in trades]
+            self.assertListEqual(strip_ids(tracker._trades), strip_ids(order_tracker._trades))
+            fill_batches = tracker._fill_batches
+            self.assertEqual(sum(len(fill_batch) for fill_batch in fill_batches), len(order_tracker._trades))
+            np.testing.assert_array_equal(np.concatenate([fill_batch.commissions for fill_batch in fill_batches]),
+                                          [trade["commission"] for trade in order_tracker._trades])
+            np.testing.assert_array_equal(np.concatenate([fill_batch.taxes for fill_batch in fill_batches]),
+                                          [trade["tax"] for trade in order_tracker._trades])
+
+    def test_order_target_weights_array(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        env.step(self.weights[0])
+
+        weights = np.zeros(len(self.order_book_ids))
+        weights[:3] = 0.3
+        ordinals, quantities = order_target_weights_array(weights, context=env.context)
+        # the sells come first
+        self.assertTrue((np.diff(quantities > 0) >= 0).all())
+        # the positions without a target weight are closed
+        held = {p.order_book_id: p.quantity for p in env.context.portfolio.get_positions() if p.quantity > 0}
+        for order_book_id, quantity in held.items():
+            if weights[self.order_book_ids.get_loc(order_book_id)] == 0:
+                self.assertIn(-quantity, quantities[self.order_book_ids[ordinals] == order_book_id])
+        self.assertTrue((quantities[quantities > 0] % 100 == 0).all())
+
+        with self.assertRaises(RuntimeError):
+            order_target_weights_array(np.full(len(self.order_book_ids), 0.5), context=env.context)
+        for invalid in (-0.1, np.nan):
+            weights[3] = invalid
+            with self.assertRaises(RuntimeError):
+                order_target_weights_array(weights, context=env.context)
+
+    def test_batch_cash_check(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        account = env.context.portfolio.stock_account
+        prices = env.context.get_last_prices()
+        cash = account.cash
+        # the second buy can not be paid in full, the third one not at all
+        quantity = int(cash * 0.6 / prices[0]) // 100 * 100
+        ordinals = np.array([0, 1, 2])
+        env.context.broker.submit_order_batch(ordinals, np.array([quantity, quantity * 10, 100]))
+        
+        self.assertGreaterEqual(account.cash, 0)
+        fill_batch = env.context.tracker._fill_batches[-1]
+        np.testing.assert_array_equal(fill_batch.ordinals, [0, 1])
+        self.assertEqual(fill_batch.quantities[0], quantity)
+        self.assertEqual(fill_batch.quantities[1] % 100, 0)
+        left = cash - (fill_batch.prices * fill_batch.quantities + fill_batch.transaction_costs).sum()
+        self.assertAlmostEqual(account.cash, left)
+        # one more lot of the scaled down buy would overdraw
+        self.assertLess(left, prices[1] * 100)
+    
+    def test_batch_deciders(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2, min_commission=5)
+        env.reset()
+        env.context.set_transaction_cost_decider("ETF", CNStockTransactionCostDecider(min_commission=50, context=env.context))
+        etf = self.order_book_ids[1]
+        instrument_type = lambda order_book_id: "ETF" if order_book_id == etf else "CS"
+        with mock.patch.object(DataSource, "instrument_type", side_effect=instrument_type):
+            env.context.broker.submit_order_batch(np.array([0, 1, 2]), np.array([100, 100, 100]))
+        
+        # one batch per matcher(instrument type), priced by its own decider
+        commissions = {}
+        for fill_batch in env.context.tracker._fill_batches:
+            commissions.update(zip(fill_batch.order_book_ids, fill_batch.commissions.tolist()))
+        self.assertEqual(commissions, {self.order_book_ids[0]: 5, etf: 50, self.order_book_ids[2]: 5})
+    
+    def test_batch_not_matched_immediately(self):
+        env = TradingEnv(data_source=self.data_source, look_backward_window=2)
+        env.reset()
+        broker, account = env.context.broker, env.context.portfolio.stock_account
+        broker._match_immediately = False
+        env.context.broker.submit_order_batch(np.array([0, 1]), np.array([100, 200]))
+        
+        # submitted as market orders, their cash is frozen until they are matched
+        orders = broker.get_open_orders()
+        self.assertListEqual([(order.order_book_id, order.quantity) for order in orders],
+                             [(self.order_book_ids[0], 100), (self.order_book_ids[1], 200)])
+        self.assertGreater(account.frozen_cash, 0)
+        
+        env.step(None)
+        self.assertListEqual(broker.get_open_orders(), [])
+        self.assertAlmostEqual(account.frozen_cash, 0)
+        self.assertEqual(account.get_position(self.order_book_ids[1], "LONG").quantity, 200)
+
+if __name__ == "__main__":
+    unittest.main()